@@ -1,7 +1,8 @@
 from acquisition_nagios.nagios.models import NagiosPerformance, \
     NagiosOutputCode, NagiosRange, NagiosResult, NagiosVerbose
-from typing import List
+from typing import List, Optional
 from dataclasses import dataclass
+from datetime import datetime
 
 
 @dataclass
@@ -15,7 +16,9 @@ def assemble_message(
     state: NagiosOutputCode,
     percentage: float,
     performances: List[NagiosPerformance],
-    details: str
+    details: str,
+    stale_since: Optional[datetime] = None,
+    unevaluated: int = 0
 ) -> NagiosResult:
     '''
     Assembles the message to feet to Nagios to display in Nagios for this
@@ -31,6 +34,14 @@ def assemble_message(
         The percentage of channels that have successfully streamed to the
         aquisition server during the time period
 
+    stale_since: Optional[datetime]
+        When the results were computed from a cached response because the
+        aquisition server could not be queried, the time that response was
+        retrieved
+
+    unevaluated: int
+        The number of channels not evaluated before the deadline of the check
+
     Returns
     -------
     str: The assembled status message with performance data to display in
@@ -50,6 +61,14 @@ def assemble_message(
     percent = '%.2f' % percentage
     info = f'{statetxt}: {percent}% of expected channels available. '
 
+    if stale_since is not None:
+        age = int((datetime.now() - stale_since).total_seconds())
+        info += ('STALE: using data retrieved at ' +
+                 f'{stale_since.strftime("%Y-%m-%d %H:%M:%S")}, {age}s ago. ')
+
+    if unevaluated > 0:
+        info += f'DEADLINE: {unevaluated} channels not evaluated. '
+
     result = NagiosResult(
         summary=info,
         verbose=NagiosVerbose.multiline,
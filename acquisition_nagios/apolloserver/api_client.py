@@ -0,0 +1,383 @@
+'''
+Shared HTTP client used for all traffic to the ApolloServer API
+
+A single pooled session keeps connections to the ApolloServer alive between
+queries, so the many latency queries of a check reuse a handful of TCP
+connections instead of opening a new one per request. Requests are retried
+and circuit broken as configured, see the resilience module.
+
+Responses are requested compressed and decoded as they are read. The bytes
+received and decoded are accounted per endpoint to measure the savings.
+'''
+from dataclasses import dataclass
+import logging
+import threading
+from typing import Callable, Dict, Iterator, Optional, Tuple, TypeVar
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from acquisition_nagios.deadline import Deadline
+from acquisition_nagios.apolloserver.resilience import CircuitBreaker, \
+    RetryPolicy
+
+
+T = TypeVar('T')
+
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_POOL_SIZE = 10
+
+# Encodings urllib3 decodes without optional dependencies
+ACCEPT_ENCODING = 'gzip, deflate'
+
+
+@dataclass
+class ConnectionStatistics:
+    requests: int
+    connections: int
+
+    @property
+    def reused(self) -> int:
+        return self.requests - self.connections
+
+    def __str__(self):
+        return (f"{self.requests} requests over {self.connections} " +
+                f"connections ({self.reused} reused)")
+
+
+@dataclass
+class TransferStatistics:
+    responses: int = 0
+    # Bytes of response bodies as received, before decompression
+    wire_bytes: int = 0
+    # Bytes of response bodies after decompression
+    decoded_bytes: int = 0
+
+    @property
+    def saved(self) -> int:
+        return self.decoded_bytes - self.wire_bytes
+
+    def add(
+        self,
+        other: 'TransferStatistics'
+    ) -> None:
+        self.responses += other.responses
+        self.wire_bytes += other.wire_bytes
+        self.decoded_bytes += other.decoded_bytes
+
+    def __str__(self):
+        return (f"{self.responses} responses, {self.wire_bytes} bytes " +
+                f"received for {self.decoded_bytes} decoded " +
+                f"({self.saved} saved)")
+
+
+def _wire_bytes(
+    response: requests.Response,
+    decoded_bytes: int
+) -> int:
+    '''
+    Bytes of the body read from the connection, before decompression
+    '''
+    raw = response.raw
+    if raw is None or not hasattr(raw, 'tell'):
+        return decoded_bytes
+    return raw.tell()
+
+
+class ApolloSession(object):
+    '''
+    Pooled keep-alive session for querying the ApolloServer API
+    '''
+    def __init__(
+        self,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        retry: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        compression: bool = True
+    ):
+        '''
+        Parameters
+        ----------
+        connect_timeout: float
+            Seconds to wait for a connection to the ApolloServer
+
+        read_timeout: float
+            Seconds to wait between bytes of a response from the ApolloServer
+
+        pool_size: int
+            Maximum number of connections kept alive per ApolloServer
+
+        retry: Optional[RetryPolicy]
+            How transient errors are retried, not at all if None
+
+        breaker: Optional[CircuitBreaker]
+            Short-circuits requests to servers that keep failing, never if
+            None
+
+        compression: bool
+            Ask for gzip or deflate compressed responses
+        '''
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self.retry = retry if retry is not None else RetryPolicy(retries=0)
+        self.breaker = breaker
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.session.headers['Accept-Encoding'] = \
+            ACCEPT_ENCODING if compression else 'identity'
+        self._transfers: Dict[str, TransferStatistics] = {}
+        self._transfers_lock = threading.Lock()
+
+    def get(
+        self,
+        url: str,
+        deadline: Optional[Deadline] = None
+    ) -> requests.Response:
+        '''
+        Send a GET request through the pooled session
+
+        Parameters
+        ----------
+        url: str
+            The url to query
+
+        deadline: Optional[Deadline]
+            The time budget of the check, the timeouts are clipped to the
+            time it has left
+
+        Raises
+        ------
+        HTTPError: If the response has an error status code
+
+        CircuitOpenError: If the ApolloServer is considered down
+
+        DeadlineExceeded: If the deadline has passed
+        '''
+        def request() -> requests.Response:
+            response = self._send(url, stream=False, deadline=deadline)
+            decoded_bytes = len(response.content)
+            self.record_transfer(
+                url, _wire_bytes(response, decoded_bytes), decoded_bytes)
+            return response
+
+        return self._call(url, request, deadline)
+
+    def stream(
+        self,
+        url: str,
+        consume: Callable[[Iterator[bytes]], T],
+        chunk_size: int,
+        deadline: Optional[Deadline] = None
+    ) -> T:
+        '''
+        Send a GET request and pass its decompressed body to consume in
+        chunks, while it is received
+
+        The body is read within the retried and circuit broken request, so
+        an error while receiving it, such as the connection dropping or
+        timing out, is retried and counts against the ApolloServer like an
+        error of the request itself.
+
+        Parameters
+        ----------
+        url: str
+            The url to query
+
+        consume: Callable[[Iterator[bytes]], T]
+            Reads the chunks of the body and returns the result of the
+            request. Called again with a new response when retried
+
+        chunk_size: int
+            Bytes read from the connection at a time
+
+        deadline: Optional[Deadline]
+            The time budget of the check, the response is abandoned if it is
+            still being received when it passes
+
+        Raises
+        ------
+        HTTPError: If the response has an error status code
+
+        CircuitOpenError: If the ApolloServer is considered down
+
+        DeadlineExceeded: If the deadline passes before the response is
+            received
+        '''
+        def request() -> T:
+            with self._send(url, stream=True, deadline=deadline) as response:
+                chunks = self.iter_content(url, response, chunk_size)
+                if deadline is not None:
+                    chunks = deadline.iterate(chunks, f"reading {url}")
+                return consume(chunks)
+
+        return self._call(url, request, deadline)
+
+    def _send(
+        self,
+        url: str,
+        stream: bool,
+        deadline: Optional[Deadline]
+    ) -> requests.Response:
+        '''
+        Send a single GET request, raising on an error status code
+        '''
+        timeout = self.timeout
+        if deadline is not None:
+            deadline.check(f"querying {url}")
+            timeout = deadline.request_timeout(timeout)
+        response = self.session.get(url, timeout=timeout, stream=stream)
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            response.close()
+            raise
+        return response
+
+    def _call(
+        self,
+        url: str,
+        request: Callable[[], T],
+        deadline: Optional[Deadline]
+    ) -> T:
+        '''
+        Call the request with retries, through the circuit breaker of its
+        ApolloServer
+        '''
+        if self.breaker is None:
+            return self.retry.call(request, deadline=deadline)
+
+        with self.breaker.guard(urlsplit(url).netloc):
+            return self.retry.call(request, deadline=deadline)
+
+    def iter_content(
+        self,
+        url: str,
+        response: requests.Response,
+        chunk_size: int
+    ) -> Iterator[bytes]:
+        '''
+        Read the decompressed body of a streamed response in chunks,
+        accounting its transfer once it is consumed or abandoned
+        '''
+        decoded_bytes = 0
+        try:
+            for chunk in response.iter_content(chunk_size):
+                decoded_bytes += len(chunk)
+                yield chunk
+        finally:
+            self.record_transfer(
+                url, _wire_bytes(response, decoded_bytes), decoded_bytes)
+
+    def record_transfer(
+        self,
+        url: str,
+        wire_bytes: int,
+        decoded_bytes: int
+    ) -> None:
+        '''
+        Account a response body against the endpoint of the url
+        '''
+        parts = urlsplit(url)
+        endpoint = parts.netloc + parts.path
+        with self._transfers_lock:
+            self._transfers.setdefault(endpoint, TransferStatistics()).add(
+                TransferStatistics(1, wire_bytes, decoded_bytes))
+
+    def transfer_statistics(
+        self,
+        server: Optional[str] = None
+    ) -> Dict[str, TransferStatistics]:
+        '''
+        Bytes received and decoded per endpoint, as host:port/path
+
+        Parameters
+        ----------
+        server: Optional[str]
+            Only include the endpoints of this host:port
+        '''
+        with self._transfers_lock:
+            return {endpoint: TransferStatistics(
+                        transfer.responses, transfer.wire_bytes,
+                        transfer.decoded_bytes)
+                    for endpoint, transfer in self._transfers.items()
+                    if server is None or
+                    endpoint.startswith(server + '/')}
+
+    def transfer_total(
+        self,
+        server: Optional[str] = None
+    ) -> TransferStatistics:
+        '''
+        Bytes received and decoded over all endpoints, or those of a
+        host:port
+        '''
+        total = TransferStatistics()
+        for transfer in self.transfer_statistics(server).values():
+            total.add(transfer)
+        return total
+
+    def statistics(self) -> Dict[str, ConnectionStatistics]:
+        '''
+        Number of requests and connections opened per ApolloServer, used to
+        confirm that connections are reused
+        '''
+        pools = self.adapter.poolmanager.pools
+        statistics: Dict[str, ConnectionStatistics] = {}
+        for key in pools.keys():
+            pool = pools[key]
+            statistics[f"{pool.host}:{pool.port}"] = ConnectionStatistics(
+                requests=pool.num_requests,
+                connections=pool.num_connections)
+        return statistics
+
+    def log_statistics(self) -> None:
+        for server, statistics in self.statistics().items():
+            logging.debug(f"Connections to {server}: {statistics}")
+        for endpoint, transfer in self.transfer_statistics().items():
+            logging.debug(f"Transfer from {endpoint}: {transfer}")
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_default_session: Optional[ApolloSession] = None
+
+
+def get_default_session() -> ApolloSession:
+    '''
+    Returns the session shared by all ApolloServer queries of this process,
+    creating it with default settings if it was not configured
+    '''
+    global _default_session
+    if _default_session is None:
+        _default_session = ApolloSession()
+    return _default_session
+
+
+def configure_default_session(
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    read_timeout: float = DEFAULT_READ_TIMEOUT,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    retry: Optional[RetryPolicy] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    compression: bool = True
+) -> ApolloSession:
+    '''
+    Replace the shared session with one using the provided settings
+    '''
+    global _default_session
+    if _default_session is not None:
+        _default_session.close()
+    _default_session = ApolloSession(
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        pool_size=pool_size,
+        retry=retry,
+        breaker=breaker,
+        compression=compression)
+    return _default_session
@@ -0,0 +1,430 @@
+'''
+Availability and latency check of one or many ApolloServers, producing a
+Nagios result per server
+'''
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+import requests
+from acquisition_nagios import acquisition_availability
+from acquisition_nagios.channel_mask import compile_channel_selection, \
+    load_channel_mask
+from acquisition_nagios.apolloserver import availability_health
+from acquisition_nagios.apolloserver import incremental
+from acquisition_nagios.apolloserver import response_cache
+from acquisition_nagios.apolloserver.api_client import ApolloSession
+from acquisition_nagios.apolloserver.schemas import ApolloSchemaError
+from acquisition_nagios.deadline import Deadline, DeadlineExceeded
+from acquisition_nagios.nagios.models import NagiosOutputCode, \
+    NagiosPerformance, NagiosResult, NagiosVerbose
+
+
+DEFAULT_PORT = '8787'
+
+# Errors of an unreachable or misbehaving server, logged without a traceback
+SERVER_ERRORS = (requests.RequestException, OSError, DeadlineExceeded,
+                 ApolloSchemaError, ValueError)
+
+
+@dataclass
+class ApolloServer:
+    server_url: str
+    port: str = DEFAULT_PORT
+    # Overrides the expected channel count of the check options
+    expected_channels: Optional[int] = None
+
+    def __str__(self):
+        return f"{self.server_url}:{self.port}"
+
+
+@dataclass
+class ApolloCheckOptions:
+    # Used for the servers that do not have their own expected channel count
+    expected_channels: Optional[int]
+    warning: str
+    critical: str
+    warning_time: str
+    critical_time: str
+    warning_count: str
+    critical_count: str
+    batch_size: int = availability_health.DEFAULT_BATCH_SIZE
+    concurrency: int = 1
+    stream: bool = False
+    # Decode responses with the typed schemas, see the schemas module
+    typed: bool = False
+    cache_dir: Optional[str] = None
+    cache_ttl: float = response_cache.DEFAULT_TTL
+    cache_bucket: int = response_cache.DEFAULT_BUCKET
+    stale_while_revalidate: bool = False
+    max_stale: float = response_cache.DEFAULT_MAX_STALE
+    state_dir: Optional[str] = None
+    overlap: float = incremental.DEFAULT_OVERLAP.total_seconds()
+    # How channels not evaluated before the deadline count, see
+    # availability_health.get_latency_threshold_state
+    deadline_state: NagiosOutputCode = NagiosOutputCode.unknown
+    # How channels whose latency query failed count, as for deadline_state
+    failed_state: NagiosOutputCode = NagiosOutputCode.critical
+    # Report the bytes received and decoded from the server as perfdata
+    transfer_perfdata: bool = False
+    # Channels to ignore, see the channel_mask module
+    mask_file: Optional[str] = None
+    # Channels to check, see channel_mask.ChannelSelection. All if None
+    channels: Optional[str] = None
+
+
+def parse_server(
+    server: str
+) -> ApolloServer:
+    '''
+    Parse a server specification of the form host[:port][=expected_channels]
+
+    Raises
+    ------
+    ValueError: If the port or expected channel count is not a number
+    '''
+    specification = server
+    expected_channels: Optional[int] = None
+    if '=' in server:
+        server, expected = server.split('=', 1)
+        if not expected.isdigit():
+            raise ValueError(
+                f"Invalid expected channel count {expected!r} in " +
+                f"{specification}")
+        expected_channels = int(expected)
+
+    port = DEFAULT_PORT
+    if ':' in server:
+        server, port = server.rsplit(':', 1)
+        if not port.isdigit():
+            raise ValueError(f"Invalid port {port!r} in {specification}")
+
+    return ApolloServer(
+        server_url=server,
+        port=port,
+        expected_channels=expected_channels)
+
+
+def get_channel_filter(
+    options: ApolloCheckOptions
+) -> Optional[Callable[[str], bool]]:
+    '''
+    Get the predicate keeping the selected channels that are not masked
+
+    Returns
+    -------
+    Optional[Callable[[str], bool]]: The predicate, None if every channel is
+    kept
+    '''
+    if options.channels is None and options.mask_file is None:
+        return None
+
+    selection = None
+    if options.channels is not None:
+        selection = compile_channel_selection(options.channels)
+    mask = None
+    if options.mask_file is not None:
+        mask = load_channel_mask(options.mask_file)
+
+    def channel_filter(channel: str) -> bool:
+        return (selection is None or channel in selection) and \
+            (mask is None or channel not in mask)
+
+    return channel_filter
+
+
+def latency_cache_key(
+    url: str
+) -> str:
+    '''
+    The cache key of the latencies measured along with the availability
+    response of a url
+    '''
+    return f"{url}#latencies"
+
+
+def check_apollo_server(
+    server: ApolloServer,
+    options: ApolloCheckOptions,
+    session: ApolloSession,
+    deadline: Optional[Deadline] = None
+) -> NagiosResult:
+    '''
+    Check the availability and latency of the channels of an ApolloServer
+
+    Parameters
+    ----------
+    server: ApolloServer
+        The ApolloServer to check
+
+    options: ApolloCheckOptions
+        The thresholds and query options of the check
+
+    session: ApolloSession
+        The session to query the ApolloServer with
+
+    deadline: Optional[Deadline]
+        The time budget of the check. The latency of the channels not queried
+        before it passes is reported as not evaluated
+
+    Returns
+    -------
+    NagiosResult: The result of the check
+
+    Raises
+    ------
+    DeadlineExceeded: If the availability could not be retrieved before the
+    deadline
+
+    ValueError: If neither the server nor the options give the expected
+    channel count
+    '''
+    # Checked before querying the server
+    expected_channels = server.expected_channels \
+        if server.expected_channels is not None \
+        else options.expected_channels
+    if expected_channels is None:
+        raise ValueError(f"No expected channel count for {server}")
+
+    # Get the current time to use as the end_time of the availability query
+    # and to compare timestamps to for latency values
+    end_time = datetime.now()
+    stale_since: Optional[datetime] = None
+
+    # Snap the query window so that checks within the same bucket share
+    # a cache entry
+    if options.cache_dir is not None:
+        end_time = response_cache.snap_to_bucket(
+            end_time, options.cache_bucket)
+
+    start_time = end_time - timedelta(hours=1)
+    cursor: Optional[incremental.AvailabilityCursor] = None
+
+    # Only query the time since the previous check if its state is available
+    if options.state_dir is not None:
+        state_file = incremental.cursor_path(
+            options.state_dir, server.server_url, server.port)
+        cursor = incremental.load_cursor(state_file)
+        start_time, is_incremental = incremental.get_query_start(
+            cursor=cursor,
+            end_time=end_time,
+            overlap=timedelta(seconds=options.overlap))
+        logging.debug(f"{server}: Incremental query: {is_incremental}")
+
+    url = availability_health.assemble_availability_url(
+        server.server_url, start_time, end_time, port=server.port)
+    logging.debug(f"API URL: {url}")
+
+    cache: Optional[response_cache.ResponseCache] = None
+    if options.cache_dir is not None:
+        cache = response_cache.ResponseCache(
+            cache_dir=options.cache_dir,
+            ttl=options.cache_ttl,
+            stale_while_revalidate=options.stale_while_revalidate,
+            max_stale=options.max_stale
+        )
+        cached = cache.get(url, lambda: availability_health.get_availability(
+            url, session=session, stream=options.stream, typed=options.typed,
+            deadline=deadline))
+        availability = cached.payload
+        if cached.stale:
+            stale_since = cached.fetched_time
+    else:
+        availability = availability_health.get_availability(
+            url, session=session, stream=options.stream, typed=options.typed,
+            deadline=deadline)
+
+    # Merge the queried slice into the state of the previous check
+    if options.state_dir is not None:
+        availability, cursor = incremental.merge_availability(
+            cursor=cursor,
+            availability=availability,
+            end_time=end_time)
+        if stale_since is None:
+            incremental.save_cursor(state_file, cursor)
+
+    # The ApolloServer did not answer, so the latencies measured by the last
+    # check are reported instead of querying it again
+    cached_latencies: Optional[Dict[str, float]] = None
+    if cache is not None and stale_since is not None:
+        cached_latencies = {}
+        latency_entry = cache.load(latency_cache_key(url))
+        if latency_entry is not None:
+            cached_latencies = latency_entry.payload
+
+    # Leave channels that are not selected or masked out before querying
+    # their latency
+    channel_filter = get_channel_filter(options)
+
+    # Get the channel_latency objects and list of unavailable channels
+    acquisition_statistics = \
+        availability_health.get_channel_availability(
+            availability=availability,
+            end_time=end_time,
+            server_url=server.server_url,
+            batch_size=options.batch_size,
+            session=session,
+            concurrency=options.concurrency,
+            port=server.port,
+            deadline=deadline,
+            typed=options.typed,
+            channel_filter=channel_filter,
+            cached_latencies=cached_latencies)
+
+    if cache is not None and stale_since is None:
+        try:
+            cache.store(latency_cache_key(url), {
+                stats.channel: stats.latency
+                for stats in acquisition_statistics.channel_latency})
+        except OSError as e:
+            logging.warning(f"{server}: Could not cache latencies: {e}")
+
+    unevaluated = len(acquisition_statistics.unevaluated_channels)
+
+    # Calculate percentage of channels that are available. Channels whose
+    # latency query failed or was not made still have availability
+    percent = acquisition_statistics.to_columnar().availability_percentage(
+        expected_channel_count=expected_channels,
+        failed=len(acquisition_statistics.failed_channels),
+        unevaluated=unevaluated)
+
+    logging.debug(f"{server}: Available channels: {percent}%")
+    logging.debug(f"{server}: Unvailable Channels: " +
+                  ', '.join(acquisition_statistics.unavailable_channels))
+
+    # Determine the state according to the percentage of available channels
+    state = acquisition_availability.get_state(
+        percentage=percent,
+        warn_threshold=options.warning,
+        crit_threshold=options.critical)
+
+    # Determine the state accoding to the latency thresholds
+    latency_results = availability_health.get_latency_threshold_state(
+        acquisition_statistics,
+        warn_time=options.warning_time,
+        crit_time=options.critical_time,
+        warn_threshold=options.warning_count,
+        crit_threshold=options.critical_count,
+        unevaluated_state=options.deadline_state,
+        failed_state=options.failed_state
+        )
+
+    # If the latency threshold state is higher than the available channel
+    # state, overwrite it
+    if latency_results.state > state:
+        state = latency_results.state
+
+    performances: List[NagiosPerformance] = []
+
+    performances.append(NagiosPerformance(
+        label='available',
+        value=percent,
+        uom='%',
+        warning=float(options.warning.strip(':')),
+        critical=float(options.critical.strip(':'))
+    ))
+    performances.append(NagiosPerformance(
+        label='critical_count',
+        value=latency_results.crit_count,
+        critical=float(options.critical_count)
+    ))
+    performances.append(NagiosPerformance(
+        label='warning_count',
+        value=latency_results.warn_count,
+        warning=float(options.warning_count)
+    ))
+    if deadline is not None and deadline.is_set:
+        performances.append(NagiosPerformance(
+            label='unevaluated',
+            value=unevaluated
+        ))
+    if stale_since is not None:
+        performances.append(NagiosPerformance(
+            label='stale_age',
+            value=int((datetime.now() - stale_since).total_seconds()),
+            uom='s'
+        ))
+    if options.transfer_perfdata:
+        transfer = session.transfer_total(str(server))
+        performances.append(NagiosPerformance(
+            label='wire_bytes',
+            value=transfer.wire_bytes,
+            uom='B'
+        ))
+        performances.append(NagiosPerformance(
+            label='decoded_bytes',
+            value=transfer.decoded_bytes,
+            uom='B'
+        ))
+
+    details = availability_health.assemble_details(
+        acquisition_statistics=acquisition_statistics,
+        warning_time=options.warning_time,
+        critical_time=options.critical_time
+    )
+
+    return acquisition_availability.assemble_message(
+        state=state,
+        percentage=percent,
+        performances=performances,
+        details=details,
+        stale_since=stale_since,
+        unevaluated=unevaluated
+        )
+
+
+def check_apollo_servers(
+    servers: List[ApolloServer],
+    options: ApolloCheckOptions,
+    session: ApolloSession,
+    max_workers: Optional[int] = None,
+    deadline: Optional[Deadline] = None
+) -> List[Tuple[ApolloServer, NagiosResult]]:
+    '''
+    Check several ApolloServers concurrently
+
+    A server that can not be checked gets an UNKNOWN result rather than
+    preventing the other servers from being reported.
+
+    Parameters
+    ----------
+    servers: List[ApolloServer]
+        The ApolloServers to check
+
+    options: ApolloCheckOptions
+        The thresholds and query options shared by all checks
+
+    session: ApolloSession
+        The session to query the ApolloServers with
+
+    max_workers: Optional[int]
+        The number of servers checked at the same time, all of them by default
+
+    deadline: Optional[Deadline]
+        The time budget shared by all checks
+
+    Returns
+    -------
+    List[Tuple[ApolloServer, NagiosResult]]: The result of each server, in
+    the order provided
+    '''
+    def check(server: ApolloServer) -> NagiosResult:
+        try:
+            return check_apollo_server(
+                server, options, session, deadline=deadline)
+        except Exception as e:
+            if isinstance(e, SERVER_ERRORS):
+                logging.error(f"Could not check {server}: {e}")
+            else:
+                logging.exception(f"Could not check {server}")
+            return NagiosResult(
+                summary=f'UNKNOWN: Could not check {server}: {e}',
+                verbose=NagiosVerbose.multiline,
+                status=NagiosOutputCode.unknown)
+
+    with ThreadPoolExecutor(
+            max_workers=max_workers or max(len(servers), 1)) as executor:
+        results = list(executor.map(check, servers))
+
+    return list(zip(servers, results))
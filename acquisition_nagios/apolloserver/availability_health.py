@@ -2,13 +2,25 @@
 Module with functions for interacting with and parsing the output of the
 ApolloServer Availability API
 '''
-from dataclasses import dataclass
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+import asyncio
 import logging
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
-from acquisition_nagios.nagios.models import NagiosOutputCode, NagiosRange
 from acquisition_nagios.acquisition_availability import LatencyCheckResults
+from acquisition_nagios.timestamps import parse_apollo_timestamps
+from acquisition_nagios.channel_statistics import ColumnarStatistics
+from acquisition_nagios.deadline import Deadline, DeadlineExceeded
+from acquisition_nagios.nagios.models import NagiosOutputCode
+from acquisition_nagios.apolloserver.api_client import ApolloSession, \
+    get_default_session
+from acquisition_nagios.apolloserver.availability_stream import \
+    parse_availability_stream
+from acquisition_nagios.apolloserver import schemas
+from acquisition_nagios.apolloserver.schemas import ApolloSchemaError, \
+    IntervalLatency
 
 
 @dataclass
@@ -28,12 +40,30 @@ class ChannelLatency:
 class AcquisionStatistics:
     channel_latency: List[ChannelLatency]
     unavailable_channels: List[str]
+    # Channels with availability but whose latency could not be retrieved,
+    # with the reason
+    failed_channels: Dict[str, str] = field(default_factory=dict)
+    # Channels with availability whose latency was not queried before the
+    # deadline
+    unevaluated_channels: List[str] = field(default_factory=list)
+
+    def to_columnar(self) -> ColumnarStatistics:
+        return ColumnarStatistics.from_channel_latency(
+            self.channel_latency, self.unavailable_channels)
+
+
+# Default maximum number of SNCLs sent in a single arrival metrics query.
+# Keeps the query string well below common server URL length limits.
+DEFAULT_BATCH_SIZE = 50
 
 
 def get_latency(
     end_time: datetime,
     server_url: str,
-    sncl: str
+    sncl: str,
+    session: Optional[ApolloSession] = None,
+    port: str = '8787',
+    deadline: Optional[Deadline] = None
 ) -> float:
     '''
     Determine a latency value based on the two provided timestamps
@@ -56,17 +86,306 @@ def get_latency(
         server_url=server_url,
         start_time=start_time,
         end_time=end_time,
-        sncl=sncl
+        sncl=sncl,
+        port=port
+    )
+
+    latency_json = get_api_json(
+        query_url=api_url,
+        session=session,
+        deadline=deadline
+    )
+
+    latencies = schemas.intervals_from_json(latency_json)
+
+    if len(latencies) == 0:
+        raise ApolloSchemaError(
+            "Expected at least one channel - at `$.availability`")
+
+    return latencies[0].average
+
+
+def get_batch_latency(
+    end_time: datetime,
+    server_url: str,
+    sncls: List[str],
+    session: Optional[ApolloSession] = None,
+    port: str = '8787',
+    deadline: Optional[Deadline] = None,
+    typed: bool = False
+) -> Dict[str, float]:
+    '''
+    Get the average arrival latency of several channels sharing the same end
+    time using a single request to the ApolloServer
+
+    Parameters
+    ----------
+    end_time: datetime
+        The end of the one minute window to query arrival metrics for
+
+    server_url: str
+        The IP address or hostname for the ApolloServer to query
+
+    sncls: List[str]
+        The channels to query, in the format NN.SSSSS.LL.CCC
+
+    session: Optional[ApolloSession]
+        The session to send the request with, the shared session by default
+
+    port: str
+        The port of the ApolloServer API
+
+    deadline: Optional[Deadline]
+        The time budget of the check
+
+    typed: bool
+        Decode the response with the typed schema of arrival intervals
+
+    Returns
+    -------
+    Dict[str, float]: The average latency in seconds, keyed by channel
+
+    Raises
+    ------
+    KeyError: If the response does not contain latency for every requested
+    channel
+
+    ApolloSchemaError: If the response does not follow the schema
+
+    DeadlineExceeded: If the deadline has passed
+    '''
+    start_time = end_time - timedelta(minutes=1)
+
+    api_url = assemble_arrival_url(
+        server_url=server_url,
+        start_time=start_time,
+        end_time=end_time,
+        sncl=','.join(sncls),
+        port=port
     )
 
+    if typed:
+        return match_latencies(
+            latencies=schemas.decode_intervals(get_api_body(
+                query_url=api_url,
+                session=session,
+                deadline=deadline
+            )),
+            sncls=sncls
+        )
+
     latency_json = get_api_json(
-        query_url=api_url
+        query_url=api_url,
+        session=session,
+        deadline=deadline
+    )
+
+    return split_batch_latency(
+        latency_json=latency_json,
+        sncls=sncls
+    )
+
+
+def split_batch_latency(
+    latency_json: Dict,
+    sncls: List[str]
+) -> Dict[str, float]:
+    '''
+    Split the response of a multi-channel arrival metrics query back into
+    per-channel latency values
+
+    Entries are matched by their id when the server provides one, otherwise
+    by their position in the query.
+
+    Parameters
+    ----------
+    latency_json: Dict
+        The json-formatted response of the arrival metrics query
+
+    sncls: List[str]
+        The channels that were queried, in query order
+
+    Returns
+    -------
+    Dict[str, float]: The average latency in seconds, keyed by channel
+
+    Raises
+    ------
+    KeyError: If the response does not contain latency for every requested
+    channel
+
+    ApolloSchemaError: If the response does not follow the schema
+    '''
+    return match_latencies(
+        latencies=schemas.intervals_from_json(latency_json),
+        sncls=sncls
     )
 
-    latency = float(
-        latency_json['availability'][0]['intervals'][0]['latency']['average'])
 
-    return latency
+def match_latencies(
+    latencies: List[IntervalLatency],
+    sncls: List[str]
+) -> Dict[str, float]:
+    '''
+    Match the latency entries of a multi-channel arrival metrics query with
+    the queried channels, by id or else by position
+
+    Raises
+    ------
+    KeyError: If there is no latency for every requested channel
+    '''
+    matched: Dict[str, float] = {}
+
+    for index, entry in enumerate(latencies):
+        sncl = entry.id if entry.id is not None else \
+            sncls[index] if index < len(sncls) else None
+        if sncl is None:
+            continue
+        matched[sncl] = entry.average
+
+    missing = [sncl for sncl in sncls if sncl not in matched]
+    if len(missing) > 0:
+        raise KeyError(f"No latency returned for channels: {missing}")
+
+    return matched
+
+
+def group_latency_queries(
+    last_times: List[Tuple[str, datetime]],
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> List[Tuple[datetime, List[str]]]:
+    '''
+    Group channels whose arrival metrics can be retrieved with the same query
+
+    The arrival URL only has a resolution of one second, so channels whose
+    last timestamp falls within the same second share a query window.
+
+    Parameters
+    ----------
+    last_times: List[Tuple[str, datetime]]
+        The channel names and the timestamp of their last received data
+
+    batch_size: int
+        The maximum number of channels to include in a single query
+
+    Returns
+    -------
+    List[Tuple[datetime, List[str]]]: The end time and channel list of each
+    query to make
+    '''
+    if batch_size < 1:
+        raise ValueError(f"Invalid batch size {batch_size}")
+
+    windows: Dict[datetime, List[str]] = {}
+
+    for sncl, last_time in last_times:
+        windows.setdefault(
+            last_time.replace(microsecond=0), []).append(sncl)
+
+    batches: List[Tuple[datetime, List[str]]] = []
+
+    for window_end, sncls in windows.items():
+        for index in range(0, len(sncls), batch_size):
+            batches.append((window_end, sncls[index:index + batch_size]))
+
+    return batches
+
+
+async def fetch_batch_latencies(
+    batches: List[Tuple[datetime, List[str]]],
+    server_url: str,
+    concurrency: int,
+    session: Optional[ApolloSession] = None,
+    port: str = '8787',
+    deadline: Optional[Deadline] = None,
+    typed: bool = False
+) -> Tuple[Dict[str, float], Dict[str, str], List[str]]:
+    '''
+    Run the latency queries of several batches in parallel
+
+    A batch that fails is queried again one channel at a time, so that an
+    error is only attributed to the channels that caused it.
+
+    Parameters
+    ----------
+    batches: List[Tuple[datetime, List[str]]]
+        The end time and channel list of each query, see
+        group_latency_queries
+
+    server_url: str
+        The IP address or hostname for the ApolloServer to query
+
+    concurrency: int
+        The maximum number of queries in progress at the same time
+
+    session: Optional[ApolloSession]
+        The session to send the requests with, the shared session by default
+
+    port: str
+        The port of the ApolloServer API
+
+    deadline: Optional[Deadline]
+        The time budget of the check. Queries are no longer started once it
+        has passed
+
+    typed: bool
+        Decode the responses with the typed schema of arrival intervals
+
+    Returns
+    -------
+    Dict[str, float]: The average latency in seconds, keyed by channel
+
+    Dict[str, str]: The error encountered, keyed by channel
+
+    List[str]: The channels not queried before the deadline
+    '''
+    if concurrency < 1:
+        raise ValueError(f"Invalid concurrency {concurrency}")
+
+    budget = deadline if deadline is not None else Deadline()
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: Dict[str, float] = {}
+    errors: Dict[str, str] = {}
+    unevaluated: List[str] = []
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        async def fetch(window_end: datetime, sncls: List[str]):
+            async with semaphore:
+                return await loop.run_in_executor(executor, partial(
+                    get_batch_latency,
+                    end_time=window_end,
+                    server_url=server_url,
+                    sncls=sncls,
+                    session=session,
+                    port=port,
+                    deadline=budget,
+                    typed=typed))
+
+        async def fetch_batch(window_end: datetime, sncls: List[str]):
+            try:
+                latencies.update(await fetch(window_end, sncls))
+                return
+            except Exception as e:
+                # A query cut short by the deadline is not an error of the
+                # channels
+                if isinstance(e, DeadlineExceeded) or budget.expired():
+                    unevaluated.extend(sncls)
+                    return
+                if len(sncls) == 1:
+                    logging.warning(
+                        f"Could not get latency of {sncls[0]}: {e}")
+                    errors[sncls[0]] = str(e)
+                    return
+            await asyncio.gather(
+                *[fetch_batch(window_end, [sncl]) for sncl in sncls])
+
+        await asyncio.gather(
+            *[fetch_batch(window_end, sncls) for window_end, sncls in batches])
+
+    return latencies, errors, unevaluated
 
 
 def assemble_availability_url(
@@ -127,8 +446,15 @@ def assemble_arrival_url(
     return full_url
 
 
+# Size of the chunks read from the response when streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
 def get_api_json(
-    query_url: str
+    query_url: str,
+    session: Optional[ApolloSession] = None,
+    stream: bool = False,
+    deadline: Optional[Deadline] = None
 ) -> Dict:
     '''
     Get Availability information from the ApolloServer
@@ -138,6 +464,19 @@ def get_api_json(
     query_url: str
         The url to query for Availability information
 
+    session: Optional[ApolloSession]
+        The pooled session to send the request with. The session shared by
+        the process is used if none is provided
+
+    stream: bool
+        Parse an availability.json response while it is received, keeping
+        only the id and last range of each channel. Only valid for
+        availability queries
+
+    deadline: Optional[Deadline]
+        The time budget of the check. A streamed response is abandoned if it
+        is still being received when the deadline passes
+
     Returns
     -------
     Dict: A json-formatted Dictionary object containing availability informaion
@@ -147,23 +486,118 @@ def get_api_json(
     HTTPError: If the request to the ApolloServer's API fails for any reason
 
     ValueError: If the response from the ApolloServer is not a valid json
+
+    DeadlineExceeded: If the deadline passes before the response is received
     '''
+    if not stream:
+        return schemas.loads(get_api_body(
+            query_url=query_url,
+            session=session,
+            deadline=deadline
+        ))
+
+    if session is None:
+        session = get_default_session()
+
     logging.debug(f"Api query: {query_url}")
-    availability_response = requests.get(query_url)
 
-    availability_response.raise_for_status()
+    return session.stream(
+        query_url, parse_availability_stream, STREAM_CHUNK_SIZE,
+        deadline=deadline)
+
+
+def get_api_body(
+    query_url: str,
+    session: Optional[ApolloSession] = None,
+    deadline: Optional[Deadline] = None
+) -> bytes:
+    '''
+    Get the decompressed body of an ApolloServer API response
+
+    Raises
+    ------
+    HTTPError: If the request to the ApolloServer's API fails for any reason
 
-    availability = availability_response.json()
+    DeadlineExceeded: If the deadline passes before the request is sent
+    '''
+    if session is None:
+        session = get_default_session()
 
     logging.debug(f"Api query: {query_url}")
 
-    return availability
+    return session.get(query_url, deadline=deadline).content
+
+
+def get_availability(
+    query_url: str,
+    session: Optional[ApolloSession] = None,
+    stream: bool = False,
+    typed: bool = False,
+    deadline: Optional[Deadline] = None
+) -> Dict:
+    '''
+    Get the availability information of an availability query
+
+    Parameters
+    ----------
+    query_url: str
+        The availability query, see assemble_availability_url
+
+    session: Optional[ApolloSession]
+        The session to send the request with, the shared session by default
+
+    stream: bool
+        Parse the response while it is received, see get_api_json
+
+    typed: bool
+        Decode the response with the typed availability schema. Like
+        streaming, only the id and last range of each channel are kept
+
+    deadline: Optional[Deadline]
+        The time budget of the check
+
+    Returns
+    -------
+    Dict: A json-formatted Dictionary object containing availability informaion
+
+    Raises
+    ------
+    HTTPError: If the request to the ApolloServer's API fails for any reason
+
+    ApolloSchemaError: If a typed response does not follow the schema
+
+    ValueError: If the response from the ApolloServer is not a valid json
+
+    DeadlineExceeded: If the deadline passes before the response is received
+    '''
+    if typed and not stream:
+        return schemas.availability_to_json(schemas.decode_availability(
+            get_api_body(
+                query_url=query_url,
+                session=session,
+                deadline=deadline
+            )))
+
+    return get_api_json(
+        query_url=query_url,
+        session=session,
+        stream=stream,
+        deadline=deadline
+    )
 
 
 def get_channel_availability(
     availability: Dict,
     end_time: datetime,
-    server_url: str
+    server_url: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    session: Optional[ApolloSession] = None,
+    concurrency: int = 1,
+    port: str = '8787',
+    deadline: Optional[Deadline] = None,
+    typed: bool = False,
+    channel_filter: Optional[Callable[[str], bool]] = None,
+    cached_latencies: Optional[Dict[str, float]] = None
 ) -> AcquisionStatistics:
     '''
     Parameters
@@ -175,6 +609,38 @@ def get_channel_availability(
         The time to use to determine the time range to query for, as well as
          compare timestamps to to calculate latency
 
+    batch_size: int
+        The maximum number of channels to query latency for in a single
+        request
+
+    session: Optional[ApolloSession]
+        The session to send latency queries with, the shared session by
+        default
+
+    concurrency: int
+        The number of latency queries to run in parallel
+
+    port: str
+        The port of the ApolloServer API
+
+    deadline: Optional[Deadline]
+        The time budget of the check. Channels whose latency is not retrieved
+        before it passes are reported in unevaluated_channels, and those
+        whose latency query fails in failed_channels
+
+    typed: bool
+        Decode the latency responses with the typed schema of arrival
+        intervals
+
+    channel_filter: Optional[Callable[[str], bool]]
+        Channels for which it returns False are left out before querying
+        their latency, such as masked channels. All channels are kept if None
+
+    cached_latencies: Optional[Dict[str, float]]
+        Latencies to report instead of querying the ApolloServer, such as
+        those of the last check when the availability is a stale response.
+        Channels missing from it are reported in unevaluated_channels
+
     Returns
     -------
     AquisitionStatistics
@@ -183,38 +649,111 @@ def get_channel_availability(
 
     Raises
     ------
-    KeyError: If the json-formatted data does not contain the expected keys
+    ApolloSchemaError: If the json-formatted data does not contain the
+    expected keys, a KeyError
 
     '''
     channel_latency: List[ChannelLatency] = []
     unavailable_channels: List[str] = []
-
-    try:
-        for channel in availability["availability"]:
-            if len(channel["ranges"]) <= 0:
-                unavailable_channels.extend([channel["id"]])
+    available: List[str] = []
+    end_times: List[str] = []
+
+    for channel in schemas.availability_from_json(availability):
+        if channel_filter is not None and not channel_filter(channel.id):
+            continue
+        if channel.end_time is None:
+            unavailable_channels.append(channel.id)
+        else:
+            available.append(channel.id)
+            end_times.append(channel.end_time)
+
+    # Parse the end times of all the channels at once
+    last_times: List[Tuple[str, datetime]] = list(
+        zip(available, parse_apollo_timestamps(end_times).tolist()))
+
+    # Query the latency of channels sharing the same window together
+    latencies: Dict[str, float] = {}
+    failed_channels: Dict[str, str] = {}
+    unevaluated: List[str] = []
+    batches = group_latency_queries(last_times, batch_size)
+
+    if deadline is None:
+        deadline = Deadline()
+
+    if cached_latencies is not None:
+        for sncl, _ in last_times:
+            if sncl in cached_latencies:
+                latencies[sncl] = cached_latencies[sncl]
             else:
-                last_entry_index = len(channel["ranges"]) - 1
-                last_timestamp = channel["ranges"][last_entry_index]['endTime']
-                last_time = datetime.strptime(last_timestamp,
-                                              '%Y-%m-%dT%H:%M:%S.%f000Z')
-
-                latency = get_latency(
-                    end_time=last_time,
+                unevaluated.append(sncl)
+    elif concurrency > 1:
+        latencies, failed_channels, unevaluated = asyncio.run(
+            fetch_batch_latencies(
+                batches=batches,
+                server_url=server_url,
+                concurrency=concurrency,
+                session=session,
+                port=port,
+                deadline=deadline,
+                typed=typed
+            ))
+    else:
+        # Failed batches are queried again one channel at a time, so that a
+        # failing channel does not hide the latency of the others
+        queries = list(batches)
+        while len(queries) > 0:
+            window_end, sncls = queries.pop(0)
+            try:
+                latencies.update(get_batch_latency(
+                    end_time=window_end,
                     server_url=server_url,
-                    sncl=channel["id"]
-                )
-
-                if latency < 0:
-                    latency = 0
-
-                channel_latency.append(ChannelLatency(channel["id"],
-                                       last_time, latency))
-
-        return AcquisionStatistics(channel_latency, unavailable_channels)
-
-    except KeyError as e:
-        raise e
+                    sncls=sncls,
+                    session=session,
+                    port=port,
+                    deadline=deadline,
+                    typed=typed
+                ))
+            except Exception as e:
+                if isinstance(e, DeadlineExceeded) or deadline.expired():
+                    # Stop at the deadline, the remaining batches are
+                    # reported as not evaluated
+                    unevaluated.extend(sncls)
+                    for _, remaining_sncls in queries:
+                        unevaluated.extend(remaining_sncls)
+                    break
+                if len(sncls) == 1:
+                    logging.warning(
+                        f"Could not get latency of {sncls[0]}: {e}")
+                    failed_channels[sncls[0]] = str(e)
+                    continue
+                queries[:0] = [(window_end, [sncl]) for sncl in sncls]
+
+    if len(unevaluated) > 0 and cached_latencies is None:
+        logging.warning(
+            f"Deadline reached, latency of {len(unevaluated)} channels of " +
+            f"{server_url} not evaluated")
+
+    not_queried = set(unevaluated)
+    unevaluated_channels: List[str] = []
+
+    for sncl, last_time in last_times:
+        if sncl in failed_channels:
+            continue
+
+        if sncl in not_queried:
+            unevaluated_channels.append(sncl)
+            continue
+
+        latency = latencies[sncl]
+
+        if latency < 0:
+            latency = 0
+
+        channel_latency.append(ChannelLatency(sncl, last_time, latency))
+
+    return AcquisionStatistics(
+        channel_latency, unavailable_channels, failed_channels,
+        unevaluated_channels)
 
 
 def check_availability_percentage(
@@ -260,7 +799,9 @@ def get_latency_threshold_state(
     warn_time: str,
     crit_time: str,
     warn_threshold: str,
-    crit_threshold: str
+    crit_threshold: str,
+    unevaluated_state: NagiosOutputCode = NagiosOutputCode.unknown,
+    failed_state: NagiosOutputCode = NagiosOutputCode.critical
 ) -> LatencyCheckResults:
     '''
     Get a set of Nagios check results based on the provided latency thresholds
@@ -286,6 +827,14 @@ def get_latency_threshold_state(
         The number of channels that need to fail the crit_time threshold to
         create a critical state
 
+    unevaluated_state: NagiosOutputCode
+        How the channels not evaluated before the deadline count: not at all
+        if ok, as warning or critical channels, or making the state unknown
+
+    failed_state: NagiosOutputCode
+        How the channels whose latency could not be retrieved count, as for
+        unevaluated_state
+
     Returns
     -------
     LatencyCheckResults:
@@ -293,32 +842,21 @@ def get_latency_threshold_state(
         critical threshold, and the Nagios state
 
     '''
-    crit_count = 0
-    warn_count = 0
-
-    # Count the channels within the critical and warning thresholds
-
-    for channel in acquisition_stats.channel_latency:
-        if NagiosRange(crit_time).in_range(channel.latency):
-            crit_count += 1
-        elif NagiosRange(warn_time).in_range(channel.latency):
-            warn_count += 1
-
     # Channels that don't have latency statistics for the past hour should
     # also count as critical
     # Removing this because of all the channels that have been tested
     # pre-deplpoyment but are not deployed. Maybe re-add later
     # crit_count += len(acquisition_stats.unavailable_channels)
 
-    if NagiosRange(crit_threshold).in_range(crit_count):
-        state = NagiosOutputCode.critical
-    # Critical channels should also count towards the warning threshold
-    elif NagiosRange(warn_threshold).in_range((warn_count+crit_count)):
-        state = NagiosOutputCode.warning
-    else:
-        state = NagiosOutputCode.ok
-
-    return LatencyCheckResults(crit_count, warn_count, state)
+    return acquisition_stats.to_columnar().latency_threshold_state(
+        warn_time=warn_time,
+        crit_time=crit_time,
+        warn_threshold=warn_threshold,
+        crit_threshold=crit_threshold,
+        unevaluated=len(acquisition_stats.unevaluated_channels),
+        unevaluated_state=unevaluated_state,
+        failed=len(acquisition_stats.failed_channels),
+        failed_state=failed_state)
 
 
 def assemble_details(
@@ -338,19 +876,39 @@ def assemble_details(
     for channel in acquisition_statistics.unavailable_channels:
         stale_details += f"{channel} "
 
+    error_details = ""
+
+    if len(acquisition_statistics.failed_channels) > 0:
+        error_details = "\nChannels with latency errors:\n"
+
+    for channel, error in acquisition_statistics.failed_channels.items():
+        error_details += f"{channel}: {error}\n"
+
+    if len(acquisition_statistics.unevaluated_channels) > 0:
+        error_details += "\nChannels not evaluated before the deadline:\n"
+
+    for channel in acquisition_statistics.unevaluated_channels:
+        error_details += f"{channel} "
+
     acquisition_statistics.channel_latency.sort(
         key=lambda x: x.latency,
         reverse=True)
 
+    # Classify every channel at once, in the order of channel_latency
+    critical, warning = acquisition_statistics.to_columnar().threshold_masks(
+        warn_time=warning_time, crit_time=critical_time)
+
     # Sort latency statistics by threshold for display
-    for stats in acquisition_statistics.channel_latency:
-        if NagiosRange(critical_time).in_range(stats.latency):
+    for stats, is_critical, is_warning in zip(
+            acquisition_statistics.channel_latency, critical, warning):
+        if is_critical:
             crit_details += (f"{str(stats)}\n")
-        elif NagiosRange(warning_time).in_range(stats.latency):
+        elif is_warning:
             warn_details += (f"{str(stats)}\n")
         else:
             ok_details += (f"{str(stats)}\n")
 
-    details = stale_details + "\n" + crit_details + warn_details + ok_details
+    details = (stale_details + "\n" + error_details + crit_details +
+               warn_details + ok_details)
 
     return details
@@ -0,0 +1,200 @@
+'''
+Incremental parser for the timeseries response of the ApolloServer
+Availability API
+
+Only the id and last range of each channel are kept while the response is
+read, so memory use does not grow with the number of gaps in the ranges.
+'''
+import codecs
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+_WHITESPACE = ' \t\n\r'
+
+
+class _JsonStream(object):
+    '''
+    Reads JSON values one at a time from an iterable of byte chunks
+    '''
+    def __init__(
+        self,
+        chunks: Iterable[bytes]
+    ):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.exhausted = False
+
+    def _fill(self) -> bool:
+        '''
+        Append the next chunk to the buffer, dropping consumed text
+
+        Returns False once the input is exhausted
+        '''
+        if self.exhausted:
+            return False
+        self.buffer = self.buffer[self.position:]
+        self.position = 0
+        for chunk in self.chunks:
+            text = self.decoder.decode(chunk)
+            if text:
+                self.buffer += text
+                return True
+        self.buffer += self.decoder.decode(b'', final=True)
+        self.exhausted = True
+        return True
+
+    def peek(self) -> str:
+        '''
+        Returns the next non-whitespace character without consuming it, or
+        an empty string at the end of the input
+        '''
+        while True:
+            while (self.position < len(self.buffer) and
+                   self.buffer[self.position] in _WHITESPACE):
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                return ''
+
+    def expect(
+        self,
+        characters: str
+    ) -> str:
+        '''
+        Consume the next non-whitespace character, which must be one of the
+        provided characters
+
+        :raises ValueError: unexpected character
+        '''
+        character = self.peek()
+        if character == '' or character not in characters:
+            raise ValueError(
+                f"Expected one of {characters!r} at offset {self.position}" +
+                f" of availability response, found {character!r}")
+        self.position += 1
+        return character
+
+    def value(self) -> Any:
+        '''
+        Decode the next complete JSON value
+
+        :raises ValueError: invalid or truncated JSON
+        '''
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(
+                    self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next
+            # chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.position = end
+            return value
+
+    def items(self) -> Iterator[str]:
+        '''
+        Iterate over the keys of the object starting at the current position,
+        leaving the position at the value of each key
+        '''
+        self.expect('{')
+        if self.peek() == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def elements(self) -> Iterator[None]:
+        '''
+        Iterate over the array starting at the current position, leaving the
+        position at each element
+        '''
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield None
+            if self.expect(',]') == ']':
+                return
+
+
+def iter_channel_last_ranges(
+    chunks: Iterable[bytes]
+) -> Iterator[Dict]:
+    '''
+    Walk an availability.json response and yield each channel with only its
+    last range
+
+    Parameters
+    ----------
+    chunks: Iterable[bytes]
+        The response body, in chunks of any size
+
+    Returns
+    -------
+    Iterator[Dict]: One entry per channel holding its id and a ranges list
+    with at most the last range
+
+    Raises
+    ------
+    ValueError: If the response is not valid json
+    '''
+    stream = _JsonStream(chunks)
+
+    for key in stream.items():
+        if key != 'availability':
+            stream.value()
+            continue
+
+        for _ in stream.elements():
+            channel: Dict = {}
+            for channel_key in stream.items():
+                if channel_key == 'ranges':
+                    last_range: Optional[Dict] = None
+                    for _ in stream.elements():
+                        last_range = stream.value()
+                    channel['ranges'] = \
+                        [] if last_range is None else [last_range]
+                elif channel_key == 'id':
+                    channel['id'] = stream.value()
+                else:
+                    stream.value()
+            yield channel
+
+
+def parse_availability_stream(
+    chunks: Iterable[bytes]
+) -> Dict:
+    '''
+    Parse an availability.json response incrementally into the structure
+    returned by the API, keeping only the last range of each channel
+
+    Parameters
+    ----------
+    chunks: Iterable[bytes]
+        The response body, in chunks of any size
+
+    Returns
+    -------
+    Dict: The availability information with trimmed ranges
+
+    Raises
+    ------
+    ValueError: If the response is not valid json
+    '''
+    channels: List[Dict] = list(iter_channel_last_ranges(chunks))
+    return {'availability': channels}
@@ -0,0 +1,201 @@
+'''
+Incremental availability queries
+
+Instead of querying the whole hour on every check, the last range end of
+each channel and the time of the last query are kept in a state file. Each
+check then only queries the slice of time since the previous one and merges
+it into the stored state, which gives the same last range ends as a query of
+the whole hour.
+'''
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+from pathlib import Path
+import tempfile
+from typing import Dict, List, Optional, Tuple, Union
+from acquisition_nagios.timestamps import parse_apollo_timestamp
+
+
+STATE_VERSION = 1
+
+DEFAULT_WINDOW = timedelta(hours=1)
+
+# Margin queried before the previous query time to catch data that arrived
+# late. Channels with a larger latency are only picked up by a full query
+DEFAULT_OVERLAP = timedelta(minutes=2)
+
+_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+@dataclass
+class AvailabilityCursor:
+    # End time of the last successful availability query
+    last_query: datetime
+    # Last range end time of each channel as returned by the API, None if the
+    # channel never had data
+    channels: Dict[str, Optional[str]] = field(default_factory=dict)
+
+
+def cursor_path(
+    state_dir: Union[str, Path],
+    server_url: str,
+    port: str = '8787'
+) -> Path:
+    '''
+    The location of the state file of an ApolloServer
+    '''
+    return Path(state_dir).joinpath(f"availability_{server_url}_{port}.json")
+
+
+def load_cursor(
+    path: Union[str, Path]
+) -> Optional[AvailabilityCursor]:
+    '''
+    Read the state of the previous check, None if there is none or it can not
+    be used
+    '''
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('version') != STATE_VERSION:
+            return None
+        return AvailabilityCursor(
+            last_query=datetime.strptime(state['last_query'], _TIME_FORMAT),
+            channels=state['channels'])
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Ignoring unreadable availability state {path}: {e}")
+        return None
+
+
+def save_cursor(
+    path: Union[str, Path],
+    cursor: AvailabilityCursor
+) -> None:
+    '''
+    Write the state for the next check, replacing the previous one atomically
+    '''
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': STATE_VERSION,
+                'last_query': cursor.last_query.strftime(_TIME_FORMAT),
+                'channels': cursor.channels
+            }, f)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def get_query_start(
+    cursor: Optional[AvailabilityCursor],
+    end_time: datetime,
+    window: timedelta = DEFAULT_WINDOW,
+    overlap: timedelta = DEFAULT_OVERLAP
+) -> Tuple[datetime, bool]:
+    '''
+    Determine the start of the availability query
+
+    Parameters
+    ----------
+    cursor: Optional[AvailabilityCursor]
+        The state of the previous check
+
+    end_time: datetime
+        The end of the availability query
+
+    window: timedelta
+        The period over which channels are considered available
+
+    overlap: timedelta
+        The margin to query before the previous query time
+
+    Returns
+    -------
+    datetime: The start time of the query
+
+    bool: True if only the slice since the previous query is queried, False
+    if the whole window is queried
+    '''
+    full_start = end_time - window
+
+    if cursor is None or cursor.last_query > end_time:
+        return full_start, False
+
+    start_time = cursor.last_query - overlap
+
+    if start_time <= full_start:
+        return full_start, False
+
+    return start_time, True
+
+
+def merge_availability(
+    cursor: Optional[AvailabilityCursor],
+    availability: Dict,
+    end_time: datetime,
+    window: timedelta = DEFAULT_WINDOW
+) -> Tuple[Dict, AvailabilityCursor]:
+    '''
+    Merge the response of an availability query into the stored state
+
+    Parameters
+    ----------
+    cursor: Optional[AvailabilityCursor]
+        The state of the previous check, None after a full query
+
+    availability: Dict
+        The json-formatted response of the availability query. Every
+        configured channel is listed, so channels missing from it are
+        dropped from the state
+
+    end_time: datetime
+        The end time of the availability query
+
+    window: timedelta
+        The period over which channels are considered available
+
+    Returns
+    -------
+    Dict: Availability information equivalent to a query of the whole window,
+    with the last range of each available channel
+
+    AvailabilityCursor: The state to store for the next check
+
+    Raises
+    ------
+    KeyError: If the json-formatted data does not contain the expected keys
+    '''
+    previous = cursor.channels if cursor is not None else {}
+    window_start = end_time - window
+
+    channels: Dict[str, Optional[str]] = {}
+    merged: List[Dict] = []
+
+    for channel in availability['availability']:
+        sncl = channel['id']
+        last_end = previous.get(sncl)
+
+        if len(channel['ranges']) > 0:
+            new_end = channel['ranges'][-1]['endTime']
+            if (last_end is None or parse_apollo_timestamp(new_end) >
+                    parse_apollo_timestamp(last_end)):
+                last_end = new_end
+
+        channels[sncl] = last_end
+
+        if (last_end is not None and
+                parse_apollo_timestamp(last_end) >= window_start):
+            merged.append({'id': sncl, 'ranges': [{'endTime': last_end}]})
+        else:
+            merged.append({'id': sncl, 'ranges': []})
+
+    return ({'availability': merged},
+            AvailabilityCursor(last_query=end_time, channels=channels))
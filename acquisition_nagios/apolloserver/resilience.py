@@ -0,0 +1,325 @@
+'''
+Retries and circuit breaking for ApolloServer API requests
+
+Transient failures, such as a connection reset or a 503 while the
+ApolloServer restarts, are retried with a jittered exponential backoff.
+Servers that keep failing are short-circuited by a circuit breaker, whose
+state can be kept in a file so that the next run of the plugin fails fast on
+a server that is still down instead of timing out on every request.
+'''
+from contextlib import contextmanager
+from dataclasses import dataclass
+import json
+import logging
+import os
+from pathlib import Path
+import random
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional, Set, TypeVar, Union
+import requests
+from acquisition_nagios.deadline import Deadline
+
+
+T = TypeVar('T')
+
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 5.0
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 60.0
+
+# Status codes of an ApolloServer that is overloaded or restarting
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+STATE_VERSION = 1
+
+
+class CircuitOpenError(requests.RequestException):
+    '''
+    Raised instead of sending a request to a server considered down
+    '''
+
+
+def is_transient_error(
+    error: BaseException
+) -> bool:
+    '''
+    Whether a request failed because of the server or the network, in which
+    case it is worth retrying and counts against the server
+    '''
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and \
+            error.response.status_code in RETRY_STATUS_CODES
+    return isinstance(error, (
+        requests.ConnectionError,
+        requests.Timeout,
+        requests.exceptions.ChunkedEncodingError))
+
+
+@dataclass
+class RetryPolicy:
+    # Attempts made after the first one fails
+    retries: int = DEFAULT_RETRIES
+    # Upper bound of the delay before the first retry, doubled for each
+    # following one
+    backoff: float = DEFAULT_BACKOFF
+    max_backoff: float = DEFAULT_MAX_BACKOFF
+
+    def delay(
+        self,
+        retry: int
+    ) -> float:
+        '''
+        Seconds to wait before a retry, drawn uniformly up to the exponential
+        backoff so that concurrent clients do not retry in lockstep
+        '''
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** retry))
+
+    def call(
+        self,
+        request: Callable[[], T],
+        deadline: Optional[Deadline] = None,
+        sleep: Callable[[float], None] = time.sleep
+    ) -> T:
+        '''
+        Call the request, retrying it on transient errors
+
+        Parameters
+        ----------
+        request: Callable[[], T]
+            Sends the request and returns its response
+
+        deadline: Optional[Deadline]
+            The time budget of the check, no retry is made if the backoff
+            would end after it
+
+        sleep: Callable[[float], None]
+            Waits the provided number of seconds
+
+        Raises
+        ------
+        RequestException: The error of the last attempt
+        '''
+        retry = 0
+        while True:
+            try:
+                return request()
+            except Exception as e:
+                if not is_transient_error(e) or retry >= self.retries:
+                    raise
+                delay = self.delay(retry)
+                remaining = deadline.remaining() \
+                    if deadline is not None else None
+                if remaining is not None and remaining <= delay:
+                    raise
+                retry += 1
+                logging.debug(
+                    f"Retrying in {delay:.2f}s ({retry}/{self.retries}) " +
+                    f"after: {e}")
+                sleep(delay)
+
+
+@dataclass
+class CircuitState:
+    # Consecutive failed requests
+    failures: int = 0
+    # Epoch time at which the circuit opened, None while closed
+    opened_at: Optional[float] = None
+
+
+class CircuitBreaker(object):
+    '''
+    Per-server circuit breaker
+
+    After failure_threshold consecutive failed requests to a server, the
+    circuit opens and requests to it fail immediately with CircuitOpenError.
+    Once reset_timeout has passed, a single probe request is let through:
+    the circuit closes if it succeeds and opens again if it fails.
+    '''
+    def __init__(
+        self,
+        state_file: Optional[Union[str, Path]] = None,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        clock: Callable[[], float] = time.time
+    ):
+        '''
+        Parameters
+        ----------
+        state_file: Optional[Union[str, Path]]
+            File to keep the state of the circuits in between runs, only
+            kept in memory if None
+
+        failure_threshold: int
+            Consecutive failed requests after which a circuit opens
+
+        reset_timeout: float
+            Seconds after which an open circuit lets a probe request through
+
+        clock: Callable[[], float]
+            Epoch time in seconds, comparable between runs
+        '''
+        if failure_threshold < 1:
+            raise ValueError(f"Invalid failure threshold {failure_threshold}")
+        self.state_file = Path(state_file) if state_file is not None \
+            else None
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._probing: Set[str] = set()
+        self.circuits: Dict[str, CircuitState] = self._load()
+
+    def _load(self) -> Dict[str, CircuitState]:
+        if self.state_file is None:
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('version') != STATE_VERSION:
+                return {}
+            return {server: CircuitState(
+                failures=int(circuit['failures']),
+                opened_at=circuit['opened_at'])
+                for server, circuit in state['circuits'].items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(
+                "Ignoring unreadable circuit breaker state " +
+                f"{self.state_file}: {e}")
+            return {}
+
+    def _save(
+        self,
+        server: str
+    ) -> None:
+        '''
+        Write the circuit of a server to the state file, keeping the circuits
+        written by other runs for other servers
+        '''
+        if self.state_file is None:
+            return
+        circuits = self._load()
+        if server in self.circuits:
+            circuits[server] = self.circuits[server]
+        else:
+            circuits.pop(server, None)
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=self.state_file.parent, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'version': STATE_VERSION,
+                    'circuits': {name: {
+                        'failures': circuit.failures,
+                        'opened_at': circuit.opened_at
+                    } for name, circuit in circuits.items()}
+                }, f)
+            os.replace(temp_path, self.state_file)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def is_open(
+        self,
+        server: str
+    ) -> bool:
+        circuit = self.circuits.get(server)
+        return circuit is not None and circuit.opened_at is not None
+
+    def before_request(
+        self,
+        server: str
+    ) -> None:
+        '''
+        Raises
+        ------
+        CircuitOpenError: If requests to the server are short-circuited
+        '''
+        with self._lock:
+            circuit = self.circuits.get(server)
+            if circuit is None or circuit.opened_at is None:
+                return
+            elapsed = self._clock() - circuit.opened_at
+            # Let a single probe through once the reset timeout has passed
+            if elapsed >= self.reset_timeout and server not in self._probing:
+                self._probing.add(server)
+                logging.info(f"Probing {server} after its circuit opened")
+                return
+        raise CircuitOpenError(
+            f"Circuit open for {server} after {circuit.failures} failed " +
+            "requests")
+
+    def record_success(
+        self,
+        server: str
+    ) -> None:
+        with self._lock:
+            self._probing.discard(server)
+            circuit = self.circuits.pop(server, None)
+            if circuit is not None:
+                if circuit.opened_at is not None:
+                    logging.info(f"Circuit closed for {server}")
+                self._save(server)
+
+    def record_failure(
+        self,
+        server: str
+    ) -> None:
+        with self._lock:
+            probe = server in self._probing
+            self._probing.discard(server)
+            circuit = self.circuits.setdefault(server, CircuitState())
+            circuit.failures += 1
+            if probe or (circuit.opened_at is None and
+                         circuit.failures >= self.failure_threshold):
+                circuit.opened_at = self._clock()
+                logging.warning(
+                    f"Circuit opened for {server} after {circuit.failures} " +
+                    "failed requests")
+            self._save(server)
+
+    def release(
+        self,
+        server: str
+    ) -> None:
+        '''
+        Forget a request whose outcome says nothing about the server, such
+        as one stopped by the deadline
+        '''
+        with self._lock:
+            self._probing.discard(server)
+
+    @contextmanager
+    def guard(
+        self,
+        server: str
+    ) -> Iterator[None]:
+        '''
+        Wrap a request to the server, recording its outcome
+
+        Raises
+        ------
+        CircuitOpenError: If requests to the server are short-circuited
+        '''
+        self.before_request(server)
+        try:
+            yield
+        except Exception as e:
+            if is_transient_error(e):
+                self.record_failure(server)
+            elif isinstance(e, requests.HTTPError):
+                # The server answered
+                self.record_success(server)
+            else:
+                self.release(server)
+            raise
+        self.record_success(server)
@@ -0,0 +1,227 @@
+'''
+On-disk cache of ApolloServer API responses
+
+Query windows are snapped to fixed time buckets so that checks run within the
+same bucket, such as Nagios retries or several services sharing a server,
+reuse the same response instead of querying the ApolloServer again.
+'''
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import tempfile
+import time
+from typing import Callable, Dict, Optional, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+DEFAULT_TTL = 60.0
+DEFAULT_BUCKET = 60
+DEFAULT_MAX_STALE = 3600.0
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Query parameters that only select the time window of a query
+_WINDOW_PARAMETERS = ('startTime', 'endTime')
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    payload: Dict
+    # Epoch time at which the payload was retrieved from the ApolloServer
+    fetched_at: float
+    stale: bool = False
+
+    @property
+    def fetched_time(self) -> datetime:
+        return datetime.fromtimestamp(self.fetched_at)
+
+
+def snap_to_bucket(
+    time: datetime,
+    bucket_seconds: int
+) -> datetime:
+    '''
+    Round a time down to the start of its time bucket
+
+    Parameters
+    ----------
+    time: datetime
+        The time to round
+
+    bucket_seconds: int
+        The length of the buckets in seconds
+
+    Returns
+    -------
+    datetime: The start of the bucket containing the time
+    '''
+    if bucket_seconds < 1:
+        raise ValueError(f"Invalid bucket length {bucket_seconds}")
+    seconds = (time - _EPOCH) // timedelta(seconds=1)
+    return _EPOCH + timedelta(seconds=seconds - seconds % bucket_seconds)
+
+
+def _window_free_key(
+    url: str
+) -> str:
+    '''
+    The url without its time window parameters, identifying a query against
+    a given server regardless of the window it covers
+    '''
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(
+        parts.query, keep_blank_values=True)
+        if key not in _WINDOW_PARAMETERS]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class ResponseCache(object):
+    '''
+    Cache of json responses
+
+    The last good response of each query is stored in one file, whatever its
+    time window, so that it can still be returned as stale once the window
+    moved to the next bucket.
+    '''
+    def __init__(
+        self,
+        cache_dir: Union[str, Path],
+        ttl: float = DEFAULT_TTL,
+        stale_while_revalidate: bool = False,
+        max_stale: float = DEFAULT_MAX_STALE
+    ):
+        '''
+        Parameters
+        ----------
+        cache_dir: Union[str, Path]
+            The directory to store responses in, created if missing
+
+        ttl: float
+            Seconds during which a stored response is used without querying
+            the ApolloServer
+
+        stale_while_revalidate: bool
+            Return the last good response, marked as stale, when the
+            ApolloServer fails to answer
+
+        max_stale: float
+            Maximum age in seconds of a response returned as stale
+        '''
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.max_stale = max_stale
+
+    def _path(
+        self,
+        url: str
+    ) -> Path:
+        key = hashlib.sha1(
+            _window_free_key(url).encode('utf-8')).hexdigest()
+        return self.cache_dir.joinpath(f"{key}.json")
+
+    def load(
+        self,
+        url: str
+    ) -> Optional[CachedResponse]:
+        '''
+        Read the last response stored for the query of a url, which may
+        cover a different time window. None if there is none or it is
+        unreadable
+        '''
+        try:
+            with open(self._path(url), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable cache entry for {url}: {e}")
+            return None
+
+        if _window_free_key(entry.get('url', '')) != _window_free_key(url):
+            return None
+
+        return CachedResponse(
+            url=entry['url'],
+            payload=entry['payload'],
+            fetched_at=entry['fetched_at'])
+
+    def store(
+        self,
+        url: str,
+        payload: Dict
+    ) -> CachedResponse:
+        '''
+        Store a response, replacing the previous one atomically
+        '''
+        cached = CachedResponse(
+            url=url, payload=payload, fetched_at=time.time())
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'url': url,
+                    'fetched_at': cached.fetched_at,
+                    'payload': payload
+                }, f)
+            os.replace(temp_path, self._path(url))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        return cached
+
+    def get(
+        self,
+        url: str,
+        fetch: Callable[[], Dict]
+    ) -> CachedResponse:
+        '''
+        Get the response for a url from the cache, fetching it if the stored
+        response expired
+
+        Parameters
+        ----------
+        url: str
+            The query url, used as the cache key
+
+        fetch: Callable[[], Dict]
+            Retrieves the response from the ApolloServer
+
+        Returns
+        -------
+        CachedResponse: The response, marked stale if the ApolloServer failed
+        and the last good response, possibly for an earlier window, was
+        returned instead
+
+        Raises
+        ------
+        Exception: Any error raised by fetch when no usable stale response is
+        stored
+        '''
+        cached = self.load(url)
+
+        if (cached is not None and cached.url == url and
+                time.time() - cached.fetched_at <= self.ttl):
+            logging.debug(f"Using cached response for {url}")
+            return cached
+
+        try:
+            return self.store(url, fetch())
+        except Exception as e:
+            if (not self.stale_while_revalidate or cached is None or
+                    time.time() - cached.fetched_at > self.max_stale):
+                raise
+            logging.warning(
+                "Query failed, using stale response from " +
+                f"{cached.fetched_time}: {e}")
+            cached.stale = True
+            return cached
@@ -0,0 +1,313 @@
+'''
+Typed decoding of the ApolloServer API responses
+
+Only the fields used by the checks are declared: the id and last range end
+time of each channel in availability responses, and the average latency of
+each channel in arrival interval responses. With msgspec installed, responses
+are decoded straight into these structures without allocating the other
+fields. Otherwise they are parsed with orjson, or the standard json module,
+and reduced to the same structures.
+
+A response that does not follow the schema raises ApolloSchemaError, which
+names the missing or invalid field and where it is.
+'''
+import json
+from typing import Any, Dict, List, NamedTuple, Optional
+
+try:
+    import msgspec  # type: ignore
+except ImportError:
+    msgspec = None  # type: ignore
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # type: ignore
+
+
+# JSON libraries available, fastest first
+LIBRARIES = tuple(name for name, module in (
+    ('msgspec', msgspec), ('orjson', orjson), ('json', json))
+    if module is not None)
+
+JSON_LIBRARY = LIBRARIES[0]
+
+
+class ApolloSchemaError(KeyError):
+    '''
+    Raised when an ApolloServer response does not have the expected structure
+
+    A KeyError, like the one raised when indexing the response directly.
+    '''
+    def __str__(self) -> str:
+        return str(self.args[0]) if len(self.args) > 0 else ''
+
+
+class ChannelRange(NamedTuple):
+    id: str
+    # End time of the last range of data, None if the channel has no data
+    end_time: Optional[str]
+
+
+class IntervalLatency(NamedTuple):
+    # None when the server does not identify the channel of the entry
+    id: Optional[str]
+    average: float
+
+
+if msgspec is not None:
+    class _Range(msgspec.Struct, rename='camel'):
+        end_time: str
+
+    class _Channel(msgspec.Struct):
+        id: str
+        ranges: List[_Range]
+
+    class _Availability(msgspec.Struct):
+        availability: List[_Channel]
+
+    class _Latency(msgspec.Struct):
+        average: float
+
+    class _Interval(msgspec.Struct):
+        latency: _Latency
+
+    class _ChannelIntervals(msgspec.Struct):
+        intervals: List[_Interval]
+        id: Optional[str] = None
+
+    class _Intervals(msgspec.Struct):
+        availability: List[_ChannelIntervals]
+
+    _availability_decoder = msgspec.json.Decoder(_Availability)
+    _intervals_decoder = msgspec.json.Decoder(_Intervals)
+
+
+def loads(
+    body: bytes,
+    library: str = JSON_LIBRARY
+) -> Any:
+    '''
+    Parse a JSON document with the fastest library available
+
+    Raises
+    ------
+    ValueError: If the body is not valid JSON
+    '''
+    if library == 'msgspec':
+        try:
+            return msgspec.json.decode(body)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+    if library == 'orjson':
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def _type_name(
+    value: Any
+) -> str:
+    if isinstance(value, dict):
+        return 'object'
+    if isinstance(value, list):
+        return 'array'
+    if value is None:
+        return 'null'
+    return type(value).__name__
+
+
+def _schema_error(
+    message: str,
+    path: str
+) -> ApolloSchemaError:
+    # Like msgspec, the location is omitted for the document itself
+    if path != '$':
+        message += f" - at `{path}`"
+    return ApolloSchemaError(message)
+
+
+def _field(
+    value: Any,
+    key: str,
+    path: str
+) -> Any:
+    if not isinstance(value, dict):
+        raise _schema_error(
+            f"Expected `object`, got `{_type_name(value)}`", path)
+    try:
+        return value[key]
+    except KeyError:
+        raise _schema_error(
+            f"Object missing required field `{key}`", path) from None
+
+
+def _array(
+    value: Any,
+    path: str
+) -> List[Any]:
+    if not isinstance(value, list):
+        raise _schema_error(
+            f"Expected `array`, got `{_type_name(value)}`", path)
+    return value
+
+
+def _string(
+    value: Any,
+    path: str
+) -> str:
+    if not isinstance(value, str):
+        raise _schema_error(
+            f"Expected `str`, got `{_type_name(value)}`", path)
+    return value
+
+
+def _number(
+    value: Any,
+    path: str
+) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise _schema_error(
+            f"Expected `float`, got `{_type_name(value)}`", path)
+    return float(value)
+
+
+def availability_from_json(
+    availability: Dict
+) -> List[ChannelRange]:
+    '''
+    Reduce a parsed availability response to the last range of each channel
+
+    Raises
+    ------
+    ApolloSchemaError: If the response does not follow the schema
+    '''
+    channels: List[ChannelRange] = []
+    entries = _array(_field(availability, 'availability', '$'),
+                     '$.availability')
+
+    for index, entry in enumerate(entries):
+        path = f"$.availability[{index}]"
+        sncl = _string(_field(entry, 'id', path), f"{path}.id")
+        ranges = _array(_field(entry, 'ranges', path), f"{path}.ranges")
+        end_time: Optional[str] = None
+        if len(ranges) > 0:
+            range_path = f"{path}.ranges[{len(ranges) - 1}]"
+            end_time = _string(
+                _field(ranges[-1], 'endTime', range_path),
+                f"{range_path}.endTime")
+        channels.append(ChannelRange(sncl, end_time))
+
+    return channels
+
+
+def intervals_from_json(
+    latency_json: Dict
+) -> List[IntervalLatency]:
+    '''
+    Reduce a parsed arrival interval response to the average latency of the
+    first interval of each channel
+
+    Raises
+    ------
+    ApolloSchemaError: If the response does not follow the schema
+    '''
+    latencies: List[IntervalLatency] = []
+    entries = _array(_field(latency_json, 'availability', '$'),
+                     '$.availability')
+
+    for index, entry in enumerate(entries):
+        path = f"$.availability[{index}]"
+        sncl: Optional[str] = None
+        if isinstance(entry, dict) and 'id' in entry:
+            sncl = _string(entry['id'], f"{path}.id")
+        intervals = _array(
+            _field(entry, 'intervals', path), f"{path}.intervals")
+        if len(intervals) == 0:
+            raise ApolloSchemaError(
+                f"Expected at least one interval - at `{path}.intervals`")
+        interval_path = f"{path}.intervals[0]"
+        latency = _field(intervals[0], 'latency', interval_path)
+        average = _number(
+            _field(latency, 'average', f"{interval_path}.latency"),
+            f"{interval_path}.latency.average")
+        latencies.append(IntervalLatency(sncl, average))
+
+    return latencies
+
+
+def decode_availability(
+    body: bytes,
+    library: str = JSON_LIBRARY
+) -> List[ChannelRange]:
+    '''
+    Decode an availability response into the last range of each channel
+
+    Raises
+    ------
+    ApolloSchemaError: If the response does not follow the schema
+
+    ValueError: If the body is not valid JSON
+    '''
+    if library != 'msgspec':
+        return availability_from_json(loads(body, library))
+
+    try:
+        decoded = _availability_decoder.decode(body)
+    except msgspec.ValidationError as e:
+        raise ApolloSchemaError(str(e)) from e
+    except msgspec.DecodeError as e:
+        raise ValueError(str(e)) from e
+
+    return [ChannelRange(
+                channel.id,
+                channel.ranges[-1].end_time if channel.ranges else None)
+            for channel in decoded.availability]
+
+
+def decode_intervals(
+    body: bytes,
+    library: str = JSON_LIBRARY
+) -> List[IntervalLatency]:
+    '''
+    Decode an arrival interval response into the average latency of the first
+    interval of each channel
+
+    Raises
+    ------
+    ApolloSchemaError: If the response does not follow the schema
+
+    ValueError: If the body is not valid JSON
+    '''
+    if library != 'msgspec':
+        return intervals_from_json(loads(body, library))
+
+    try:
+        decoded = _intervals_decoder.decode(body)
+    except msgspec.ValidationError as e:
+        raise ApolloSchemaError(str(e)) from e
+    except msgspec.DecodeError as e:
+        raise ValueError(str(e)) from e
+
+    latencies: List[IntervalLatency] = []
+    for index, channel in enumerate(decoded.availability):
+        if len(channel.intervals) == 0:
+            raise ApolloSchemaError(
+                "Expected at least one interval - at " +
+                f"`$.availability[{index}].intervals`")
+        latencies.append(IntervalLatency(
+            channel.id, channel.intervals[0].latency.average))
+    return latencies
+
+
+def availability_to_json(
+    channels: List[ChannelRange]
+) -> Dict:
+    '''
+    The availability response form used by the checks, with the last range
+    of each channel only, as produced by parse_availability_stream
+    '''
+    return {'availability': [
+        {'id': channel.id,
+         'ranges': [] if channel.end_time is None
+         else [{'endTime': channel.end_time}]}
+        for channel in channels]}
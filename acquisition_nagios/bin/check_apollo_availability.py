@@ -1,9 +1,16 @@
 from acquisition_nagios.apolloserver import availability_health  # type: ignore
-from datetime import datetime, timedelta
-from acquisition_nagios import acquisition_availability
+from acquisition_nagios.apolloserver import api_client
+from acquisition_nagios.apolloserver import response_cache
+from acquisition_nagios.apolloserver import incremental
+from acquisition_nagios.apolloserver import resilience
+from acquisition_nagios.apolloserver.apollo_check import \
+    ApolloCheckOptions, check_apollo_servers, parse_server
+from acquisition_nagios.channel_mask import compile_channel_selection
 from acquisition_nagios.config import LogLevels
-from acquisition_nagios.nagios.models import NagiosPerformance
-from typing import List, Optional
+from acquisition_nagios.deadline import Deadline
+from acquisition_nagios.nagios import nrdp
+from acquisition_nagios.nagios.models import NagiosOutputCode
+from typing import Optional, Tuple
 import logging
 import click
 import sys
@@ -12,8 +19,10 @@ import sys
 @click.command()
 @click.option(
     '--expected-channels',
+    type=int,
     help=('The number or channels expected to arrive at the aquisition ' +
-          'server')
+          'server. Required unless every --server gives its own count'),
+    default=None
 )
 @click.option(
     '--warning',
@@ -57,8 +66,211 @@ import sys
     help="Log more information about the program's execution",
     default=LogLevels.WARNING
 )
+@click.option(
+    '--batch-size',
+    type=int,
+    help=("The maximum number of channels to query latency for in a " +
+          "single request"),
+    default=availability_health.DEFAULT_BATCH_SIZE
+)
+@click.option(
+    '--connect-timeout',
+    type=float,
+    help="Seconds to wait for a connection to the ApolloServer",
+    default=api_client.DEFAULT_CONNECT_TIMEOUT
+)
+@click.option(
+    '--read-timeout',
+    type=float,
+    help="Seconds to wait for a response from the ApolloServer",
+    default=api_client.DEFAULT_READ_TIMEOUT
+)
+@click.option(
+    '--pool-size',
+    type=int,
+    help="Number of connections kept alive to the ApolloServer",
+    default=api_client.DEFAULT_POOL_SIZE
+)
+@click.option(
+    '--compression/--no-compression',
+    help="Ask the ApolloServer for gzip or deflate compressed responses",
+    default=True
+)
+@click.option(
+    '--transfer-perfdata/--no-transfer-perfdata',
+    help=("Report the bytes received from each ApolloServer and their " +
+          "decompressed size as performance data"),
+    default=False
+)
+@click.option(
+    '--retries',
+    type=click.IntRange(min=0),
+    help=("Number of times a request failing with a connection error, " +
+          "timeout or 5xx status is retried"),
+    default=resilience.DEFAULT_RETRIES
+)
+@click.option(
+    '--retry-backoff',
+    type=float,
+    help=("Maximum seconds to wait before the first retry, doubled for " +
+          "each following one. The actual wait is drawn at random"),
+    default=resilience.DEFAULT_BACKOFF
+)
+@click.option(
+    '--breaker-threshold',
+    type=click.IntRange(min=1),
+    help=("Consecutive failed requests after which requests to an " +
+          "ApolloServer fail immediately"),
+    default=resilience.DEFAULT_FAILURE_THRESHOLD
+)
+@click.option(
+    '--breaker-reset',
+    type=float,
+    help=("Seconds after which a single request is sent to an ApolloServer " +
+          "considered down, to detect its recovery"),
+    default=resilience.DEFAULT_RESET_TIMEOUT
+)
+@click.option(
+    '--breaker-file',
+    help=("File keeping which ApolloServers are down between runs, so " +
+          "that a server still down fails fast. Only kept in memory if " +
+          "not specified"),
+    default=None
+)
+@click.option(
+    '--concurrency',
+    type=click.IntRange(min=1),
+    help=("The number of latency queries to run in parallel. Channels " +
+          "whose query fails are reported instead of failing the check"),
+    default=1
+)
+@click.option(
+    '--stream/--no-stream',
+    help=("Parse the availability response while it is received, keeping " +
+          "only the last range of each channel to limit memory use"),
+    default=False
+)
+@click.option(
+    '--typed/--no-typed',
+    help=("Decode responses into typed structures holding only the fields " +
+          "used by the check, with msgspec when installed. Reports " +
+          "responses that do not follow the expected schema clearly"),
+    default=False
+)
+@click.option(
+    '--cache-dir',
+    help=("Directory to cache availability responses in. Disabled if not " +
+          "specified"),
+    default=None
+)
+@click.option(
+    '--cache-ttl',
+    type=float,
+    help="Seconds during which a cached availability response is reused",
+    default=response_cache.DEFAULT_TTL
+)
+@click.option(
+    '--cache-bucket',
+    type=click.IntRange(min=1),
+    help=("Length in seconds of the time buckets the query window is " +
+          "snapped to when caching"),
+    default=response_cache.DEFAULT_BUCKET
+)
+@click.option(
+    '--stale-while-revalidate/--no-stale-while-revalidate',
+    help=("Report on the last cached availability response and the " +
+          "latencies of the last check, marked as stale, if the " +
+          "ApolloServer can not be queried"),
+    default=False
+)
+@click.option(
+    '--max-stale',
+    type=float,
+    help="Maximum age in seconds of a stale availability response",
+    default=response_cache.DEFAULT_MAX_STALE
+)
+@click.option(
+    '--state-dir',
+    help=("Directory to keep the availability state between checks in. " +
+          "When specified, only the time since the previous check is " +
+          "queried and merged into the stored state"),
+    default=None
+)
+@click.option(
+    '--overlap',
+    type=float,
+    help=("Seconds queried before the previous check when querying " +
+          "incrementally, to catch data that arrived late"),
+    default=incremental.DEFAULT_OVERLAP.total_seconds()
+)
+@click.option(
+    '--mask-file',
+    help=("File containing list of channels to ignore, one per line " +
+          "written as for --channels, such as LOG, CN.ABC*.*.HN? or " +
+          "CN.ABC01. The expected channel count should not include them"),
+    default=None
+)
+@click.option(
+    '--channels',
+    help=("The channels to check, as comma separated channel codes such " +
+          "as HH?,HN?, patterns such as CN.ABC*.*.HN? or stations such " +
+          "as CN.ABC01. Other channels " +
+          "are ignored. The expected channel count should not include " +
+          "them. All channels if not set"),
+    default=None
+)
+@click.option(
+    '--deadline',
+    type=float,
+    help=("Seconds after which the check stops querying and reports the " +
+          "channels evaluated so far. Set it below the Nagios plugin " +
+          "timeout"),
+    default=None
+)
+@click.option(
+    '--deadline-state',
+    type=click.Choice([code.name for code in NagiosOutputCode]),
+    help=("How channels not evaluated before the deadline count: ok " +
+          "ignores them, warning and critical count them as channels " +
+          "above that latency, unknown makes the result UNKNOWN. Channels " +
+          "whose latency could not be retrieved count as set by " +
+          "--failed-state"),
+    default=NagiosOutputCode.unknown.name
+)
+@click.option(
+    '--failed-state',
+    type=click.Choice([code.name for code in NagiosOutputCode]),
+    help=("How channels whose latency could not be retrieved count, as " +
+          "for --deadline-state"),
+    default=NagiosOutputCode.critical.name
+)
+@click.option(
+    '--server',
+    'servers',
+    multiple=True,
+    help=("ApolloServer to check, as host[:port][=expected_channels]. " +
+          "Can be repeated to check several servers concurrently, " +
+          "producing one result per server"),
+    default=['localhost']
+)
+@click.option(
+    '--nrdp-url',
+    help=("Submit the results as passive checks to this Nagios URL " +
+          "instead of printing them"),
+    default=None
+)
+@click.option(
+    '--nrdp-token',
+    help="Token used to submit passive checks through NRDP",
+    default=None
+)
+@click.option(
+    '--nrdp-service',
+    help="Service name the passive check results are submitted for",
+    default='ApolloServer availability'
+)
 def main(
-    expected_channels: str,
+    expected_channels: Optional[int],
     warning: str,
     critical: str,
     warning_time: str,
@@ -66,8 +278,40 @@ def main(
     warning_count: str,
     critical_count: str,
     logfile: str,
-    log_level: Optional[str]
+    log_level: Optional[str],
+    batch_size: int,
+    connect_timeout: float,
+    read_timeout: float,
+    pool_size: int,
+    compression: bool,
+    transfer_perfdata: bool,
+    retries: int,
+    retry_backoff: float,
+    breaker_threshold: int,
+    breaker_reset: float,
+    breaker_file: Optional[str],
+    concurrency: int,
+    stream: bool,
+    typed: bool,
+    cache_dir: Optional[str],
+    cache_ttl: float,
+    cache_bucket: int,
+    stale_while_revalidate: bool,
+    max_stale: float,
+    state_dir: Optional[str],
+    overlap: float,
+    mask_file: Optional[str],
+    channels: Optional[str],
+    deadline: Optional[float],
+    deadline_state: str,
+    failed_state: str,
+    servers: Tuple[str, ...],
+    nrdp_url: Optional[str],
+    nrdp_token: Optional[str],
+    nrdp_service: str
 ):
+    # Start the time budget before anything else
+    check_deadline = Deadline(deadline)
 
     # Configure logging
     if logfile is not None:
@@ -82,87 +326,95 @@ def main(
             datefmt="%Y-%m-%d %H:%M:%S",
             level=log_level)
 
-    # Get the current time to use as the end_time of the availability query
-    # and to compare timestamps to for latency values
-    end_time = datetime.now()
-    start_time = end_time - timedelta(hours=1)
-    url = availability_health.assemble_availability_url(
-        'localhost', start_time, end_time)
-    logging.debug(f"API URL: {url}")
-    availability = availability_health.get_api_json(url)
-
-    # Get the channel_latency objects and list of unavailable channels
-    acquisition_statistics = \
-        availability_health.get_channel_availability(
-            availability=availability,
-            end_time=end_time,
-            server_url="localhost")
-
-    # Calculate percentage of channels that are available
-    percent = availability_health.check_availability_percentage(
-        available_channels=len(acquisition_statistics.channel_latency),
-        expected_channel_count=int(expected_channels))
-
-    logging.debug(f"Available channels: {percent}%")
-    logging.debug("Unvailable Channels: " +
-                  ', '.join(acquisition_statistics.unavailable_channels))
-
-    # Determine the state according to the percentage of available channels
-    state = acquisition_availability.get_state(
-        percentage=percent,
-        warn_threshold=warning,
-        crit_threshold=critical)
-
-    # Determine the state accoding to the latency thresholds
-    latency_results = availability_health.get_latency_threshold_state(
-        acquisition_statistics,
-        warn_time=warning_time,
-        crit_time=critical_time,
-        warn_threshold=warning_count,
-        crit_threshold=critical_count
-        )
-
-    # If the latency threshold state is higher than the available channel
-    # state, overwrite it
-    if latency_results.state > state:
-        state = latency_results.state
-
-    performances: List[NagiosPerformance] = []
-
-    performances.append(NagiosPerformance(
-        label='available',
-        value=percent,
-        uom='%',
-        warning=float(warning.strip(':')),
-        critical=float(critical.strip(':'))
-    ))
-    performances.append(NagiosPerformance(
-        label='critical_count',
-        value=latency_results.crit_count,
-        critical=float(critical_count)
-    ))
-    performances.append(NagiosPerformance(
-        label='warning_count',
-        value=latency_results.warn_count,
-        warning=float(warning_count)
-    ))
-
-    details = availability_health.assemble_details(
-        acquisition_statistics=acquisition_statistics,
+    try:
+        apollo_servers = [parse_server(server) for server in servers]
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--server')
+
+    for server in apollo_servers:
+        if server.expected_channels is None and expected_channels is None:
+            raise click.UsageError(
+                f"No expected channel count for {server}, specify " +
+                "--expected-channels or --server host[:port]=count")
+
+    if nrdp_url is not None and nrdp_token is None:
+        raise click.UsageError('--nrdp-token is required with --nrdp-url')
+
+    if channels is not None:
+        try:
+            compile_channel_selection(channels)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--channels')
+
+    session = api_client.configure_default_session(
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        pool_size=max(pool_size, concurrency),
+        retry=resilience.RetryPolicy(
+            retries=retries,
+            backoff=retry_backoff),
+        breaker=resilience.CircuitBreaker(
+            state_file=breaker_file,
+            failure_threshold=breaker_threshold,
+            reset_timeout=breaker_reset),
+        compression=compression)
+
+    options = ApolloCheckOptions(
+        expected_channels=expected_channels,
+        warning=warning,
+        critical=critical,
         warning_time=warning_time,
-        critical_time=critical_time
+        critical_time=critical_time,
+        warning_count=warning_count,
+        critical_count=critical_count,
+        batch_size=batch_size,
+        concurrency=concurrency,
+        stream=stream,
+        typed=typed,
+        cache_dir=cache_dir,
+        cache_ttl=cache_ttl,
+        cache_bucket=cache_bucket,
+        stale_while_revalidate=stale_while_revalidate,
+        max_stale=max_stale,
+        state_dir=state_dir,
+        overlap=overlap,
+        deadline_state=NagiosOutputCode[deadline_state],
+        failed_state=NagiosOutputCode[failed_state],
+        transfer_perfdata=transfer_perfdata,
+        mask_file=mask_file,
+        channels=channels
     )
 
-    message = acquisition_availability.assemble_message(
-        state=state,
-        percentage=percent,
-        performances=performances,
-        details=details
-        )
+    results = check_apollo_servers(
+        servers=apollo_servers,
+        options=options,
+        session=session,
+        deadline=check_deadline
+    )
+
+    session.log_statistics()
 
-    print(message)
+    # Submit the results as passive checks, one per server. The token was
+    # checked along with the other arguments
+    if nrdp_url is not None and nrdp_token is not None:
+        check_results = nrdp.NagiosCheckResults()
+        for server, result in results:
+            check_results.append(nrdp.NagiosCheckResult(
+                hostname=server.server_url,
+                servicename=nrdp_service,
+                state=result.status.value,
+                output=str(result)))
+        nrdp.submit(check_results, nrdp_url, nrdp_token)
+        print(f"OK: Submitted {len(check_results)} check results")
+        sys.exit(NagiosOutputCode.ok.value)
+
+    if len(results) == 1:
+        print(results[0][1])
+    else:
+        for server, result in results:
+            print(f"{server}: {result}\n")
 
-    sys.exit(state.value)
+    sys.exit(max(result.status for _, result in results).value)
 
 
 if __name__ == '__main__':
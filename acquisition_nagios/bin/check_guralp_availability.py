@@ -1,15 +1,24 @@
 import logging
 from pathlib import Path
 from acquisition_nagios.guralpdatacenter.guralp_availability import \
-    assemble_details, get_masked_channels
+    assemble_details
 from acquisition_nagios.guralpdatacenter import guralp_availability
 from acquisition_nagios import acquisition_availability
 import sys
 from datetime import datetime
 import click
+from acquisition_nagios.channel_mask import compile_channel_selection, \
+    load_channel_mask
 from acquisition_nagios.config import LogLevels
 from typing import Optional, List
-from acquisition_nagios.nagios.models import NagiosPerformance
+from acquisition_nagios.deadline import Deadline, DeadlineExceeded
+from acquisition_nagios.guralpdatacenter.stat_cache import LatencyStatCache
+from acquisition_nagios.guralpdatacenter import watcher
+from acquisition_nagios.guralpdatacenter.inventory import \
+    DEFAULT_CHANNELS, DEFAULT_INVENTORY_TTL, DEFAULT_SLINKTOOL_TIMEOUT, \
+    InventoryCache, InventoryError
+from acquisition_nagios.nagios.models import NagiosOutputCode, \
+    NagiosPerformance, NagiosResult, NagiosVerbose
 
 
 @click.command()
@@ -67,9 +76,96 @@ from acquisition_nagios.nagios.models import NagiosPerformance
 )
 @click.option(
     '--mask-file',
-    help="File containing list of channels to ignore",
+    help=("File containing list of channels to ignore, one per line " +
+          "written as for --channels, such as LOG, CN.ABC*.*.HN? or " +
+          "CN.ABC01"),
     default=None
 )
+@click.option(
+    '--channels',
+    help=("The channels to check, as comma separated channel codes such " +
+          "as HH?,HN?, patterns such as CN.ABC*.*.HN? or stations such " +
+          "as CN.ABC01. Other channels " +
+          f"are ignored. Default: {DEFAULT_CHANNELS}"),
+    default=DEFAULT_CHANNELS
+)
+@click.option(
+    '--inventory-source',
+    type=click.Choice(list(guralp_availability.INVENTORY_SOURCES)),
+    help=("How the expected channels are listed: slinktool, or seedlink " +
+          "to request them from the SeedLink server without running " +
+          "slinktool. Default: slinktool"),
+    default='slinktool'
+)
+@click.option(
+    '--inventory-timeout',
+    '--slinktool-timeout',
+    'inventory_timeout',
+    type=float,
+    help=("Seconds after which listing the expected channels is " +
+          f"abandoned. Default: {DEFAULT_SLINKTOOL_TIMEOUT}"),
+    default=DEFAULT_SLINKTOOL_TIMEOUT
+)
+@click.option(
+    '--inventory-cache',
+    help=("File to keep the expected channels in between runs, so that " +
+          "they are only listed again once they expire. The last good " +
+          "list is used when listing fails. Disabled if not set"),
+    default=None
+)
+@click.option(
+    '--inventory-ttl',
+    type=float,
+    help=("Seconds during which the cached expected channels are used. " +
+          f"Default: {DEFAULT_INVENTORY_TTL}"),
+    default=DEFAULT_INVENTORY_TTL
+)
+@click.option(
+    '--workers',
+    type=click.IntRange(min=1),
+    help=("The number of latency files read at the same time. Default: " +
+          f"{guralp_availability.DEFAULT_READ_WORKERS}"),
+    default=guralp_availability.DEFAULT_READ_WORKERS
+)
+@click.option(
+    '--stat-cache',
+    help=("File to keep the last record of each latency file in between " +
+          "runs, so that files that did not change are not read again. " +
+          "Disabled if not set"),
+    default=None
+)
+@click.option(
+    '--watcher-socket',
+    help=("Socket of a running guralp_latency_watcher to get the latency " +
+          "of the cache from, instead of reading its files. The cache is " +
+          "read if the watcher does not answer"),
+    default=None
+)
+@click.option(
+    '--deadline',
+    type=float,
+    help=("Seconds after which the check stops querying and reports the " +
+          "channels evaluated so far. Set it below the Nagios plugin " +
+          "timeout"),
+    default=None
+)
+@click.option(
+    '--deadline-state',
+    type=click.Choice([code.name for code in NagiosOutputCode]),
+    help=("How channels not evaluated before the deadline count: ok " +
+          "ignores them, warning and critical count them as channels " +
+          "above that latency, unknown makes the result UNKNOWN. Channels " +
+          "whose latency could not be retrieved count as set by " +
+          "--failed-state"),
+    default=NagiosOutputCode.unknown.name
+)
+@click.option(
+    '--failed-state',
+    type=click.Choice([code.name for code in NagiosOutputCode]),
+    help=("How channels whose latency could not be retrieved count, as " +
+          "for --deadline-state"),
+    default=NagiosOutputCode.critical.name
+)
 def main(
     warning: str,
     critical: str,
@@ -81,8 +177,22 @@ def main(
     log_level: Optional[str],
     cache_folder: str,
     archive_folder: str,
-    mask_file: Optional[str]
+    mask_file: Optional[str],
+    channels: str,
+    inventory_source: str,
+    inventory_timeout: float,
+    inventory_cache: Optional[str],
+    inventory_ttl: float,
+    workers: int,
+    stat_cache: Optional[str],
+    watcher_socket: Optional[str],
+    deadline: Optional[float],
+    deadline_state: str,
+    failed_state: str
 ):
+    # Start the time budget before anything else
+    check_deadline = Deadline(deadline)
+
     # Configure logging
     if logfile is not None:
         logging.basicConfig(
@@ -96,43 +206,84 @@ def main(
             datefmt="%Y-%m-%d %H:%M:%S",
             level=log_level)
 
+    try:
+        compile_channel_selection(channels)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--channels')
+
     # Use the current time to compare to channel timestamps
     end_time = datetime.now()
 
-    expected_channels = guralp_availability.get_expected_channels()
+    try:
+        expected_channels = guralp_availability.get_expected_channels(
+            deadline=check_deadline,
+            timeout=inventory_timeout,
+            inventory_cache=(InventoryCache(inventory_cache, inventory_ttl)
+                             if inventory_cache is not None else None),
+            source=inventory_source,
+            channels=channels)
+    except (DeadlineExceeded, InventoryError, OSError) as e:
+        print(NagiosResult(
+            summary=f'UNKNOWN: {e}',
+            verbose=NagiosVerbose.multiline,
+            status=NagiosOutputCode.unknown))
+        sys.exit(NagiosOutputCode.unknown.value)
 
     logging.debug(f"Expected channels: {expected_channels}")
 
     if mask_file is not None:
-        masked_channels = get_masked_channels(mask_file=Path(mask_file))
-        logging.debug(f"Masked channels: {masked_channels}")
         # Remove masked channels from expected channels
-
-        new_expected_channels: List[str] = []
-
-        for item in expected_channels:
-            if item not in masked_channels:
-                new_expected_channels.append(item)
-
-        expected_channels = new_expected_channels
+        expected_channels = load_channel_mask(mask_file).filter(
+            expected_channels)
         logging.debug(
             f"Expected channels without masked channels: {expected_channels}")
 
+    latency_cache: Optional[LatencyStatCache] = None
+    if stat_cache is not None:
+        latency_cache = LatencyStatCache(stat_cache)
+
+    watcher_table = None
+    if watcher_socket is not None:
+        try:
+            watcher_table = watcher.query_watcher(
+                watcher_socket,
+                latency_dir=Path(cache_folder).joinpath('latency'),
+                timeout=check_deadline.timeout(
+                    watcher.DEFAULT_QUERY_TIMEOUT))
+        except (OSError, ValueError) as e:
+            logging.warning(
+                f"Latency watcher unavailable, reading the cache: {e}")
+
     # Get the last timestamp and latency values for all the channels available
     # in the cache folder
     acquisition_statistics = guralp_availability.get_channel_latency(
         cache_folder=cache_folder,
         archive_folder=archive_folder,
         time=end_time,
-        expected_channels=expected_channels
+        expected_channels=expected_channels,
+        deadline=check_deadline,
+        stat_cache=latency_cache,
+        watcher_table=watcher_table,
+        workers=workers
     )
 
+    if latency_cache is not None:
+        try:
+            latency_cache.save()
+        except OSError as e:
+            logging.warning(f"Could not save the latency cache: {e}")
+
+    unevaluated = len(acquisition_statistics.unevaluated_channels)
+
     # Determine the percentage expected channels that have latency files in
-    # the cache
-    percent_available = guralp_availability.check_availability(
-        expected_channels=len(expected_channels),
-        found_channels=len(acquisition_statistics.channel_latency)
-    )
+    # the cache. Channels not looked up before the deadline are given the
+    # benefit of the doubt, and those with an unreadable latency file have
+    # one, as with the ApolloServer check
+    percent_available = \
+        acquisition_statistics.to_columnar().availability_percentage(
+            expected_channel_count=len(expected_channels),
+            failed=len(acquisition_statistics.failed_channels),
+            unevaluated=unevaluated)
 
     # Determine the state based on this percentage
     state = acquisition_availability.get_state(
@@ -145,7 +296,9 @@ def main(
         warn_time=warning_time,
         crit_time=critical_time,
         warn_threshold=warning_count,
-        crit_threshold=critical_count
+        crit_threshold=critical_count,
+        unevaluated_state=NagiosOutputCode[deadline_state],
+        failed_state=NagiosOutputCode[failed_state]
     )
 
     if latency_results.state > state:
@@ -170,6 +323,11 @@ def main(
         value=latency_results.warn_count,
         warning=float(warning_count)
     ))
+    if check_deadline.is_set:
+        performances.append(NagiosPerformance(
+            label='unevaluated',
+            value=unevaluated
+        ))
 
     details = assemble_details(
         acquisition_statistics=acquisition_statistics,
@@ -181,7 +339,8 @@ def main(
         state=state,
         percentage=percent_available,
         performances=performances,
-        details=details
+        details=details,
+        unevaluated=unevaluated
     )
 
     print(message)
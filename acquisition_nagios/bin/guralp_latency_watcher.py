@@ -0,0 +1,70 @@
+import logging
+from pathlib import Path
+import signal
+import sys
+import threading
+import click
+from acquisition_nagios.config import LogLevels
+from acquisition_nagios.guralpdatacenter.watcher import DEFAULT_SOCKET, \
+    LatencyWatcher, WatcherServer
+
+
+@click.command()
+@click.option(
+    '--cache-folder',
+    help="Guralp cache folder",
+    default='/var/cache/guralp'
+)
+@click.option(
+    '--socket',
+    help="Unix socket to serve the latency of the cache on",
+    default=DEFAULT_SOCKET
+)
+@click.option(
+    '--logfile',
+    default=None,
+    help='To log to a file instead of stdout, specify the filename.',
+)
+@click.option(
+    '--log-level',
+    type=click.Choice([v.value for v in LogLevels]),
+    help="Log more information about the program's execution",
+    default=LogLevels.INFO.value
+)
+def main(
+    cache_folder: str,
+    socket: str,
+    logfile: str,
+    log_level: str
+):
+    '''
+    Follow the latency files of the Guralp Datacenter cache with inotify and
+    serve the last record of each to check_guralp_availability
+    '''
+    logging.basicConfig(
+        format='%(asctime)s:%(levelname)s:%(message)s',
+        datefmt="%Y-%m-%d %H:%M:%S",
+        level=log_level,
+        filename=logfile)
+
+    watcher = LatencyWatcher(Path(cache_folder).joinpath('latency'))
+    server = WatcherServer(socket, watcher)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Serving latency on {socket}")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    try:
+        watcher.watch(stop)
+    except OSError as e:
+        logging.error(f"Stopped watching: {e}")
+        sys.exit(1)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
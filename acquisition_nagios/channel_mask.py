@@ -0,0 +1,277 @@
+'''
+Channel masks and selections shared by the ApolloServer and Guralp
+Datacenter checks
+
+Masks and selections read their entries the same way. Each entry is either a
+channel code such as HH?, standing for that channel at every station, or a
+channel of the format NN.SSSSS.LL.CCC, exactly or with SEED wildcards in any
+component: * matches any characters and ? a single one, for example
+CN.ABC*.*.HN? stands for the HN channels of every station of CN starting
+with ABC. Missing trailing components match anything, with or without
+wildcards, so CN.ABC01 stands for every channel of that station.
+
+A mask file lists the channels to ignore, one entry per line. Empty lines
+and lines starting with # are ignored. A selection lists the channels to
+check instead, as an expression of comma separated entries.
+
+Channel codes are looked up in a set, or matched with a single regular
+expression if they hold wildcards, without splitting the channel. Exact
+channels are kept in a set. Patterns are compiled per component and grouped
+by network, so a channel is only compared to the patterns of its own network
+and those with a wildcard network.
+
+Masks are compiled once per process by load_channel_mask, and again only
+when the file is modified.
+'''
+import fnmatch
+import functools
+import logging
+from pathlib import Path
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Pattern, Set, Tuple, Union
+
+
+# Characters that make an entry a pattern instead of an exact channel
+WILDCARDS = ('*', '?', '[')
+
+_COMPONENTS = 4
+
+# A compiled component, None if it matches anything
+ComponentMatcher = Optional[Pattern[str]]
+
+
+def is_pattern(
+    entry: str
+) -> bool:
+    return any(wildcard in entry for wildcard in WILDCARDS)
+
+
+def compile_component(
+    component: str
+) -> ComponentMatcher:
+    if component == '*':
+        return None
+    return re.compile(fnmatch.translate(component))
+
+
+class ChannelPatterns(object):
+    '''
+    Compiled set of channel codes, exact channels and channel patterns
+
+    Use channel in patterns to know whether a channel is in the set.
+    '''
+    def __init__(
+        self,
+        entries: Iterable[str] = ()
+    ):
+        '''
+        Parameters
+        ----------
+        entries: Iterable[str]
+            Channel codes, exact channels or patterns, such as the lines of a
+            mask file
+        '''
+        self.codes: Set[str] = set()
+        self._code_patterns: List[str] = []
+        self._code_pattern: Optional[Pattern[str]] = None
+        self.exact: Set[str] = set()
+        # Compiled patterns by network, None for patterns with a wildcard
+        # network
+        self._patterns: Dict[
+            Optional[str], List[Tuple[ComponentMatcher, ...]]] = {}
+        self.pattern_count = 0
+
+        for entry in entries:
+            self.add(entry)
+
+    @property
+    def code_pattern_count(self) -> int:
+        return len(self._code_patterns)
+
+    def add(
+        self,
+        entry: str
+    ) -> None:
+        entry = entry.strip()
+        if entry == '' or entry.startswith('#'):
+            return
+
+        if '.' not in entry:
+            if is_pattern(entry):
+                self._code_patterns.append(fnmatch.translate(entry))
+                self._code_pattern = re.compile(
+                    '|'.join(self._code_patterns))
+            else:
+                self.codes.add(entry)
+            return
+
+        components = entry.split('.')
+        if len(components) > _COMPONENTS:
+            logging.warning(f"Ignoring invalid channel pattern {entry}")
+            return
+        if len(components) == _COMPONENTS and not is_pattern(entry):
+            self.exact.add(entry)
+            return
+        # Partial channels stand for every channel of their network,
+        # station or location
+        components += ['*'] * (_COMPONENTS - len(components))
+
+        network: Optional[str] = components[0]
+        if is_pattern(components[0]):
+            network = None
+        self._patterns.setdefault(network, []).append(
+            tuple(compile_component(component) for component in components))
+        self.pattern_count += 1
+
+    def __contains__(
+        self,
+        channel: object
+    ) -> bool:
+        if not isinstance(channel, str):
+            return False
+        if channel in self.exact:
+            return True
+
+        code = channel[channel.rfind('.') + 1:]
+        if code in self.codes:
+            return True
+        if self._code_pattern is not None and self._code_pattern.match(code):
+            return True
+        if self.pattern_count == 0:
+            return False
+
+        components = channel.split('.')
+        if len(components) != _COMPONENTS:
+            return False
+
+        for network in (components[0], None):
+            for pattern in self._patterns.get(network, ()):
+                if all(matcher is None or matcher.match(component)
+                       for matcher, component in zip(pattern, components)):
+                    return True
+        return False
+
+    def __len__(self) -> int:
+        return (len(self.codes) + self.code_pattern_count +
+                len(self.exact) + self.pattern_count)
+
+
+class ChannelMask(ChannelPatterns):
+    '''
+    Compiled set of masked channels
+
+    Use channel in mask to know whether a channel is masked.
+    '''
+    def allows(
+        self,
+        channel: str
+    ) -> bool:
+        '''
+        Whether a channel is not masked
+        '''
+        return channel not in self
+
+    def filter(
+        self,
+        channels: Iterable[str]
+    ) -> List[str]:
+        '''
+        The channels that are not masked, in the same order
+        '''
+        return [channel for channel in channels if channel not in self]
+
+
+class ChannelSelection(ChannelPatterns):
+    '''
+    Compiled selection of the channels to check
+    '''
+    def __init__(
+        self,
+        expression: str
+    ):
+        '''
+        Parameters
+        ----------
+        expression: str
+            Comma separated channel codes or patterns, such as HH?,HN?
+
+        Raises
+        ------
+        ValueError: If an entry has more than the four components of a
+        channel
+        '''
+        self.expression = expression
+        entries = [entry.strip() for entry in expression.split(',')]
+        for entry in entries:
+            if len(entry.split('.')) > _COMPONENTS:
+                raise ValueError(f"Invalid channel selection {entry}")
+
+        super().__init__(entries)
+
+    def __str__(self) -> str:
+        return self.expression
+
+    def select(
+        self,
+        channels: Iterable[str]
+    ) -> List[str]:
+        '''
+        The selected channels, in the same order
+        '''
+        return [channel for channel in channels if channel in self]
+
+
+@functools.lru_cache(maxsize=None)
+def compile_channel_selection(
+    expression: str
+) -> ChannelSelection:
+    '''
+    Get the compiled selection of an expression, compiled once per process
+    '''
+    return ChannelSelection(expression)
+
+
+# Compiled masks by file, with the modification time and size they were
+# compiled at
+_masks: Dict[Path, Tuple[Tuple[int, int], ChannelMask]] = {}
+_masks_lock = threading.Lock()
+
+
+def load_channel_mask(
+    mask_file: Union[str, Path]
+) -> ChannelMask:
+    '''
+    Get the compiled mask of a mask file, compiling it again only when the
+    file was modified since it was last loaded
+
+    Returns
+    -------
+    ChannelMask: The mask, empty if the file does not exist
+
+    Raises
+    ------
+    OSError: If the file can not be read
+    '''
+    path = Path(mask_file)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        logging.warning(f"Could not find mask file {path}")
+        return ChannelMask()
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _masks_lock:
+        cached = _masks.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        mask = ChannelMask(f)
+    logging.debug(
+        f"Loaded {len(mask.exact)} masked channels and " +
+        f"{mask.pattern_count} patterns from {path}")
+
+    with _masks_lock:
+        _masks[path] = (signature, mask)
+    return mask
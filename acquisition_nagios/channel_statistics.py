@@ -0,0 +1,190 @@
+'''
+Columnar channel statistics shared by the ApolloServer and Guralp
+Datacenter checks
+
+Channel names, arrival timestamps and latencies are held in parallel arrays
+so that threshold counting, availability and stale detection are computed
+with vectorized operations instead of looping over each channel.
+'''
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Iterable, List, Tuple
+import numpy as np
+from acquisition_nagios.acquisition_availability import LatencyCheckResults
+from acquisition_nagios.nagios.models import NagiosOutputCode, NagiosRange
+from acquisition_nagios.timestamps import datetimes_to_epoch
+
+
+def to_epoch(
+    time: datetime
+) -> float:
+    '''
+    Seconds between 1970-01-01 and a naive datetime, in the same time
+    reference as the datetime
+    '''
+    return float(datetimes_to_epoch([time])[0])
+
+
+@dataclass
+class ColumnarStatistics:
+    channels: np.ndarray
+    # Arrival time of the last data of each channel, see to_epoch
+    timestamps: np.ndarray
+    # Latency of each channel in seconds
+    latencies: np.ndarray
+    unavailable_channels: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_channel_latency(
+        cls,
+        channel_latency: Iterable[Any],
+        unavailable_channels: Iterable[str] = ()
+    ) -> 'ColumnarStatistics':
+        '''
+        Build columnar statistics from the ChannelLatency objects of either
+        backend
+
+        Parameters
+        ----------
+        channel_latency: Iterable[ChannelLatency]
+            Objects with channel, timestamp and latency attributes
+
+        unavailable_channels: Iterable[str]
+            Channels without latency information
+        '''
+        channel_latency = list(channel_latency)
+        count = len(channel_latency)
+        return cls(
+            channels=np.array(
+                [stats.channel for stats in channel_latency], dtype=str),
+            timestamps=datetimes_to_epoch(
+                stats.timestamp for stats in channel_latency),
+            latencies=np.fromiter(
+                (stats.latency for stats in channel_latency),
+                dtype=np.float64, count=count),
+            unavailable_channels=list(unavailable_channels))
+
+    def __len__(self) -> int:
+        return len(self.channels)
+
+    def threshold_masks(
+        self,
+        warn_time: str,
+        crit_time: str
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Determine which channels have a latency in the critical range, and
+        which are only in the warning range
+
+        Returns
+        -------
+        np.ndarray: Boolean mask of channels with a critical latency
+
+        np.ndarray: Boolean mask of channels with a warning latency that are
+        not critical
+        '''
+        critical = NagiosRange(crit_time).in_range_array(self.latencies)
+        warning = ~critical & \
+            NagiosRange(warn_time).in_range_array(self.latencies)
+        return critical, warning
+
+    def count_thresholds(
+        self,
+        warn_time: str,
+        crit_time: str
+    ) -> Tuple[int, int]:
+        '''
+        Count the channels with a latency in the critical range, and those
+        only in the warning range
+
+        Returns
+        -------
+        int: The number of critical channels
+
+        int: The number of warning channels
+        '''
+        critical, warning = self.threshold_masks(warn_time, crit_time)
+        return int(np.count_nonzero(critical)), int(np.count_nonzero(warning))
+
+    def latency_threshold_state(
+        self,
+        warn_time: str,
+        crit_time: str,
+        warn_threshold: str,
+        crit_threshold: str,
+        unevaluated: int = 0,
+        unevaluated_state: NagiosOutputCode = NagiosOutputCode.ok,
+        failed: int = 0,
+        failed_state: NagiosOutputCode = NagiosOutputCode.critical
+    ) -> LatencyCheckResults:
+        '''
+        Get a set of Nagios check results based on the provided latency
+        thresholds, critical channels counting towards the warning threshold
+
+        Parameters
+        ----------
+        unevaluated: int
+            The number of channels whose latency was not evaluated
+
+        unevaluated_state: NagiosOutputCode
+            How the unevaluated channels count: not at all if ok, as warning
+            or critical channels, or making the state unknown
+
+        failed: int
+            The number of channels whose latency could not be retrieved
+
+        failed_state: NagiosOutputCode
+            How the failed channels count, as for unevaluated_state
+        '''
+        crit_count, warn_count = self.count_thresholds(warn_time, crit_time)
+        unknown = False
+
+        for count, count_state in ((unevaluated, unevaluated_state),
+                                   (failed, failed_state)):
+            if count_state == NagiosOutputCode.critical:
+                crit_count += count
+            elif count_state == NagiosOutputCode.warning:
+                warn_count += count
+            elif count_state == NagiosOutputCode.unknown and count > 0:
+                unknown = True
+
+        if NagiosRange(crit_threshold).in_range(crit_count):
+            state = NagiosOutputCode.critical
+        elif NagiosRange(warn_threshold).in_range(warn_count + crit_count):
+            state = NagiosOutputCode.warning
+        else:
+            state = NagiosOutputCode.ok
+
+        if unknown:
+            state = NagiosOutputCode.unknown
+
+        return LatencyCheckResults(crit_count, warn_count, state)
+
+    def availability_percentage(
+        self,
+        expected_channel_count: int,
+        failed: int = 0,
+        unevaluated: int = 0
+    ) -> float:
+        '''
+        The percentage of expected channels that are available: those with
+        latency information, and those that have data but whose latency could
+        not be retrieved or was not evaluated before the deadline
+
+        Raises
+        ------
+        ZeroDivisionError: If no channels are expected
+        '''
+        return (len(self) + failed + unevaluated) * 100 / \
+            expected_channel_count
+
+    def stale_mask(
+        self,
+        now: datetime,
+        max_age: float
+    ) -> np.ndarray:
+        '''
+        Boolean mask of the channels whose last data arrived more than
+        max_age seconds before now
+        '''
+        return self.timestamps < to_epoch(now) - max_age
@@ -0,0 +1,198 @@
+'''
+Time budget shared by the stages of a check
+
+Nagios kills a plugin that runs longer than its timeout, in which case no
+output is reported at all. A Deadline is created when the plugin starts and
+consulted by every stage that queries a server or scans files, so that the
+check stops early and reports the channels evaluated so far instead.
+'''
+from concurrent.futures import Future, wait
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, \
+    Tuple, TypeVar
+
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+# Seconds kept aside to compute and print the result once the fetch and scan
+# stages stop
+DEFAULT_RESERVE = 0.5
+
+
+class DeadlineExceeded(Exception):
+    '''
+    Raised when a stage can not start or finish within the remaining time
+    '''
+
+
+class Deadline(object):
+    '''
+    Remaining-time budget of a check
+
+    A Deadline without a budget never expires, so that stages can take one
+    unconditionally.
+    '''
+    def __init__(
+        self,
+        seconds: Optional[float] = None,
+        reserve: float = DEFAULT_RESERVE,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        '''
+        Parameters
+        ----------
+        seconds: Optional[float]
+            Seconds from now by which the check must report, no limit if None
+
+        reserve: float
+            Seconds before the deadline at which the stages stop, to leave
+            time to report the result
+
+        clock: Callable[[], float]
+            Monotonic clock in seconds
+        '''
+        self.seconds = seconds
+        self.reserve = reserve
+        self._clock = clock
+        self._start = clock()
+
+    @property
+    def is_set(self) -> bool:
+        return self.seconds is not None
+
+    def remaining(self) -> Optional[float]:
+        '''
+        Seconds left for the fetch and scan stages, None without a budget
+        '''
+        if self.seconds is None:
+            return None
+        elapsed = self._clock() - self._start
+        return max(self.seconds - self.reserve - elapsed, 0.0)
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def check(
+        self,
+        stage: str = 'check'
+    ) -> None:
+        '''
+        Raises
+        ------
+        DeadlineExceeded: If there is no time left to start the stage
+        '''
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline exceeded before {stage}")
+
+    def timeout(
+        self,
+        timeout: Optional[float]
+    ) -> Optional[float]:
+        '''
+        Clip a timeout to the remaining time
+        '''
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
+    def request_timeout(
+        self,
+        timeout: Tuple[float, float]
+    ) -> Tuple[float, float]:
+        '''
+        Clip the (connect, read) timeout of an HTTP request to the remaining
+        time. The read timeout applies between bytes, so a response that
+        trickles in can still overrun it
+        '''
+        connect, read = timeout
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return min(connect, remaining), min(read, remaining)
+
+    def iterate(
+        self,
+        items: Iterable[T],
+        stage: str = 'check'
+    ) -> Iterator[T]:
+        '''
+        Yield the items, checking the deadline before each one
+
+        Raises
+        ------
+        DeadlineExceeded: If the deadline passes before all items are consumed
+        '''
+        for item in items:
+            self.check(stage)
+            yield item
+
+
+def map_until_deadline(
+    function: Callable[[T], R],
+    items: Sequence[T],
+    workers: int,
+    deadline: Optional[Deadline] = None
+) -> List['Future[R]']:
+    '''
+    Call a function on each item in worker threads, until the deadline passes
+
+    The workers are daemon threads that nothing waits for. Threads of a
+    ThreadPoolExecutor are joined when the interpreter exits, so a call stuck
+    on an unresponsive file system would keep the plugin running after it
+    reported, until Nagios kills it.
+
+    Parameters
+    ----------
+    function: Callable[[T], R]
+        Called on each item
+
+    items: Sequence[T]
+        The items, taken in order by the workers
+
+    workers: int
+        The number of calls made at the same time
+
+    deadline: Optional[Deadline]
+        The time budget of the calls, waiting for all of them if None
+
+    Returns
+    -------
+    List[Future[R]]: The future of each item, in the order of the items.
+    Calls not made by the deadline are cancelled, and calls still running
+    are left running
+    '''
+    if deadline is None:
+        deadline = Deadline()
+
+    futures: List['Future[R]'] = [Future() for _ in items]
+    pending = iter(list(zip(items, futures)))
+    lock = threading.Lock()
+
+    def work() -> None:
+        while True:
+            with lock:
+                try:
+                    item, future = next(pending)
+                except StopIteration:
+                    return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(item))
+            except Exception as e:
+                future.set_exception(e)
+
+    for _ in range(min(workers, len(futures))):
+        threading.Thread(target=work, daemon=True).start()
+
+    _, not_done = wait(futures, timeout=deadline.timeout(None))
+    for future in not_done:
+        future.cancel()
+
+    return futures
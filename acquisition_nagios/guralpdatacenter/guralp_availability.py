@@ -1,39 +1,65 @@
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 import pathlib
 import logging
-from dataclasses import dataclass
-from acquisition_nagios.nagios.models import NagiosRange, NagiosOutputCode
+from dataclasses import dataclass, field
 from acquisition_nagios.acquisition_availability import LatencyCheckResults
-from subprocess import Popen, PIPE
-
-
-@dataclass
-class ChannelLatency:
-    channel: str
-    timestamp: datetime
-    latency: float
-
-    def __str__(self):
-        latency = self.latency
-        age = round((datetime.now() - self.timestamp).total_seconds(), 2)
-        return (f"{self.channel}, arrived {age}s ago arrived with" +
-                f" {round(latency, 2)}s latency")
+from acquisition_nagios.timestamps import parse_guralp_timestamp
+from acquisition_nagios.channel_statistics import ColumnarStatistics
+from acquisition_nagios.channel_mask import compile_channel_selection
+from acquisition_nagios.deadline import Deadline, map_until_deadline
+from acquisition_nagios.guralpdatacenter.inventory import DEFAULT_CHANNELS, \
+    DEFAULT_SLINKTOOL_TIMEOUT, InventoryCache, query_slinktool
+from acquisition_nagios.guralpdatacenter.seedlink import query_seedlink
+from acquisition_nagios.guralpdatacenter.latency_index import ArchiveIndex, \
+    LatencyFileKey, channel_key, index_latency_directory
+from acquisition_nagios.guralpdatacenter.models import ChannelLatency
+from acquisition_nagios.guralpdatacenter.stat_cache import LatencyStatCache
+from acquisition_nagios.guralpdatacenter.tail import read_last_record
+from acquisition_nagios.nagios.models import NagiosOutputCode
+
+
+# Latency files read at the same time, enough to hide the latency of a
+# network file system
+DEFAULT_READ_WORKERS = 8
+
+# Seconds since their last data after which channels are reported as stale
+STALE_AGE = 3600.0
+
+# Ways of listing the channels of the SeedLink server, by name
+INVENTORY_SOURCES: Dict[str, Callable[..., List[str]]] = {
+    'slinktool': query_slinktool,
+    'seedlink': query_seedlink
+}
 
 
 @dataclass
 class AcquisitionStatistics:
     channel_latency: List[ChannelLatency]
     unavailable_channels: List[str]
+    # Channels not looked up before the deadline
+    unevaluated_channels: List[str] = field(default_factory=list)
+    # Error reading the latency file of each channel that has an unreadable
+    # one
+    failed_channels: Dict[str, str] = field(default_factory=dict)
+
+    def to_columnar(self) -> ColumnarStatistics:
+        return ColumnarStatistics.from_channel_latency(
+            self.channel_latency, self.unavailable_channels)
 
 
 def get_expected_channels(
     gdc_address: str = "localhost",
-    seedlink_port: str = "18000"
+    seedlink_port: str = "18000",
+    deadline: Optional[Deadline] = None,
+    timeout: Optional[float] = DEFAULT_SLINKTOOL_TIMEOUT,
+    inventory_cache: Optional[InventoryCache] = None,
+    source: str = 'slinktool',
+    channels: str = DEFAULT_CHANNELS
 ) -> List[str]:
     '''
-    Returns a list of channels that the acquisition server is expecting using
-    slinktool
+    Returns a list of channels that the acquisition server is expecting, as
+    listed by its SeedLink server
 
     Parameters
     ----------
@@ -45,42 +71,65 @@ def get_expected_channels(
     seedlink_port: str
         The port that the seedlink server is hosted on. Default: 18000
 
+    deadline: Optional[Deadline]
+        The time budget of the check, listing is abandoned when it passes
+
+    timeout: Optional[float]
+        Seconds after which listing is abandoned, no limit if None
+
+    inventory_cache: Optional[InventoryCache]
+        Cache of the channels, listed again only once they expire. The last
+        good inventory is returned if listing fails
+
+    source: str
+        How the channels are listed, one of INVENTORY_SOURCES: slinktool,
+        or seedlink to request them from the SeedLink server directly
+
+    channels: str
+        The channels to check, as comma separated channel codes or
+        patterns, see channel_mask.ChannelSelection. Others are left out
+        while listing, before their latency files are looked up
+
     Returns: List[str]
         List of expected channels, in the format NN.SSSSS.LL.CCC
-    '''
 
-    # Use -Q option with slinktool to get a list of each individual channel
-    cmd = ['slinktool', '-Q', f"{gdc_address}:{seedlink_port}"]
-    process = Popen(cmd, stdout=PIPE, stderr=PIPE)
-    stdout, stderr = process.communicate()
+    Raises
+    ------
+    DeadlineExceeded: If listing does not finish before the deadline
 
-    # Log any error using slinktool
-    if stderr != b'':
-        logging.error(f"Slinktool error: {stderr.decode('utf-8')}")
+    InventoryError: If listing fails or does not finish within the timeout
 
-    # Decode and split the stdout lines
-    outlines = stdout.decode('utf-8').split('\n')
+    OSError: If slinktool can not be run, or the SeedLink server can not be
+    reached
+    '''
+    query = INVENTORY_SOURCES[source]
+    selection = compile_channel_selection(channels)
 
-    expected_channels: List = []
+    def fetch() -> List[str]:
+        return query(
+            gdc_address=gdc_address,
+            seedlink_port=seedlink_port,
+            deadline=deadline,
+            timeout=timeout,
+            selection=selection)
 
-    for line in outlines:
-        line_parts = line.split(' ')
+    if inventory_cache is None:
+        return fetch()
 
-        # Less than 3 parts means that an entire SNCL is not present
-        if len(line_parts) > 3:
-            # Only record channel names for seismic data
-            if line_parts[3] in ['HNZ', 'HNN', 'HNE', 'HHZ', 'HHN', 'HHE']:
-                channel = (f"{line_parts[0]}.{line_parts[1]}.{line_parts[2]}" +
-                           f".{line_parts[3]}")
-                expected_channels.append(channel)
-    return expected_channels
+    # Inventories of another selection of channels are not used
+    return inventory_cache.get(
+        f"{gdc_address}:{seedlink_port} {selection}", fetch)
 
 
 def get_channel_latency(
     cache_folder: str,
     archive_folder: str,
     time: datetime,
-    expected_channels: List[str]
+    expected_channels: List[str],
+    deadline: Optional[Deadline] = None,
+    stat_cache: Optional[LatencyStatCache] = None,
+    watcher_table: Optional[Dict[LatencyFileKey, ChannelLatency]] = None,
+    workers: int = 1
 ) -> AcquisitionStatistics:
     '''
     Parameters
@@ -98,6 +147,22 @@ def get_channel_latency(
     expected_channels: List
         List of channels expected to be available
 
+    deadline: Optional[Deadline]
+        The time budget of the check. Channels not looked up before it passes
+        are reported in unevaluated_channels
+
+    stat_cache: Optional[LatencyStatCache]
+        Cache of the last record of latency files, files that did not change
+        since they were cached are not read again
+
+    watcher_table: Optional[Dict[LatencyFileKey, ChannelLatency]]
+        The last record of each file of the cache, as served by the latency
+        watcher. Replaces reading the cache when provided
+
+    workers: int
+        The number of latency files read at the same time, see
+        read_latency_files
+
     Returns
     -------
     AcquisitionStatistics
@@ -105,10 +170,13 @@ def get_channel_latency(
     '''
 
     # Use year and jday from current time to ensure that old files aren't read
-    year = time.year
+    year = str(time.year)
     jday = time.strftime('%-j')
 
-    channel_latency: List[ChannelLatency] = []
+    # Latency of the channels, and the files to read it from
+    found: Dict[str, ChannelLatency] = {}
+
+    latency_files: List[Tuple[str, pathlib.Path]] = []
 
     # Determine the path to the latency subdirectory in the cache and archive
     cache_path = pathlib.Path(cache_folder).joinpath('latency')
@@ -117,49 +185,180 @@ def get_channel_latency(
 
     missing_channels: List[str] = []
 
-    for channel in expected_channels:
+    unevaluated_channels: List[str] = []
 
-        channel_parts = channel.split('.')
+    if deadline is None:
+        deadline = Deadline()
 
-        net = channel_parts[0]
-        sta = channel_parts[1]
-        loc = channel_parts[2]
-        cha = channel_parts[3]
+    # List the cache once rather than searching it for each channel, unless
+    # the watcher already followed it
+    cache_index = index_latency_directory(cache_path) \
+        if watcher_table is None else {}
 
-        # Search for a latency file for the channel in the cache
-        latency_files = list(cache_path.glob(
-            f"{net}_{sta}_{loc}_{cha}_{year}_{jday}.csv"))
+    # The last 6 days of the long-term archive, most recent first, listed
+    # once for all channels missing from the cache
+    archive_index = ArchiveIndex(archive_path)
+    archive_days = [(time - timedelta(days=days)).date()
+                    for days in range(1, 7)]
 
-        if len(latency_files) < 1:
+    # Find the latency file of every channel before reading any
+    for index, channel in enumerate(expected_channels):
 
-            # Loop through the last 7 days of the long-term archive
-            working_date = time - timedelta(days=1)
+        key = channel_key(channel, year, jday)
 
-            end_date = time - timedelta(days=7)
+        if watcher_table is not None and key in watcher_table:
+            found[channel] = watcher_table[key]
+            continue
 
-            while working_date > end_date:
-                latency_files = list(archive_path.glob(
-                    (working_date.strftime('%Y/%m/%d') +
-                     f"/{net}_{sta}_{loc}_{cha}_*_*.csv")))
+        # Look up the latency file of the channel in the cache
+        latency_file = cache_index.get(key)
 
-                # Stop looping if a latency file is found
-                if len(latency_files) > 0:
-                    break
-                else:
-                    working_date = working_date - timedelta(days=1)
+        if latency_file is None:
+            # Search the archive for the most recent latency file
+            latency_file = archive_index.find(
+                channel, archive_days, deadline=deadline)
 
-        if len(latency_files) > 0:
-            channel_latency.append(
-                get_latencystatistics_of_last_row(
-                    csv_file=latency_files[0]))
+        if latency_file is not None:
+            latency_files.append((channel, latency_file))
+        # The archive search was cut short by the deadline
+        elif deadline.expired():
+            unevaluated_channels = expected_channels[index:]
+            break
         # If no latency file was found for the last 7 days, flag the channel
         # as misisng/unavailable
         else:
             missing_channels.append(channel)
 
+    read_results = read_latency_files(
+        latency_files=latency_files,
+        workers=workers,
+        stat_cache=stat_cache,
+        deadline=deadline)
+
+    found.update(read_results.latencies)
+
+    # Report channels in the order they are expected
+    unevaluated = set(unevaluated_channels).union(
+        read_results.unevaluated_channels)
+    channel_latency = [found[channel] for channel in expected_channels
+                       if channel in found]
+    unevaluated_channels = [channel for channel in expected_channels
+                            if channel in unevaluated]
+
+    if len(unevaluated_channels) > 0:
+        logging.warning(
+            f"Deadline reached, {len(unevaluated_channels)} channels not " +
+            "evaluated")
+
     return AcquisitionStatistics(
         channel_latency=channel_latency,
-        unavailable_channels=missing_channels)
+        unavailable_channels=missing_channels,
+        unevaluated_channels=unevaluated_channels,
+        failed_channels=read_results.failed_channels)
+
+
+@dataclass
+class LatencyReadResults:
+    # Latency of each channel whose file was read, in the order of the files
+    latencies: Dict[str, ChannelLatency] = field(default_factory=dict)
+    # Error reading the file of each channel that failed
+    failed_channels: Dict[str, str] = field(default_factory=dict)
+    # Channels whose file was not read before the deadline
+    unevaluated_channels: List[str] = field(default_factory=list)
+
+
+def _read_latency_file(
+    csv_file: pathlib.Path,
+    stat_cache: Optional[LatencyStatCache]
+) -> ChannelLatency:
+    if stat_cache is not None:
+        return stat_cache.get(csv_file, get_latencystatistics_of_last_row)
+    return get_latencystatistics_of_last_row(csv_file=csv_file)
+
+
+def read_latency_files(
+    latency_files: List[Tuple[str, pathlib.Path]],
+    workers: int = 1,
+    stat_cache: Optional[LatencyStatCache] = None,
+    deadline: Optional[Deadline] = None
+) -> LatencyReadResults:
+    '''
+    Read the last entry of the latency file of each channel
+
+    Parameters
+    ----------
+    latency_files: List[Tuple[str, pathlib.Path]]
+        The channels and their latency file
+
+    workers: int
+        The number of files read at the same time. Reading is bound by the
+        latency of each file on network file systems rather than by their
+        size, so reading several at once shortens the check
+
+    stat_cache: Optional[LatencyStatCache]
+        Cache of the last entry of latency files
+
+    deadline: Optional[Deadline]
+        The time budget of the check. Files not read before it passes are
+        reported in unevaluated_channels
+
+    Returns
+    -------
+    LatencyReadResults: The latency of each channel in the order of the
+    files, whatever the order they were read in. A file that can not be read
+    or parsed fails its channel only
+    '''
+    if workers < 1:
+        raise ValueError(f"Invalid number of workers {workers}")
+
+    budget = deadline if deadline is not None else Deadline()
+
+    results = LatencyReadResults()
+
+    def read(
+        csv_file: pathlib.Path
+    ) -> Tuple[Optional[ChannelLatency], Optional[str]]:
+        # Neither a latency nor an error if the deadline passed first
+        if budget.expired():
+            return None, None
+        try:
+            return _read_latency_file(csv_file, stat_cache), None
+        except (OSError, ValueError, IndexError) as e:
+            return None, str(e)
+
+    def record(
+        channel: str,
+        csv_file: pathlib.Path,
+        outcome: Tuple[Optional[ChannelLatency], Optional[str]]
+    ) -> None:
+        latency, error = outcome
+        if error is not None:
+            logging.warning(
+                f"Could not read latency of {channel} from {csv_file}: " +
+                error)
+            results.failed_channels[channel] = error
+        elif latency is None:
+            results.unevaluated_channels.append(channel)
+        else:
+            results.latencies[channel] = latency
+
+    if workers == 1:
+        for channel, csv_file in latency_files:
+            record(channel, csv_file, read(csv_file))
+        return results
+
+    # Reads stuck on an unresponsive file system are left behind at the
+    # deadline, without keeping the check from reporting and exiting
+    futures = map_until_deadline(
+        read, [csv_file for _, csv_file in latency_files], workers, budget)
+
+    for (channel, csv_file), future in zip(latency_files, futures):
+        if future.done() and not future.cancelled():
+            record(channel, csv_file, future.result())
+        else:
+            results.unevaluated_channels.append(channel)
+
+    return results
 
 
 def check_availability(
@@ -201,10 +400,41 @@ def get_latencystatistics_of_last_row(
     -------
     datetime: A datetime object representing the timestamp of the most recent
     entry in the csv file
+
+    Raises
+    ------
+    ValueError: If the file holds no complete entry
     '''
-    # Get the last line from the file
-    f = open(csv_file, "r", encoding="utf-8", errors="ignore")
-    last_line = f.readlines()[-1]
+    # Get the last complete line from the end of the file
+    last_record = read_last_record(csv_file)
+    if last_record is None:
+        raise ValueError(f"No complete latency entry in {csv_file}")
+
+    return parse_latency_record(last_record)
+
+
+def parse_latency_record(
+    record: bytes
+) -> ChannelLatency:
+    '''
+    Parse a line of a latency CSV file
+
+    Parameter
+    ---------
+    record: bytes
+        The line, without its line terminator
+
+    Returns
+    -------
+    ChannelLatency: The channel, arrival time and latency of the line
+
+    Raises
+    ------
+    ValueError: If the line is not a latency entry
+
+    IndexError: If the line has missing fields
+    '''
+    last_line = record.decode('utf-8', errors='ignore')
 
     # Break the line up
     line = last_line.split(',')
@@ -227,7 +457,7 @@ def get_latencystatistics_of_last_row(
     dat_lat = net_lat + (float(filltimeparts[0]) / float(filltimeparts[1]))
 
     # Assemble ChannelLatency object
-    timestamp = (datetime.strptime(time_string, "%Y/%m/%d %H:%M:%S.%f") +
+    timestamp = (parse_guralp_timestamp(time_string) +
                  timedelta(seconds=dat_lat))
 
     latency = dat_lat
@@ -240,7 +470,9 @@ def get_latency_threshold_state(
     warn_time: str,
     crit_time: str,
     warn_threshold: str,
-    crit_threshold: str
+    crit_threshold: str,
+    unevaluated_state: NagiosOutputCode = NagiosOutputCode.unknown,
+    failed_state: NagiosOutputCode = NagiosOutputCode.critical
 ) -> LatencyCheckResults:
     '''
     Get a set of Nagios check results based on the provided latency thresholds
@@ -266,6 +498,14 @@ def get_latency_threshold_state(
         The number of channels that need to fail the crit_time threshold to
         create a critical state
 
+    unevaluated_state: NagiosOutputCode
+        How the channels not evaluated before the deadline count: not at all
+        if ok, as warning or critical channels, or making the state unknown
+
+    failed_state: NagiosOutputCode
+        How the channels whose latency could not be retrieved count, as for
+        unevaluated_state
+
     Returns
     -------
     LatencyCheckResults:
@@ -274,29 +514,15 @@ def get_latency_threshold_state(
 
     '''
     # TODO: Handle channels with negative latency
-    crit_count = 0
-    warn_count = 0
-
-    # Count the channels within the critical and warning thresholds
-
-    for channel in acquisition_stats.channel_latency:
-        if NagiosRange(crit_time).in_range(channel.latency):
-            crit_count += 1
-        elif NagiosRange(warn_time).in_range(channel.latency):
-            warn_count += 1
-
-    # Channels that don't have latency statistics for the past hour should
-    # also count as critical
-
-    if NagiosRange(crit_threshold).in_range(crit_count):
-        state = NagiosOutputCode.critical
-    # Critical channels should also count towards the warning threshold
-    elif NagiosRange(warn_threshold).in_range((warn_count+crit_count)):
-        state = NagiosOutputCode.warning
-    else:
-        state = NagiosOutputCode.ok
-
-    return LatencyCheckResults(crit_count, warn_count, state)
+    return acquisition_stats.to_columnar().latency_threshold_state(
+        warn_time=warn_time,
+        crit_time=crit_time,
+        warn_threshold=warn_threshold,
+        crit_threshold=crit_threshold,
+        unevaluated=len(acquisition_stats.unevaluated_channels),
+        unevaluated_state=unevaluated_state,
+        failed=len(acquisition_stats.failed_channels),
+        failed_state=failed_state)
 
 
 def assemble_details(
@@ -337,6 +563,19 @@ def assemble_details(
     for missing_channel in acquisition_statistics.unavailable_channels:
         missing_channels += (missing_channel + '\n')
 
+    if len(acquisition_statistics.unevaluated_channels) > 0:
+        missing_channels += "\nChannels not evaluated before the deadline:\n"
+
+    for unevaluated_channel in acquisition_statistics.unevaluated_channels:
+        missing_channels += (unevaluated_channel + '\n')
+
+    if len(acquisition_statistics.failed_channels) > 0:
+        missing_channels += "\nChannels with unreadable latency files:\n"
+
+    for failed_channel, error in \
+            acquisition_statistics.failed_channels.items():
+        missing_channels += f"{failed_channel}: {error}\n"
+
     # Initialize detail section headers
     stale_channels = "Stale channels:\n"
 
@@ -346,15 +585,22 @@ def assemble_details(
 
     good_channels = "Channels with good latency:\n"
 
+    # Classify every channel at once, in the order of channel_latency
+    columns = acquisition_statistics.to_columnar()
+    stale = columns.stale_mask(datetime.now(), STALE_AGE)
+    critical = ~stale & (columns.latencies > float(critical_time))
+    warning = ~stale & ~critical & (columns.latencies > float(warning_time))
+
     # Sort channels into their respective sections
-    for channel in acquisition_statistics.channel_latency:
-        if channel.timestamp < (datetime.now() - timedelta(hours=1)):
+    for channel, is_stale, is_critical, is_warning in zip(
+            acquisition_statistics.channel_latency, stale, critical, warning):
+        if is_stale:
             stale_channels += (str(channel) + '\n')
 
-        elif channel.latency > float(critical_time):
+        elif is_critical:
             critical_channels += (str(channel) + '\n')
 
-        elif channel.latency > float(warning_time):
+        elif is_warning:
             warning_channels += (str(channel) + '\n')
 
         else:
@@ -366,18 +612,3 @@ def assemble_details(
                + good_channels)
 
     return details
-
-
-def get_masked_channels(
-    mask_file: pathlib.Path
-):
-    if not mask_file.exists():
-        logging.warning(f"Could not find mask file {str(mask_file)}")
-        return []
-    else:
-        masked_channels: List[str] = []
-        with open(mask_file) as f:
-            filelines = f.readlines()
-            for line in filelines:
-                masked_channels.append(line.rstrip('\n'))
-        return masked_channels
@@ -0,0 +1,143 @@
+'''
+Minimal ctypes binding of the Linux inotify API
+
+Only what the latency watcher needs: watching a directory and reading the
+events of the files in it. See inotify(7).
+'''
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from typing import List, NamedTuple, Optional
+
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = os.O_CLOEXEC
+
+# Watch descriptor, mask, cookie and length of the name that follows
+_EVENT = struct.Struct('iIII')
+
+_READ_SIZE = 64 * 1024
+
+
+class InotifyEvent(NamedTuple):
+    wd: int
+    mask: int
+    cookie: int
+    # Name of the file in the watched directory, empty for the directory
+    name: str
+
+
+def _libc() -> ctypes.CDLL:
+    name = ctypes.util.find_library('c')
+    if name is None:
+        raise OSError("Could not find the C library for inotify")
+    libc = ctypes.CDLL(name, use_errno=True)
+    if not hasattr(libc, 'inotify_init1'):
+        raise OSError("inotify is not supported on this platform")
+    return libc
+
+
+def parse_events(
+    data: bytes
+) -> List[InotifyEvent]:
+    '''
+    Parse the events read from an inotify file descriptor
+    '''
+    events: List[InotifyEvent] = []
+    offset = 0
+    while offset + _EVENT.size <= len(data):
+        wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+        offset += _EVENT.size
+        name = data[offset:offset + length].rstrip(b'\0')
+        offset += length
+        events.append(InotifyEvent(wd, mask, cookie, os.fsdecode(name)))
+    return events
+
+
+class Inotify(object):
+    '''
+    An inotify instance
+
+    Raises
+    ------
+    OSError: If inotify is not available
+    '''
+    def __init__(self):
+        self._libc = _libc()
+        self.fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def __enter__(self) -> 'Inotify':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def add_watch(
+        self,
+        path: str,
+        mask: int
+    ) -> int:
+        '''
+        Watch a path for the events of the mask
+
+        Returns
+        -------
+        int: The watch descriptor of the path
+        '''
+        wd = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def read_events(
+        self,
+        timeout: Optional[float] = None
+    ) -> List[InotifyEvent]:
+        '''
+        Wait for events and read those available
+
+        Parameters
+        ----------
+        timeout: Optional[float]
+            Seconds to wait for an event, forever if None
+
+        Returns
+        -------
+        List[InotifyEvent]: The events read, empty if none arrived before the
+        timeout
+        '''
+        poll = select.poll()
+        poll.register(self.fd, select.POLLIN)
+        if len(poll.poll(None if timeout is None else timeout * 1000)) == 0:
+            return []
+        try:
+            return parse_events(os.read(self.fd, _READ_SIZE))
+        except BlockingIOError:
+            return []
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
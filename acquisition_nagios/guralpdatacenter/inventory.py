@@ -0,0 +1,357 @@
+'''
+Channel inventory of the Guralp Datacenter
+
+The channels the acquisition server expects are listed by its SeedLink
+server with slinktool. The output is parsed line by line as slinktool
+prints it, under a timeout.
+
+The inventory rarely changes, so it can be kept in an InventoryCache and
+refreshed once its time to live has passed. When a refresh fails, the last
+good inventory is used instead of an empty one.
+'''
+from dataclasses import dataclass
+import json
+import logging
+import os
+from pathlib import Path
+import selectors
+from subprocess import PIPE, Popen, TimeoutExpired
+import tempfile
+import time
+from typing import IO, Callable, List, Optional, Union, cast
+from acquisition_nagios.channel_mask import ChannelSelection, \
+    compile_channel_selection
+from acquisition_nagios.deadline import Deadline, DeadlineExceeded
+
+
+# Seconds slinktool is given to list the channels
+DEFAULT_SLINKTOOL_TIMEOUT = 30.0
+
+DEFAULT_INVENTORY_TTL = 3600.0
+
+INVENTORY_VERSION = 1
+
+# Channels of the seismic data, see channel_mask.ChannelSelection
+DEFAULT_CHANNELS = 'HNZ,HNN,HNE,HHZ,HHN,HHE'
+
+_READ_SIZE = 64 * 1024
+
+
+class InventoryError(Exception):
+    '''
+    Raised when the channel inventory can not be listed
+    '''
+
+
+def select_channel(
+    net: str,
+    sta: str,
+    loc: str,
+    cha: str,
+    selection: Optional[ChannelSelection] = None
+) -> Optional[str]:
+    '''
+    Select the channels to check among those listed by the SeedLink server
+
+    Parameters
+    ----------
+    selection: Optional[ChannelSelection]
+        The channels to check, the seismic channels of DEFAULT_CHANNELS by
+        default
+
+    Returns
+    -------
+    Optional[str]: The channel in the format NN.SSSSS.LL.CCC, None if it is
+    not selected
+    '''
+    if selection is None:
+        selection = compile_channel_selection(DEFAULT_CHANNELS)
+
+    channel = f"{net}.{sta}.{loc}.{cha}"
+    if channel not in selection:
+        return None
+    return channel
+
+
+def parse_slinktool_line(
+    line: str,
+    selection: Optional[ChannelSelection] = None
+) -> Optional[str]:
+    '''
+    Get the selected channel of a line of the output of slinktool -Q
+
+    Returns
+    -------
+    Optional[str]: The channel in the format NN.SSSSS.LL.CCC, None if the line
+    does not list a selected channel
+    '''
+    line_parts = line.split(' ')
+
+    # Less than 3 parts means that an entire SNCL is not present
+    if len(line_parts) > 3:
+        net, sta, loc, cha = line_parts[:4]
+        return select_channel(net, sta, loc, cha, selection)
+    return None
+
+
+def query_slinktool(
+    gdc_address: str = "localhost",
+    seedlink_port: str = "18000",
+    deadline: Optional[Deadline] = None,
+    timeout: Optional[float] = DEFAULT_SLINKTOOL_TIMEOUT,
+    selection: Optional[ChannelSelection] = None
+) -> List[str]:
+    '''
+    List the selected channels of a SeedLink server with slinktool, parsing
+    its output as it is printed
+
+    Parameters
+    ----------
+    gdc_address: str
+        The IP address or hostname of the SeedLink server
+
+    seedlink_port: str
+        The port of the SeedLink server
+
+    deadline: Optional[Deadline]
+        The time budget of the check
+
+    timeout: Optional[float]
+        Seconds after which slinktool is stopped, no limit if None
+
+    selection: Optional[ChannelSelection]
+        The channels to list, the seismic channels of DEFAULT_CHANNELS by
+        default
+
+    Returns
+    -------
+    List[str]: The channels, in the format NN.SSSSS.LL.CCC
+
+    Raises
+    ------
+    DeadlineExceeded: If slinktool does not finish before the deadline
+
+    InventoryError: If slinktool fails or does not finish within the timeout
+
+    OSError: If slinktool can not be run
+    '''
+    if deadline is None:
+        deadline = Deadline()
+
+    deadline.check('listing channels with slinktool')
+    limit = Deadline(deadline.timeout(timeout), reserve=0)
+
+    # Use -Q option with slinktool to get a list of each individual channel
+    cmd = ['slinktool', '-Q', f"{gdc_address}:{seedlink_port}"]
+    process = Popen(cmd, stdout=PIPE, stderr=PIPE)
+    stdout_pipe = cast(IO[bytes], process.stdout)
+    stderr_pipe = cast(IO[bytes], process.stderr)
+
+    channels: List[str] = []
+    stderr = b''
+    partial = b''
+
+    try:
+        with selectors.DefaultSelector() as selector:
+            selector.register(stdout_pipe, selectors.EVENT_READ)
+            selector.register(stderr_pipe, selectors.EVENT_READ)
+
+            while len(selector.get_map()) > 0:
+                if limit.expired():
+                    raise TimeoutExpired(cmd, timeout or 0)
+                for key, _ in selector.select(limit.remaining()):
+                    data = os.read(key.fd, _READ_SIZE)
+                    if len(data) == 0:
+                        selector.unregister(key.fileobj)
+                    elif key.fileobj is stderr_pipe:
+                        stderr += data
+                    else:
+                        lines = (partial + data).split(b'\n')
+                        partial = lines.pop()
+                        for line in lines:
+                            channel = parse_slinktool_line(
+                                line.decode('utf-8', errors='ignore'),
+                                selection)
+                            if channel is not None:
+                                channels.append(channel)
+
+        channel = parse_slinktool_line(
+            partial.decode('utf-8', 'ignore'), selection)
+        if channel is not None:
+            channels.append(channel)
+
+        returncode = process.wait(limit.remaining())
+    except TimeoutExpired as e:
+        process.kill()
+        process.wait()
+        if deadline.expired():
+            raise DeadlineExceeded(
+                "Deadline exceeded while listing channels with slinktool")
+        raise InventoryError(
+            f"slinktool did not finish within {timeout}s") from e
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        stdout_pipe.close()
+        stderr_pipe.close()
+
+    # Log any error using slinktool
+    if stderr != b'':
+        logging.error(f"Slinktool error: {stderr.decode('utf-8')}")
+
+    if returncode != 0:
+        raise InventoryError(f"slinktool exited with status {returncode}")
+
+    return channels
+
+
+@dataclass
+class Inventory:
+    server: str
+    channels: List[str]
+    # Epoch time at which the channels were listed
+    fetched_at: float
+
+
+class InventoryCache(object):
+    '''
+    Channel inventory kept in a file and refreshed once it expires
+
+    The file is replaced atomically, so concurrent checks read either the
+    previous or the new inventory.
+    '''
+    def __init__(
+        self,
+        cache_file: Union[str, Path],
+        ttl: float = DEFAULT_INVENTORY_TTL,
+        clock: Callable[[], float] = time.time
+    ):
+        '''
+        Parameters
+        ----------
+        cache_file: Union[str, Path]
+            The file to keep the inventory in
+
+        ttl: float
+            Seconds during which the stored inventory is used without
+            listing the channels again
+
+        clock: Callable[[], float]
+            Epoch time in seconds, comparable between runs
+        '''
+        self.cache_file = Path(cache_file)
+        self.ttl = ttl
+        self._clock = clock
+
+    def load(
+        self,
+        server: str
+    ) -> Optional[Inventory]:
+        '''
+        The stored inventory of a server, None if there is none or it is
+        unreadable
+        '''
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored.get('version') != INVENTORY_VERSION or \
+                    stored.get('server') != server:
+                return None
+            return Inventory(
+                server=server,
+                channels=list(stored['channels']),
+                fetched_at=float(stored['fetched_at']))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(
+                f"Ignoring unreadable inventory {self.cache_file}: {e}")
+            return None
+
+    def store(
+        self,
+        server: str,
+        channels: List[str]
+    ) -> Inventory:
+        '''
+        Store an inventory, replacing the previous one atomically
+        '''
+        inventory = Inventory(
+            server=server, channels=channels, fetched_at=self._clock())
+
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=self.cache_file.parent, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'version': INVENTORY_VERSION,
+                    'server': server,
+                    'fetched_at': inventory.fetched_at,
+                    'channels': channels
+                }, f)
+            os.replace(temp_path, self.cache_file)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        return inventory
+
+    def get(
+        self,
+        server: str,
+        fetch: Callable[[], List[str]]
+    ) -> List[str]:
+        '''
+        Get the inventory of a server, listing its channels again if the
+        stored inventory expired
+
+        Parameters
+        ----------
+        server: str
+            The SeedLink server as address:port, along with what else the
+            inventory depends on such as the selection of channels
+
+        fetch: Callable[[], List[str]]
+            Lists the channels of the server
+
+        Returns
+        -------
+        List[str]: The channels of the server. The last good inventory if
+        listing them fails or gives none
+
+        Raises
+        ------
+        The error of fetch if there is no stored inventory to fall back to
+        '''
+        stored = self.load(server)
+        if stored is not None and \
+                self._clock() - stored.fetched_at < self.ttl:
+            return stored.channels
+
+        try:
+            channels = fetch()
+        except (DeadlineExceeded, InventoryError, OSError) as e:
+            if stored is None:
+                raise
+            logging.warning(
+                f"Using the inventory of {server} from " +
+                f"{time.ctime(stored.fetched_at)}, listing channels failed: " +
+                f"{e}")
+            return stored.channels
+
+        if len(channels) == 0 and stored is not None:
+            logging.warning(
+                f"No channels listed by {server}, using the inventory from " +
+                f"{time.ctime(stored.fetched_at)}")
+            return stored.channels
+
+        if len(channels) > 0:
+            try:
+                self.store(server, channels)
+            except OSError as e:
+                logging.warning(f"Could not store the inventory: {e}")
+
+        return channels
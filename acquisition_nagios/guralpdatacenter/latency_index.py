@@ -0,0 +1,253 @@
+'''
+Index of the latency files of the Guralp Datacenter
+
+The Guralp Datacenter writes one latency CSV per channel and day, named
+NET_STA_LOC_CHA_YEAR_JDAY.csv. Rather than searching a directory once for
+each channel, the directory is listed once and its files are indexed by
+channel and day, so that each channel is then found with a dictionary
+lookup.
+
+The long-term archive holds one directory of latency files per day. When
+channels are missing from the cache, the archive days searched for them are
+listed concurrently into an ArchiveIndex shared by all the channels of the
+check.
+'''
+from datetime import date
+import logging
+import os
+import pathlib
+import threading
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple, Union
+from acquisition_nagios.deadline import Deadline, map_until_deadline
+
+
+class LatencyFileKey(NamedTuple):
+    net: str
+    sta: str
+    loc: str
+    cha: str
+    year: str
+    jday: str
+
+
+LatencyIndex = Dict[LatencyFileKey, pathlib.Path]
+
+# Network, station, location and channel codes
+ChannelCodes = Tuple[str, str, str, str]
+
+
+def parse_latency_filename(
+    name: str
+) -> Optional[LatencyFileKey]:
+    '''
+    Get the channel and day of a latency file from its name
+
+    Returns
+    -------
+    Optional[LatencyFileKey]: The key of the file, None if the name is not
+    that of a latency file
+    '''
+    if not name.endswith('.csv'):
+        return None
+    parts = name[:-len('.csv')].split('_')
+    if len(parts) != 6:
+        return None
+    return LatencyFileKey(*parts)
+
+
+def channel_key(
+    channel: str,
+    year: str,
+    jday: str
+) -> LatencyFileKey:
+    '''
+    The key of the latency file of a channel in the format NN.SSSSS.LL.CCC
+    for a day
+    '''
+    net, sta, loc, cha = channel.split('.')
+    return LatencyFileKey(net, sta, loc, cha, year, jday)
+
+
+def index_latency_directory(
+    directory: Union[str, pathlib.Path]
+) -> LatencyIndex:
+    '''
+    List a directory once and index its latency files by channel and day
+
+    Parameters
+    ----------
+    directory: Union[str, pathlib.Path]
+        The directory holding the latency files
+
+    Returns
+    -------
+    LatencyIndex: The path of each latency file, by channel and day. Empty
+    if the directory does not exist
+
+    Raises
+    ------
+    OSError: If the directory exists but can not be listed
+    '''
+    index: LatencyIndex = {}
+    directory = pathlib.Path(directory)
+
+    try:
+        entries = os.scandir(directory)
+    except (FileNotFoundError, NotADirectoryError):
+        return index
+
+    with entries:
+        for entry in entries:
+            key = parse_latency_filename(entry.name)
+            if key is not None:
+                index[key] = directory.joinpath(entry.name)
+
+    return index
+
+
+def _day_order(
+    key: LatencyFileKey
+) -> Tuple[int, int]:
+    try:
+        return int(key.year), int(key.jday)
+    except ValueError:
+        return -1, -1
+
+
+def latest_by_channel(
+    index: LatencyIndex
+) -> Dict[ChannelCodes, pathlib.Path]:
+    '''
+    Keep the latency file of the most recent day of each channel
+    '''
+    latest: Dict[ChannelCodes, Tuple[Tuple[int, int], pathlib.Path]] = {}
+
+    for key, path in index.items():
+        codes = (key.net, key.sta, key.loc, key.cha)
+        order = _day_order(key)
+        if codes not in latest or order > latest[codes][0]:
+            latest[codes] = (order, path)
+
+    return {codes: path for codes, (_, path) in latest.items()}
+
+
+class ArchiveIndex(object):
+    '''
+    Latency files of the long-term archive, by day and channel
+
+    Each day directory, archive/YYYY/MM/DD, is listed at most once, including
+    when listing it fails. Indexes are shared between threads.
+    '''
+    def __init__(
+        self,
+        archive_path: Union[str, pathlib.Path]
+    ):
+        '''
+        Parameters
+        ----------
+        archive_path: Union[str, pathlib.Path]
+            The latency folder of the long-term archive
+        '''
+        self.archive_path = pathlib.Path(archive_path)
+        self._days: Dict[date, Dict[ChannelCodes, pathlib.Path]] = {}
+        self._lock = threading.Lock()
+
+    def day_path(
+        self,
+        day: date
+    ) -> pathlib.Path:
+        return self.archive_path.joinpath(day.strftime('%Y/%m/%d'))
+
+    def is_scanned(
+        self,
+        day: date
+    ) -> bool:
+        return day in self._days
+
+    def _scan_day(
+        self,
+        day: date
+    ) -> None:
+        path = self.day_path(day)
+        try:
+            latest = latest_by_channel(index_latency_directory(path))
+        except OSError as e:
+            # Recorded as empty, so that the day is not listed again for
+            # every channel missing from it
+            logging.warning(f"Could not list archive directory {path}: {e}")
+            latest = {}
+        with self._lock:
+            self._days[day] = latest
+
+    def scan(
+        self,
+        days: Iterable[date],
+        deadline: Optional[Deadline] = None
+    ) -> None:
+        '''
+        List the day directories not listed yet, concurrently
+
+        Parameters
+        ----------
+        days: Iterable[date]
+            The days to index
+
+        deadline: Optional[Deadline]
+            The time budget of the check. Days not listed before it passes
+            are left out of the index, to be listed again on the next scan
+        '''
+        if deadline is None:
+            deadline = Deadline()
+
+        pending = [day for day in dict.fromkeys(days)
+                   if not self.is_scanned(day)]
+        if len(pending) == 0 or deadline.expired():
+            return
+
+        # Listings stuck on an unresponsive file system are left behind at
+        # the deadline
+        futures = map_until_deadline(
+            self._scan_day, pending, len(pending), deadline)
+
+        for future in futures:
+            if future.done() and not future.cancelled() and \
+                    future.exception() is not None:
+                logging.warning(
+                    f"Could not list archive directory: {future.exception()}")
+
+    def find(
+        self,
+        channel: str,
+        days: Iterable[date],
+        deadline: Optional[Deadline] = None
+    ) -> Optional[pathlib.Path]:
+        '''
+        Find the most recent latency file of a channel in the archive
+
+        Parameters
+        ----------
+        channel: str
+            The channel, in the format NN.SSSSS.LL.CCC
+
+        days: Iterable[date]
+            The days to search, most recent first. Days not indexed yet are
+            listed first
+
+        deadline: Optional[Deadline]
+            The time budget of the check
+
+        Returns
+        -------
+        Optional[pathlib.Path]: The latency file of the first day holding one
+        for the channel, None if none does
+        '''
+        days = list(days)
+        self.scan(days, deadline)
+        codes = tuple(channel.split('.'))
+
+        for day in days:
+            path = self._days.get(day, {}).get(codes)  # type: ignore
+            if path is not None:
+                return path
+
+        return None
@@ -0,0 +1,15 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass
+class ChannelLatency:
+    channel: str
+    timestamp: datetime
+    latency: float
+
+    def __str__(self):
+        latency = self.latency
+        age = round((datetime.now() - self.timestamp).total_seconds(), 2)
+        return (f"{self.channel}, arrived {age}s ago arrived with" +
+                f" {round(latency, 2)}s latency")
@@ -0,0 +1,244 @@
+'''
+Minimal SeedLink client listing the streams of a SeedLink server
+
+Implements the exchange slinktool -Q runs, without starting slinktool:
+
+- HELLO, answered with the server version and organization lines
+- INFO STREAMS, answered with SeedLink packets of an 8 byte header, SLINFO
+  followed by * while more packets follow, and a 512 byte miniSEED record
+  holding a part of an XML document as ASCII text
+- BYE
+
+The XML document lists the streams of each station, which are selected the
+same way as the output of slinktool.
+'''
+import logging
+import socket
+import struct
+from typing import List, Optional
+from xml.etree import ElementTree
+from acquisition_nagios.channel_mask import ChannelSelection
+from acquisition_nagios.deadline import Deadline, DeadlineExceeded
+from acquisition_nagios.guralpdatacenter.inventory import \
+    DEFAULT_SLINKTOOL_TIMEOUT, InventoryError, select_channel
+
+
+HEADER_SIZE = 8
+RECORD_SIZE = 512
+
+INFO_SIGNATURE = b'SLINFO'
+
+# Offsets in the miniSEED fixed header of the number of samples, characters
+# for ASCII records, and of the beginning of the data
+_SAMPLES_OFFSET = 30
+_DATA_OFFSET = 44
+_FIXED_HEADER_SIZE = 48
+
+_READ_SIZE = 64 * 1024
+
+
+class SeedLinkError(InventoryError):
+    '''
+    Raised when the SeedLink server answers unexpectedly
+    '''
+
+
+class _Connection(object):
+    '''
+    Buffered reads from a SeedLink server, failing once the limit passes
+    '''
+    def __init__(
+        self,
+        sock: socket.socket,
+        limit: Deadline
+    ):
+        self.sock = sock
+        self.limit = limit
+        self._buffer = b''
+
+    def _receive(self) -> None:
+        if self.limit.expired():
+            raise socket.timeout("SeedLink server timed out")
+        self.sock.settimeout(self.limit.remaining())
+        data = self.sock.recv(_READ_SIZE)
+        if len(data) == 0:
+            raise SeedLinkError("Connection closed by the SeedLink server")
+        self._buffer += data
+
+    def readline(self) -> bytes:
+        '''
+        Read a line of the server, without its terminator
+        '''
+        while b'\n' not in self._buffer:
+            self._receive()
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line.rstrip(b'\r')
+
+    def read(
+        self,
+        size: int
+    ) -> bytes:
+        while len(self._buffer) < size:
+            self._receive()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def info_record_text(
+    record: bytes
+) -> bytes:
+    '''
+    The ASCII text held by the miniSEED record of an INFO packet
+
+    Raises
+    ------
+    SeedLinkError: If the record is not a valid miniSEED record
+    '''
+    # The header fields are big-endian, or little-endian for some servers.
+    # Only one byte order gives a data offset inside the record
+    for byte_order in ('>', '<'):
+        samples, = struct.unpack_from(
+            f'{byte_order}H', record, _SAMPLES_OFFSET)
+        offset, = struct.unpack_from(f'{byte_order}H', record, _DATA_OFFSET)
+        if _FIXED_HEADER_SIZE <= offset and offset + samples <= len(record):
+            return record[offset:offset + samples]
+    raise SeedLinkError("Invalid miniSEED record in INFO packet")
+
+
+def read_info(
+    connection: _Connection
+) -> bytes:
+    '''
+    Read the XML document of an INFO request, from all its packets
+    '''
+    text: List[bytes] = []
+
+    while True:
+        # ERROR followed by a line terminator is shorter than a header
+        signature = connection.read(len(INFO_SIGNATURE))
+        if signature == b'ERROR\r' or signature == b'ERROR\n':
+            raise SeedLinkError("SeedLink server refused INFO STREAMS")
+        header = signature + connection.read(HEADER_SIZE - len(signature))
+        if not header.startswith(INFO_SIGNATURE):
+            raise SeedLinkError(f"Unexpected SeedLink packet {header!r}")
+
+        text.append(info_record_text(connection.read(RECORD_SIZE)))
+
+        # * marks that more packets follow
+        if header[HEADER_SIZE - 1:] != b'*':
+            return b''.join(text)
+
+
+def parse_streams(
+    xml: bytes,
+    selection: Optional[ChannelSelection] = None
+) -> List[str]:
+    '''
+    Get the selected channels of an INFO STREAMS XML document, the seismic
+    channels by default
+
+    Returns
+    -------
+    List[str]: The channels, in the format NN.SSSSS.LL.CCC
+
+    Raises
+    ------
+    SeedLinkError: If the document is not valid XML, or reports an error
+    '''
+    try:
+        root = ElementTree.fromstring(xml)
+    except ElementTree.ParseError as e:
+        raise SeedLinkError(f"Invalid INFO STREAMS document: {e}") from e
+
+    error = root.find('error')
+    if error is not None:
+        raise SeedLinkError(
+            f"SeedLink server error: {error.get('message', error.text)}")
+
+    channels: List[str] = []
+    for station in root.iter('station'):
+        for stream in station.iter('stream'):
+            channel = select_channel(
+                station.get('network', ''),
+                station.get('name', ''),
+                stream.get('location', ''),
+                stream.get('seedname', ''),
+                selection)
+            if channel is not None:
+                channels.append(channel)
+    return channels
+
+
+def query_seedlink(
+    gdc_address: str = "localhost",
+    seedlink_port: str = "18000",
+    deadline: Optional[Deadline] = None,
+    timeout: Optional[float] = DEFAULT_SLINKTOOL_TIMEOUT,
+    selection: Optional[ChannelSelection] = None
+) -> List[str]:
+    '''
+    List the selected channels of a SeedLink server with an INFO STREAMS
+    request
+
+    Parameters
+    ----------
+    gdc_address: str
+        The IP address or hostname of the SeedLink server
+
+    seedlink_port: str
+        The port of the SeedLink server
+
+    deadline: Optional[Deadline]
+        The time budget of the check
+
+    timeout: Optional[float]
+        Seconds after which the request is abandoned, no limit if None
+
+    selection: Optional[ChannelSelection]
+        The channels to list, the seismic channels of DEFAULT_CHANNELS by
+        default
+
+    Returns
+    -------
+    List[str]: The channels, in the format NN.SSSSS.LL.CCC
+
+    Raises
+    ------
+    DeadlineExceeded: If the server does not answer before the deadline
+
+    SeedLinkError: If the server answers unexpectedly, or does not answer
+    within the timeout
+
+    OSError: If the server can not be reached
+    '''
+    if deadline is None:
+        deadline = Deadline()
+
+    deadline.check('listing channels from SeedLink')
+    limit = Deadline(deadline.timeout(timeout), reserve=0)
+
+    try:
+        with socket.create_connection(
+                (gdc_address, int(seedlink_port)),
+                timeout=limit.remaining()) as sock:
+            connection = _Connection(sock, limit)
+
+            sock.sendall(b'HELLO\r\n')
+            version = connection.readline()
+            organization = connection.readline()
+            logging.debug(
+                f"Connected to {version.decode('utf-8', 'replace')}, " +
+                f"{organization.decode('utf-8', 'replace')}")
+
+            sock.sendall(b'INFO STREAMS\r\n')
+            xml = read_info(connection)
+
+            sock.sendall(b'BYE\r\n')
+    except socket.timeout as e:
+        if deadline.expired():
+            raise DeadlineExceeded(
+                "Deadline exceeded while listing channels from SeedLink")
+        raise SeedLinkError(
+            f"SeedLink server did not answer within {timeout}s") from e
+
+    return parse_streams(xml, selection)
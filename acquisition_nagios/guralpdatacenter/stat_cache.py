@@ -0,0 +1,254 @@
+'''
+Persistent cache of the last latency record of each latency file
+
+Many latency files do not change between two checks, such as those of
+stations that stopped sending data or of past days in the archive. The last
+record parsed from each file is kept with the inode, size and modification
+time of the file, so that a file whose stat did not change is not opened
+again on the next run.
+
+The cache is stored in a compact binary file: a header with a format version,
+followed by one fixed-size record and the path and channel of each file.
+Entries not used for max_age seconds are dropped when it is saved.
+'''
+from datetime import datetime, timedelta
+import logging
+import os
+import pathlib
+import struct
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Union
+from acquisition_nagios.guralpdatacenter.models import ChannelLatency
+
+
+FORMAT_VERSION = 1
+
+# Two days, so that the files of the previous day are kept while in use
+DEFAULT_MAX_AGE = 2 * 86400.0
+
+_MAGIC = b'GLSC'
+# Magic, format version and number of entries
+_HEADER = struct.Struct('<4sHI')
+# Inode, size, modification time in ns, timestamp in microseconds since
+# 1970-01-01, latency, last use, length of the path and of the channel
+_ENTRY = struct.Struct('<QQqqddHH')
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class _CacheEntry(NamedTuple):
+    ino: int
+    size: int
+    mtime_ns: int
+    channel: str
+    # Microseconds since 1970-01-01 in the time reference of the record
+    timestamp: int
+    latency: float
+    # Epoch time of the last run that used the entry
+    used_at: float
+
+
+def _to_microseconds(
+    timestamp: datetime
+) -> int:
+    return (timestamp - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_microseconds(
+    microseconds: int
+) -> datetime:
+    return _EPOCH + timedelta(microseconds=microseconds)
+
+
+class LatencyStatCache(object):
+    '''
+    Last latency record of each latency file, by path, valid as long as the
+    inode, size and modification time of the file are unchanged
+
+    Lookups are thread-safe.
+    '''
+    def __init__(
+        self,
+        cache_file: Union[str, pathlib.Path],
+        max_age: float = DEFAULT_MAX_AGE,
+        clock: Callable[[], float] = time.time
+    ):
+        '''
+        Parameters
+        ----------
+        cache_file: Union[str, pathlib.Path]
+            The file the cache is loaded from and saved to
+
+        max_age: float
+            Seconds after which an entry that was not used is dropped
+
+        clock: Callable[[], float]
+            Epoch time in seconds, comparable between runs
+        '''
+        self.cache_file = pathlib.Path(cache_file)
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _CacheEntry] = self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _load(self) -> Dict[str, _CacheEntry]:
+        try:
+            with open(self.cache_file, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return {}
+        except OSError as e:
+            logging.warning(
+                f"Ignoring unreadable latency cache {self.cache_file}: {e}")
+            return {}
+
+        try:
+            return self._parse(data)
+        except (struct.error, UnicodeDecodeError, ValueError) as e:
+            logging.warning(
+                f"Ignoring corrupted latency cache {self.cache_file}: {e}")
+            return {}
+
+    def _parse(
+        self,
+        data: bytes
+    ) -> Dict[str, _CacheEntry]:
+        magic, version, count = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("Not a latency cache")
+        if version != FORMAT_VERSION:
+            logging.info(
+                f"Discarding latency cache of format version {version}")
+            return {}
+
+        entries: Dict[str, _CacheEntry] = {}
+        offset = _HEADER.size
+        for _ in range(count):
+            ino, size, mtime_ns, timestamp, latency, used_at, \
+                path_length, channel_length = _ENTRY.unpack_from(data, offset)
+            offset += _ENTRY.size
+            path = os.fsdecode(data[offset:offset + path_length])
+            offset += path_length
+            channel = data[offset:offset + channel_length].decode('utf-8')
+            offset += channel_length
+            entries[path] = _CacheEntry(
+                ino, size, mtime_ns, channel, timestamp, latency, used_at)
+
+        if offset != len(data):
+            raise ValueError("Unexpected data after the last entry")
+
+        return entries
+
+    def get(
+        self,
+        path: pathlib.Path,
+        read: Callable[[pathlib.Path], ChannelLatency]
+    ) -> ChannelLatency:
+        '''
+        Get the last latency record of a file, reading it only if the file
+        changed since it was cached
+
+        Parameters
+        ----------
+        path: pathlib.Path
+            The latency file
+
+        read: Callable[[pathlib.Path], ChannelLatency]
+            Reads the last latency record of a file
+
+        Raises
+        ------
+        Any error raised by read
+        '''
+        key = str(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # Let the reader report the error
+            return read(path)
+
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.ino == stat.st_ino and \
+                    entry.size == stat.st_size and \
+                    entry.mtime_ns == stat.st_mtime_ns:
+                self.hits += 1
+                self._entries[key] = entry._replace(used_at=now)
+                return ChannelLatency(
+                    entry.channel,
+                    _from_microseconds(entry.timestamp),
+                    entry.latency)
+            self.misses += 1
+
+        latency = read(path)
+
+        with self._lock:
+            self._entries[key] = _CacheEntry(
+                ino=stat.st_ino,
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns,
+                channel=latency.channel,
+                timestamp=_to_microseconds(latency.timestamp),
+                latency=latency.latency,
+                used_at=now)
+
+        return latency
+
+    def collect(self) -> int:
+        '''
+        Drop the entries not used for max_age seconds
+
+        Returns
+        -------
+        int: The number of entries dropped
+        '''
+        oldest = self._clock() - self.max_age
+        with self._lock:
+            stale = [path for path, entry in self._entries.items()
+                     if entry.used_at < oldest]
+            for path in stale:
+                del self._entries[path]
+        return len(stale)
+
+    def save(self) -> None:
+        '''
+        Drop stale entries and write the cache, replacing the previous file
+        atomically
+        '''
+        dropped = self.collect()
+        logging.debug(
+            f"Latency cache: {self.hits} hits, {self.misses} misses, " +
+            f"{dropped} stale entries dropped")
+
+        with self._lock:
+            entries = list(self._entries.items())
+
+        chunks = [_HEADER.pack(_MAGIC, FORMAT_VERSION, len(entries))]
+        for path, entry in entries:
+            encoded_path = os.fsencode(path)
+            encoded_channel = entry.channel.encode('utf-8')
+            chunks.append(_ENTRY.pack(
+                entry.ino, entry.size, entry.mtime_ns, entry.timestamp,
+                entry.latency, entry.used_at, len(encoded_path),
+                len(encoded_channel)))
+            chunks.append(encoded_path)
+            chunks.append(encoded_channel)
+
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=self.cache_file.parent, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(b''.join(chunks))
+            os.replace(temp_path, self.cache_file)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
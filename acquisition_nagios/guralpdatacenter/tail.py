@@ -0,0 +1,116 @@
+'''
+Reading the last record of a file
+
+Latency files are appended to throughout the day and only their last record
+is of interest. Rather than reading the whole file, blocks are read backwards
+from its end until a complete record is found, so the amount read does not
+depend on the size of the file.
+'''
+import os
+import pathlib
+from typing import BinaryIO, Optional, Union
+
+
+# Holds many latency records, so that a single read is usually enough
+DEFAULT_BLOCK_SIZE = 4096
+
+
+def last_record(
+    f: BinaryIO,
+    end: Optional[int] = None,
+    block_size: int = DEFAULT_BLOCK_SIZE
+) -> Optional[bytes]:
+    '''
+    Find the last complete record of a file opened in binary mode
+
+    A record is complete once terminated by a newline: a last line without
+    one is still being written and is skipped. Blank lines are skipped.
+
+    Parameters
+    ----------
+    f: BinaryIO
+        The file, opened in binary mode
+
+    end: Optional[int]
+        The offset to search back from, the end of the file by default
+
+    block_size: int
+        The number of bytes read at a time
+
+    Returns
+    -------
+    Optional[bytes]: The last complete record, without its line terminator.
+    None if the file holds no complete record
+    '''
+    if end is None:
+        end = f.seek(0, os.SEEK_END)
+
+    data = b''
+    position = end
+
+    while position > 0:
+        size = min(block_size, position)
+        position -= size
+        f.seek(position)
+        data = f.read(size) + data
+
+        terminated = data.rfind(b'\n')
+        if terminated < 0:
+            continue
+
+        records = data[:terminated].split(b'\n')
+        for index in range(len(records) - 1, -1, -1):
+            # The first record may start in a block not read yet
+            if index == 0 and position > 0:
+                break
+            record = records[index].rstrip(b'\r')
+            if len(record.strip()) > 0:
+                return record
+
+        # Only the first, possibly truncated, record is needed from now on
+        data = records[0] + b'\n'
+
+    return None
+
+
+def complete_end(
+    f: BinaryIO,
+    end: Optional[int] = None,
+    block_size: int = DEFAULT_BLOCK_SIZE
+) -> int:
+    '''
+    The offset just past the last line terminator of a file opened in binary
+    mode, where the line still being written starts
+
+    Returns
+    -------
+    int: The end of the complete records, 0 if there is none
+    '''
+    if end is None:
+        end = f.seek(0, os.SEEK_END)
+
+    position = end
+    while position > 0:
+        size = min(block_size, position)
+        position -= size
+        f.seek(position)
+        terminated = f.read(size).rfind(b'\n')
+        if terminated >= 0:
+            return position + terminated + 1
+
+    return 0
+
+
+def read_last_record(
+    path: Union[str, pathlib.Path],
+    block_size: int = DEFAULT_BLOCK_SIZE
+) -> Optional[bytes]:
+    '''
+    Read the last complete record of a file, see last_record
+
+    Raises
+    ------
+    OSError: If the file can not be read
+    '''
+    with open(path, 'rb') as f:
+        return last_record(f, block_size=block_size)
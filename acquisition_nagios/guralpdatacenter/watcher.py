@@ -0,0 +1,387 @@
+'''
+Latency watcher daemon for the Guralp Datacenter
+
+Instead of every check listing and reading the latency files of the cache,
+a long-running watcher follows the latency directory with inotify. When a
+file is appended to, only the new bytes are read, and the last record of
+each file is kept in memory. The table of last records is served over a
+Unix socket, so that a check gets the latency of every channel with a
+single request.
+
+Protocol: the client sends LATEST followed by a newline, and the watcher
+answers with a json document of the last record of each file, then closes
+the connection. Until its first scan of the directory completes, the watcher
+answers that it is not ready instead, so that the check reads the files
+itself rather than reporting a partial table.
+'''
+from dataclasses import dataclass
+from datetime import datetime
+import io
+import json
+import logging
+import os
+import pathlib
+import socket
+import socketserver
+import stat
+import threading
+from typing import Dict, List, Optional, Union
+from acquisition_nagios.guralpdatacenter import inotify
+from acquisition_nagios.guralpdatacenter.guralp_availability import \
+    parse_latency_record
+from acquisition_nagios.guralpdatacenter.latency_index import \
+    LatencyFileKey, parse_latency_filename
+from acquisition_nagios.guralpdatacenter.models import ChannelLatency
+from acquisition_nagios.guralpdatacenter.tail import complete_end, \
+    last_record
+
+
+PROTOCOL_VERSION = 1
+
+DEFAULT_SOCKET = '/run/acquisition_nagios/guralp_latency.sock'
+
+# Seconds a check waits for the watcher before scanning the files itself
+DEFAULT_QUERY_TIMEOUT = 2.0
+
+WATCH_MASK = (inotify.IN_MODIFY | inotify.IN_CLOSE_WRITE |
+              inotify.IN_CREATE | inotify.IN_MOVED_TO |
+              inotify.IN_MOVED_FROM | inotify.IN_DELETE |
+              inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF)
+
+_REQUEST = b'LATEST\n'
+
+
+@dataclass
+class _FileState:
+    ino: int
+    # End of the last complete record read
+    offset: int
+
+
+class LatencyWatcher(object):
+    '''
+    Last latency record of each file of a latency directory, kept up to date
+    from inotify events
+    '''
+    def __init__(
+        self,
+        latency_dir: Union[str, pathlib.Path]
+    ):
+        '''
+        Parameters
+        ----------
+        latency_dir: Union[str, pathlib.Path]
+            The latency folder of the Guralp Datacenter cache
+        '''
+        self.latency_dir = pathlib.Path(latency_dir)
+        self._files: Dict[str, _FileState] = {}
+        self._table: Dict[str, ChannelLatency] = {}
+        self._lock = threading.Lock()
+        # Set once the table holds every file of the directory
+        self.ready = threading.Event()
+
+    def snapshot(self) -> Dict[str, ChannelLatency]:
+        '''
+        The last record of each latency file, by file name
+        '''
+        with self._lock:
+            return dict(self._table)
+
+    def scan(self) -> None:
+        '''
+        Read the last record of every latency file of the directory
+        '''
+        names = [entry.name for entry in os.scandir(self.latency_dir)
+                 if parse_latency_filename(entry.name) is not None]
+        for name in set(self._files) - set(names):
+            self.remove(name)
+        for name in names:
+            self.update(name)
+        self.ready.set()
+        logging.info(
+            f"Watching {len(self._table)} latency files in {self.latency_dir}")
+
+    def remove(
+        self,
+        name: str
+    ) -> None:
+        self._files.pop(name, None)
+        with self._lock:
+            self._table.pop(name, None)
+
+    def update(
+        self,
+        name: str
+    ) -> None:
+        '''
+        Read the records appended to a latency file since it was last read
+        '''
+        if parse_latency_filename(name) is None:
+            return
+
+        try:
+            f = open(self.latency_dir.joinpath(name), 'rb')
+        except FileNotFoundError:
+            self.remove(name)
+            return
+        except OSError as e:
+            logging.warning(f"Could not read latency file {name}: {e}")
+            return
+
+        with f:
+            file_stat = os.fstat(f.fileno())
+            state = self._files.get(name)
+
+            if state is None or state.ino != file_stat.st_ino or \
+                    file_stat.st_size < state.offset:
+                # New, replaced or truncated file, only its end is read
+                end = complete_end(f, file_stat.st_size)
+                record = last_record(f, end=end)
+            else:
+                f.seek(state.offset)
+                data = f.read(file_stat.st_size - state.offset)
+                terminated = data.rfind(b'\n')
+                # Nothing new or the new record is still being written
+                if terminated < 0:
+                    return
+                end = state.offset + terminated + 1
+                record = last_record(io.BytesIO(data[:terminated + 1]))
+
+            self._files[name] = _FileState(file_stat.st_ino, end)
+
+        if record is None:
+            return
+
+        try:
+            latency = parse_latency_record(record)
+        except (ValueError, IndexError) as e:
+            logging.warning(f"Invalid latency record in {name}: {e}")
+            return
+
+        with self._lock:
+            self._table[name] = latency
+
+    def handle_events(
+        self,
+        events: List[inotify.InotifyEvent]
+    ) -> None:
+        '''
+        Apply a batch of inotify events, reading each modified file once
+
+        Raises
+        ------
+        OSError: If the latency directory was removed or moved
+        '''
+        # Last change of each file, True if it was modified
+        changes: Dict[str, bool] = {}
+        rescan = False
+
+        for event in events:
+            if event.mask & inotify.IN_Q_OVERFLOW:
+                rescan = True
+            elif event.mask & (inotify.IN_DELETE_SELF |
+                               inotify.IN_MOVE_SELF):
+                raise OSError(
+                    f"Latency directory {self.latency_dir} was removed")
+            elif event.mask & (inotify.IN_ISDIR | inotify.IN_IGNORED):
+                continue
+            elif event.mask & (inotify.IN_DELETE | inotify.IN_MOVED_FROM):
+                changes[event.name] = False
+            else:
+                changes[event.name] = True
+
+        if rescan:
+            logging.warning("Missed inotify events, rescanning")
+            self.scan()
+            return
+
+        for name, modified in changes.items():
+            if modified:
+                self.update(name)
+            else:
+                self.remove(name)
+
+    def watch(
+        self,
+        stop: threading.Event,
+        poll_interval: float = 1.0
+    ) -> None:
+        '''
+        Follow the latency directory until stop is set
+
+        Parameters
+        ----------
+        stop: threading.Event
+            Set to stop watching
+
+        poll_interval: float
+            Seconds between checks of stop while no event arrives
+
+        Raises
+        ------
+        OSError: If inotify is not available, or the latency directory can
+        not be watched
+        '''
+        with inotify.Inotify() as notifier:
+            notifier.add_watch(str(self.latency_dir), WATCH_MASK)
+            # Scan once watching, so that no change is missed in between
+            self.scan()
+            while not stop.is_set():
+                self.handle_events(notifier.read_events(poll_interval))
+
+
+def encode_table(
+    latency_dir: pathlib.Path,
+    table: Dict[str, ChannelLatency],
+    ready: bool = True
+) -> bytes:
+    return json.dumps({
+        'version': PROTOCOL_VERSION,
+        'directory': str(latency_dir),
+        'ready': ready,
+        'files': {name: [latency.channel, latency.timestamp.isoformat(),
+                         latency.latency]
+                  for name, latency in table.items()}
+    }).encode('utf-8')
+
+
+def decode_table(
+    data: bytes,
+    latency_dir: Optional[pathlib.Path] = None
+) -> Dict[LatencyFileKey, ChannelLatency]:
+    '''
+    Decode the table served by the watcher
+
+    Parameters
+    ----------
+    data: bytes
+        The answer of the watcher
+
+    latency_dir: Optional[pathlib.Path]
+        The latency directory expected to be watched
+
+    Returns
+    -------
+    Dict[LatencyFileKey, ChannelLatency]: The last record of each latency
+    file, by channel and day
+
+    Raises
+    ------
+    ValueError: If the answer is invalid, the watcher follows another
+    directory, or has not scanned it yet
+    '''
+    try:
+        answer = json.loads(data)
+        if answer['version'] != PROTOCOL_VERSION:
+            raise ValueError(
+                f"Unsupported watcher protocol version {answer['version']}")
+        if latency_dir is not None and \
+                pathlib.Path(answer['directory']) != latency_dir:
+            raise ValueError(
+                f"The watcher follows {answer['directory']}, not " +
+                f"{latency_dir}")
+        if not answer.get('ready', True):
+            raise ValueError(
+                f"The watcher has not scanned {answer['directory']} yet")
+
+        table: Dict[LatencyFileKey, ChannelLatency] = {}
+        for name, (channel, timestamp, latency) in answer['files'].items():
+            key = parse_latency_filename(name)
+            if key is not None:
+                table[key] = ChannelLatency(
+                    channel, datetime.fromisoformat(timestamp),
+                    float(latency))
+        return table
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid answer from the watcher: {e}") from e
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    timeout = DEFAULT_QUERY_TIMEOUT
+
+    def handle(self):
+        request = self.rfile.readline(len(_REQUEST))
+        if request != _REQUEST:
+            return
+        watcher: LatencyWatcher = self.server.watcher  # type: ignore
+        if not watcher.ready.is_set():
+            self.wfile.write(encode_table(
+                watcher.latency_dir, {}, ready=False))
+            return
+        self.wfile.write(
+            encode_table(watcher.latency_dir, watcher.snapshot()))
+
+
+class WatcherServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        socket_path: Union[str, pathlib.Path],
+        watcher: LatencyWatcher
+    ):
+        '''
+        Serve the table of a watcher on a Unix socket, replacing the socket
+        left by a previous watcher
+        '''
+        socket_path = pathlib.Path(socket_path)
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            if stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+                os.unlink(socket_path)
+        except FileNotFoundError:
+            pass
+        self.socket_path = socket_path
+        self.watcher = watcher
+        super().__init__(str(socket_path), _Handler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+def query_watcher(
+    socket_path: Union[str, pathlib.Path],
+    latency_dir: Optional[pathlib.Path] = None,
+    timeout: Optional[float] = DEFAULT_QUERY_TIMEOUT
+) -> Dict[LatencyFileKey, ChannelLatency]:
+    '''
+    Get the last record of each latency file from a running watcher
+
+    Parameters
+    ----------
+    socket_path: Union[str, pathlib.Path]
+        The Unix socket of the watcher
+
+    latency_dir: Optional[pathlib.Path]
+        The latency directory the watcher is expected to follow
+
+    timeout: Optional[float]
+        Seconds to wait on each operation of the socket
+
+    Returns
+    -------
+    Dict[LatencyFileKey, ChannelLatency]: The last record of each latency
+    file, by channel and day
+
+    Raises
+    ------
+    OSError: If the watcher does not answer
+
+    ValueError: If the answer is invalid, the watcher follows another
+    directory, or has not scanned it yet
+    '''
+    chunks: List[bytes] = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(str(socket_path))
+        client.sendall(_REQUEST)
+        while True:
+            chunk = client.recv(64 * 1024)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return decode_table(b''.join(chunks), latency_dir)
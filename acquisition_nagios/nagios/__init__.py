@@ -6,6 +6,8 @@ from typing import Optional, Union, Dict
 
 import requests
 
+from acquisition_nagios.nagios.threshold import compile_range_check
+
 # Constants
 STATE_OK = 0
 STATE_WARNING = 1
@@ -30,33 +32,10 @@ def _range_check(
 
     :raises ValueError: Invalid NRDP range check
     """
-    # Check if the threshold is numeric then use threshold comparison
-    if isinstance(threshold, float):
-        return dataval > float(threshold)
-
-    try:
-        # its a string so lets try to convert it
-        return dataval > float(threshold)
-    except ValueError:
-        values = threshold.strip().split(':')
-        # Check that the split resulted in 2 values
-        if len(values) != 2:
-            raise ValueError(f'Invalid threshold {threshold}')
-        # Values[0] doesn't exist so compare if > critical threshold
-        if len(values[0]) and not len(values[1]):
-            if dataval > float(values[0]):
-                return True
-        # Values[1] doesn't exist so compare if < critical threshold
-        elif len(values[1]) and not len(values[0]):
-            if dataval < float(values[1]):
-                return True
-        # Otherwise is a range so check between min and max critical thresholds
-        else:
-            minthreshold = float(values[0])
-            maxthreshold = float(values[1])
-            if dataval >= minthreshold and dataval < maxthreshold:
-                return True
-    return False
+    # The @ prefix is only handled by range_check
+    if isinstance(threshold, str) and threshold.startswith('@'):
+        raise ValueError(f'Invalid threshold {threshold}')
+    return compile_range_check(threshold).check(dataval)
 
 
 def range_check(
@@ -70,18 +49,13 @@ def range_check(
 
     We check if values fall within/outside a range.
 
-    The following is a wrapper funciton for _nrpe_range_check but
-    handles the option of @ by reverting the response returned.
+    The threshold is compiled once and cached, see
+    :func:`acquisition_nagios.nagios.threshold.compile_range_check`.
+    A leading @ reverts the response returned.
 
     :return: True
     """
-    reverse_logic = False
-    if isinstance(threshold, str):
-        if threshold.startswith('@'):
-            reverse_logic = True
-            threshold = threshold[1:]
-    status = _range_check(dataval, threshold)
-    return not status if reverse_logic else status
+    return compile_range_check(threshold).check(dataval)
 
 
 class NagiosError(Exception):
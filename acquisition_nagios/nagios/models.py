@@ -11,6 +11,11 @@ from typing import Optional, List
 
 from enum import IntEnum
 
+import numpy as np
+
+from acquisition_nagios.nagios.threshold import CompiledRange, \
+    compile_nagios_range
+
 
 class NagiosVerbose(IntEnum):
     minimal: int = 0
@@ -30,6 +35,14 @@ class NagiosOutputCode(IntEnum):
 class NagiosRange:
     range: str
 
+    def compile(self) -> CompiledRange:
+        '''
+        The parsed range, cached across NagiosRange objects
+
+        :raises ValueError: range format invalid
+        '''
+        return compile_nagios_range(self.range)
+
     def in_range(self, value: float) -> bool:
         '''
         Determine if the value is in range.
@@ -39,28 +52,18 @@ class NagiosRange:
 
         :raises ValueError: range format invalid
         '''
-        parts = self.range.strip().split(':')
-        if len(parts) > 2:
-            raise ValueError(f'range format invalid: {self.range}')
-
-        reverse = False
-        if parts[0].startswith('@'):
-            reverse = True
-            parts[0] = parts[0][1:]
-
-        cond = False
-        if len(parts) == 1:
-            if parts[0] == '~':
-                raise ValueError(f'range format invalid: {self.range}')
-            cond = value < 0 or value > float(parts[0])
-        else:
-            if parts[0] == '~':
-                cond = value > float(parts[1])
-            elif len(parts[1]) == 0:
-                cond = value < float(parts[0])
-            else:
-                cond = value < float(parts[0]) or value > float(parts[1])
-        return not cond if reverse else cond
+        return self.compile().check(value)
+
+    def in_range_array(self, values: np.ndarray) -> np.ndarray:
+        '''
+        Determine which of the values are in range.
+
+        :param values: values to check
+        :rtype: boolean array
+
+        :raises ValueError: range format invalid
+        '''
+        return self.compile().check_array(values)
 
 
 @dataclass
@@ -0,0 +1,138 @@
+'''
+Compiled Nagios thresholds
+
+A threshold is parsed once into the bounds outside of which a value alerts
+and an inversion flag, then evaluated on single values or whole arrays.
+Compiled thresholds are cached by their string, so repeated evaluations of
+the same threshold do not parse it again.
+
+Two threshold syntaxes are supported, matching the two historical parsers of
+this package:
+
+- compile_nagios_range: the Nagios plugin range format used by NagiosRange
+
+  http://nagios-plugins.org/doc/guidelines.html#THRESHOLDFORMAT
+
+- compile_range_check: the format used by range_check for NRDP checks
+'''
+from dataclasses import dataclass
+from functools import lru_cache
+import math
+from typing import Union
+import numpy as np
+
+
+@dataclass(frozen=True)
+class CompiledRange:
+    low: float
+    high: float
+    # Reverse the result, set by the @ prefix
+    inverted: bool = False
+    # Alert when low <= value < high instead of when the value is outside
+    # of [low, high]. Both are False for NaN before the inversion
+    alert_inside: bool = False
+
+    def check(
+        self,
+        value: float
+    ) -> bool:
+        '''
+        Determine if the value alerts
+        '''
+        if self.alert_inside:
+            alert = self.low <= value < self.high
+        else:
+            alert = value < self.low or value > self.high
+        return alert != self.inverted
+
+    def check_array(
+        self,
+        values: np.ndarray
+    ) -> np.ndarray:
+        '''
+        Determine which of the values alert
+
+        :rtype: boolean array
+        '''
+        values = np.asarray(values)
+        if self.alert_inside:
+            alert = (values >= self.low) & (values < self.high)
+        else:
+            alert = (values < self.low) | (values > self.high)
+        return ~alert if self.inverted else alert
+
+
+@lru_cache(maxsize=256)
+def compile_nagios_range(
+    range: str
+) -> CompiledRange:
+    '''
+    Compile a Nagios plugin range
+
+    - N: alert if < 0 or > N
+    - N: : alert if < N
+    - ~:N: alert if > N
+    - N:M: alert if < N or > M
+    - @ prefix: alert if the above does not
+
+    :raises ValueError: range format invalid
+    '''
+    parts = range.strip().split(':')
+    if len(parts) > 2:
+        raise ValueError(f'range format invalid: {range}')
+
+    inverted = False
+    if parts[0].startswith('@'):
+        inverted = True
+        parts[0] = parts[0][1:]
+
+    if len(parts) == 1:
+        if parts[0] == '~':
+            raise ValueError(f'range format invalid: {range}')
+        return CompiledRange(0, float(parts[0]), inverted)
+    if parts[0] == '~':
+        return CompiledRange(-math.inf, float(parts[1]), inverted)
+    if len(parts[1]) == 0:
+        return CompiledRange(float(parts[0]), math.inf, inverted)
+    return CompiledRange(float(parts[0]), float(parts[1]), inverted)
+
+
+@lru_cache(maxsize=256)
+def compile_range_check(
+    threshold: Union[float, str]
+) -> CompiledRange:
+    '''
+    Compile a range_check threshold
+
+    - float or N: alert if > N
+    - N: : alert if > N
+    - :N: alert if < N
+    - N:M: alert if >= N and < M
+    - @ prefix: alert if the above does not
+
+    :raises ValueError: Invalid NRDP range check
+    '''
+    inverted = False
+    if isinstance(threshold, str) and threshold.startswith('@'):
+        inverted = True
+        threshold = threshold[1:]
+
+    if not isinstance(threshold, str):
+        return CompiledRange(-math.inf, float(threshold), inverted)
+
+    try:
+        return CompiledRange(-math.inf, float(threshold), inverted)
+    except ValueError:
+        pass
+
+    values = threshold.strip().split(':')
+    # Check that the split resulted in 2 values
+    if len(values) != 2:
+        raise ValueError(f'Invalid threshold {threshold}')
+    if len(values[0]) and not len(values[1]):
+        return CompiledRange(-math.inf, float(values[0]), inverted)
+    if len(values[1]) and not len(values[0]):
+        return CompiledRange(float(values[1]), math.inf, inverted)
+    # Alert between the min and max thresholds
+    return CompiledRange(
+        float(values[0]), float(values[1]), inverted, alert_inside=True)
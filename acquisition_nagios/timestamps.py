@@ -0,0 +1,288 @@
+'''
+Fast parsers for the fixed-layout timestamps produced by the acquisition
+servers
+
+Both formats have fixed field positions, so they are rearranged by slicing
+into the ISO format read by the much faster datetime.fromisoformat instead of
+being parsed with datetime.strptime. Strings that do not follow the layout
+are handed to strptime, which keeps its error reporting.
+
+Many timestamps are converted at once by checking and rearranging the bytes
+of all of them as a numpy array, which numpy then reads as datetime64.
+'''
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional
+import numpy as np
+
+
+# ApolloServer: 2022-06-20T01:00:00.430000000Z (nanoseconds)
+APOLLO_FORMAT = '%Y-%m-%dT%H:%M:%S.%f000Z'
+
+# Guralp latency CSV: 2022/06/01 23:59:57.4 (1 to 6 fractional digits)
+GURALP_FORMAT = '%Y/%m/%d %H:%M:%S.%f'
+
+# Positions of the date and time digits shared by both layouts
+_DATE_TIME_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+_ISO_LENGTH = 26
+
+# Byte array of an ISO timestamp truncated to microseconds, read as
+# datetime64, or None if a timestamp does not follow the layout
+BatchIsoformat = Callable[[np.ndarray], Optional[np.ndarray]]
+
+
+def _apollo_isoformat(
+    timestamp: str
+) -> Optional[str]:
+    '''
+    The ApolloServer timestamp truncated to microseconds, in the ISO format
+    read by datetime.fromisoformat. None if it does not follow the fixed
+    layout
+    '''
+    if (len(timestamp) == 30 and timestamp[29] == 'Z' and
+            timestamp[4] == '-' and timestamp[7] == '-' and
+            timestamp[10] == 'T' and timestamp[13] == ':' and
+            timestamp[16] == ':' and timestamp[19] == '.' and
+            timestamp[26:29].isdigit()):
+        return timestamp[:26]
+    return None
+
+
+def _guralp_isoformat(
+    timestamp: str
+) -> Optional[str]:
+    '''
+    The Guralp timestamp in the ISO format read by datetime.fromisoformat,
+    None if it does not follow the fixed layout
+    '''
+    if (20 < len(timestamp) <= 26 and timestamp[4] == '/' and
+            timestamp[7] == '/' and timestamp[10] == ' ' and
+            timestamp[13] == ':' and timestamp[16] == ':' and
+            timestamp[19] == '.'):
+        return (timestamp[0:4] + '-' + timestamp[5:7] + '-' +
+                timestamp[8:20] + timestamp[20:].ljust(6, '0'))
+    return None
+
+
+def _parse(
+    timestamp: str,
+    isoformat: Callable[[str], Optional[str]],
+    time_format: str
+) -> datetime:
+    iso_timestamp = isoformat(timestamp)
+    if iso_timestamp is not None:
+        try:
+            return datetime.fromisoformat(iso_timestamp)
+        except ValueError:
+            # Let strptime accept or report the timestamp
+            pass
+    return datetime.strptime(timestamp, time_format)
+
+
+def parse_apollo_timestamp(
+    timestamp: str
+) -> datetime:
+    '''
+    Parse an ApolloServer timestamp with nanosecond resolution
+
+    Nanoseconds are truncated to microseconds, where strptime only accepts
+    timestamps whose last three digits are 0.
+
+    Raises
+    ------
+    ValueError: If the timestamp is not a valid ApolloServer timestamp
+    '''
+    return _parse(timestamp, _apollo_isoformat, APOLLO_FORMAT)
+
+
+def parse_guralp_timestamp(
+    timestamp: str
+) -> datetime:
+    '''
+    Parse a timestamp of a Guralp latency CSV file
+
+    Raises
+    ------
+    ValueError: If the timestamp is not a valid Guralp timestamp
+    '''
+    return _parse(timestamp, _guralp_isoformat, GURALP_FORMAT)
+
+
+def _byte_matrix(
+    timestamps: np.ndarray,
+    width: int
+) -> np.ndarray:
+    '''
+    The ASCII bytes of each timestamp padded with NUL to width, one row per
+    timestamp
+
+    Raises
+    ------
+    UnicodeEncodeError: If a timestamp is not ASCII
+    '''
+    return timestamps.astype(f'S{width}').view(np.uint8).reshape(-1, width)
+
+
+def _has_separators(
+    matrix: np.ndarray,
+    separators: str
+) -> bool:
+    '''
+    Whether every row has the separators of a layout, given as a string of the
+    layout width with spaces at the positions not checked
+    '''
+    positions = [index for index, separator in enumerate(separators)
+                 if separator != ' ']
+    expected = np.frombuffer(
+        ''.join(separators[index] for index in positions).encode('ascii'),
+        dtype=np.uint8)
+    return bool(np.all(matrix[:, positions] == expected))
+
+
+def _is_digit(
+    matrix: np.ndarray
+) -> np.ndarray:
+    return (matrix >= ord('0')) & (matrix <= ord('9'))
+
+
+def _apollo_isoformat_batch(
+    timestamps: np.ndarray
+) -> Optional[np.ndarray]:
+    if not np.all(np.char.str_len(timestamps) == 30):
+        return None
+    matrix = _byte_matrix(timestamps, 30)
+    if not (_has_separators(matrix, '    -  -  T  :  :  .         Z') and
+            np.all(_is_digit(matrix[:, _DATE_TIME_DIGITS])) and
+            np.all(_is_digit(matrix[:, 20:29]))):
+        return None
+    return np.ascontiguousarray(matrix[:, :_ISO_LENGTH]).view(
+        f'S{_ISO_LENGTH}').ravel()
+
+
+def _guralp_isoformat_batch(
+    timestamps: np.ndarray
+) -> Optional[np.ndarray]:
+    lengths = np.char.str_len(timestamps)
+    if not np.all((20 < lengths) & (lengths <= _ISO_LENGTH)):
+        return None
+    matrix = _byte_matrix(timestamps, _ISO_LENGTH)
+    # Fractional digits up to the end of each timestamp, then padding
+    fraction = matrix[:, 20:]
+    written = np.arange(20, _ISO_LENGTH) < lengths[:, np.newaxis]
+    if not (_has_separators(matrix, '    /  /     :  :  .') and
+            np.all(_is_digit(matrix[:, _DATE_TIME_DIGITS])) and
+            np.all(_is_digit(fraction) == written)):
+        return None
+    matrix[:, [4, 7]] = ord('-')
+    matrix[:, 10] = ord('T')
+    fraction[~written] = ord('0')
+    return matrix.view(f'S{_ISO_LENGTH}').ravel()
+
+
+def _parse_batch(
+    timestamps: Iterable[str],
+    isoformat_batch: BatchIsoformat,
+    isoformat: Callable[[str], Optional[str]],
+    time_format: str
+) -> np.ndarray:
+    timestamps = list(timestamps)
+    if len(timestamps) == 0:
+        return np.empty(0, dtype='datetime64[us]')
+
+    try:
+        iso_timestamps = isoformat_batch(np.array(timestamps, dtype=str))
+        if iso_timestamps is not None:
+            return iso_timestamps.astype('datetime64[us]')
+    except (UnicodeEncodeError, ValueError):
+        pass
+    # Some timestamp does not follow the layout or is not a valid date, let
+    # strptime accept or report each of them
+    parsed: List[datetime] = [_parse(timestamp, isoformat, time_format)
+                              for timestamp in timestamps]
+    return np.array(parsed, dtype='datetime64[us]')
+
+
+def parse_apollo_timestamps(
+    timestamps: Iterable[str]
+) -> np.ndarray:
+    '''
+    Parse many ApolloServer timestamps at once, truncated to microseconds
+
+    Returns
+    -------
+    np.ndarray: The timestamps as datetime64[us], convert it with tolist to
+    get datetimes
+
+    Raises
+    ------
+    ValueError: If a timestamp is not a valid ApolloServer timestamp
+    '''
+    return _parse_batch(
+        timestamps, _apollo_isoformat_batch, _apollo_isoformat,
+        APOLLO_FORMAT)
+
+
+def parse_guralp_timestamps(
+    timestamps: Iterable[str]
+) -> np.ndarray:
+    '''
+    Parse many timestamps of Guralp latency CSV files at once
+
+    Returns
+    -------
+    np.ndarray: The timestamps as datetime64[us]
+
+    Raises
+    ------
+    ValueError: If a timestamp is not a valid Guralp timestamp
+    '''
+    return _parse_batch(
+        timestamps, _guralp_isoformat_batch, _guralp_isoformat,
+        GURALP_FORMAT)
+
+
+def datetime64_to_epoch(
+    times: np.ndarray
+) -> np.ndarray:
+    '''
+    Seconds since 1970-01-01 of datetime64 times, in the same time reference
+    as the times
+    '''
+    return times.astype('datetime64[us]').astype(np.int64) / 10**6
+
+
+def datetimes_to_epoch(
+    times: Iterable[datetime]
+) -> np.ndarray:
+    '''
+    Seconds since 1970-01-01 of naive datetimes, in the same time reference
+    as the datetimes
+    '''
+    return datetime64_to_epoch(np.array(list(times), dtype='datetime64[us]'))
+
+
+def apollo_timestamps_to_epoch(
+    timestamps: Iterable[str]
+) -> np.ndarray:
+    '''
+    Convert ApolloServer timestamps to seconds since 1970-01-01, with the
+    timestamps taken as UTC
+
+    Raises
+    ------
+    ValueError: If a timestamp is not a valid ApolloServer timestamp
+    '''
+    return datetime64_to_epoch(parse_apollo_timestamps(timestamps))
+
+
+def guralp_timestamps_to_epoch(
+    timestamps: Iterable[str]
+) -> np.ndarray:
+    '''
+    Convert Guralp latency CSV timestamps to seconds since 1970-01-01, with
+    the timestamps taken as UTC
+
+    Raises
+    ------
+    ValueError: If a timestamp is not a valid Guralp timestamp
+    '''
+    return datetime64_to_epoch(parse_guralp_timestamps(timestamps))
@@ -0,0 +1,121 @@
+'''
+Benchmark of the ApolloServer check against a local mock ApolloServer
+
+Runs the full check flow at several channel counts and reports wall time,
+number of API requests, bytes received and peak Python memory of the check.
+The mock server runs in its own process so it does not count towards either.
+Run from the repository root:
+
+    python -m benchmarks.bench_apollo_check --channels 100 --channels 1000
+'''
+from acquisition_nagios.apolloserver.apollo_check import ApolloServer, \
+    ApolloCheckOptions, check_apollo_server
+from acquisition_nagios.apolloserver.api_client import ApolloSession
+from tests.apolloserver.mock_apolloserver import REQUESTS_PATH, \
+    mock_apolloserver_process
+from typing import Tuple
+import click
+import requests
+import time
+import tracemalloc
+
+
+@click.command()
+@click.option(
+    '--channels',
+    type=int,
+    multiple=True,
+    help="Channel counts to benchmark",
+    default=[100, 1000, 10000]
+)
+@click.option(
+    '--gaps',
+    type=int,
+    help="Number of gaps in the data of each channel",
+    default=10
+)
+@click.option(
+    '--response-delay',
+    type=float,
+    help="Seconds the mock server waits before answering each request",
+    default=0.0
+)
+@click.option(
+    '--batch-size',
+    type=int,
+    help="Maximum number of channels per latency query",
+    default=50
+)
+@click.option(
+    '--concurrency',
+    type=int,
+    help="Number of latency queries run in parallel",
+    default=1
+)
+@click.option(
+    '--stream/--no-stream',
+    help="Parse the availability response incrementally",
+    default=False
+)
+@click.option(
+    '--compress/--no-compress',
+    help="Gzip the responses of the mock server",
+    default=False
+)
+def main(
+    channels: Tuple[int, ...],
+    gaps: int,
+    response_delay: float,
+    batch_size: int,
+    concurrency: int,
+    stream: bool,
+    compress: bool
+):
+    print(f"{'channels':>9} {'wall (s)':>9} {'requests':>9} " +
+          f"{'wire (MB)':>10} {'json (MB)':>10} {'peak (MB)':>10} state")
+
+    for channel_count in channels:
+        options = ApolloCheckOptions(
+            expected_channels=channel_count,
+            warning='90:',
+            critical='80:',
+            warning_time='5',
+            critical_time='10',
+            warning_count=str(channel_count),
+            critical_count=str(channel_count),
+            batch_size=batch_size,
+            concurrency=concurrency,
+            stream=stream
+        )
+
+        with mock_apolloserver_process(
+                channel_count=channel_count,
+                gaps=gaps,
+                response_delay=response_delay,
+                compress=compress) as port:
+            server = ApolloServer('127.0.0.1', port)
+            session = ApolloSession(pool_size=max(concurrency, 1))
+
+            start = time.perf_counter()
+            result = check_apollo_server(server, options, session)
+            wall_time = time.perf_counter() - start
+            transfer = session.transfer_total()
+            request_count = sum(requests.get(
+                f"http://127.0.0.1:{port}{REQUESTS_PATH}").json().values())
+
+            # Measure memory separately as tracing slows the check down
+            tracemalloc.start()
+            check_apollo_server(server, options, session)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            session.close()
+
+        print(f"{channel_count:>9} {wall_time:>9.3f} {request_count:>9} " +
+              f"{transfer.wire_bytes / 1024 / 1024:>10.2f} " +
+              f"{transfer.decoded_bytes / 1024 / 1024:>10.2f} " +
+              f"{peak / 1024 / 1024:>10.2f} {result.status.name}")
+
+
+if __name__ == '__main__':
+    main()
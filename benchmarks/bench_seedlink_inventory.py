@@ -0,0 +1,74 @@
+'''
+Benchmark of listing the channel inventory from a local mock SeedLink server
+
+Compares the native INFO STREAMS client with slinktool -Q at several station
+counts, reporting the wall time of each. slinktool is only measured when it
+is installed. The mock server runs in its own process. Run from the
+repository root:
+
+    python -m benchmarks.bench_seedlink_inventory --stations 10 --stations 100
+'''
+from acquisition_nagios.guralpdatacenter.inventory import query_slinktool
+from acquisition_nagios.guralpdatacenter.seedlink import query_seedlink
+from tests.guralpdatacenter.mock_seedlink_server import mock_seedlink_process
+from typing import Callable, List, Tuple
+import click
+import shutil
+import time
+
+
+def measure(
+    query: Callable[..., List[str]],
+    port: str,
+    repeat: int
+) -> Tuple[float, int]:
+    '''
+    Best wall time of a query over the repetitions, and its channel count
+    '''
+    best = float('inf')
+    channels: List[str] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        channels = query(gdc_address='127.0.0.1', seedlink_port=port)
+        best = min(best, time.perf_counter() - start)
+    return best, len(channels)
+
+
+@click.command()
+@click.option(
+    '--stations',
+    type=int,
+    multiple=True,
+    help="Station counts to benchmark",
+    default=[10, 100, 1000]
+)
+@click.option(
+    '--repeat',
+    type=int,
+    help="Number of times each query runs, the best time is reported",
+    default=5
+)
+def main(
+    stations: Tuple[int, ...],
+    repeat: int
+):
+    has_slinktool = shutil.which('slinktool') is not None
+
+    print(f"{'stations':>9} {'channels':>9} {'seedlink (s)':>13} " +
+          f"{'slinktool (s)':>14}")
+
+    for station_count in stations:
+        with mock_seedlink_process(station_count=station_count) as port:
+            native_time, channel_count = measure(query_seedlink, port, repeat)
+            if has_slinktool:
+                slinktool_time, _ = measure(query_slinktool, port, repeat)
+                slinktool_column = f"{slinktool_time:>14.4f}"
+            else:
+                slinktool_column = f"{'n/a':>14}"
+
+        print(f"{station_count:>9} {channel_count:>9} " +
+              f"{native_time:>13.4f} {slinktool_column}")
+
+
+if __name__ == '__main__':
+    main()
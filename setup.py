@@ -19,9 +19,15 @@ setup(
     install_requires=[
         'requests',
         'click',
-        'dataclasses'
+        'dataclasses',
+        'numpy'
     ],
     extras_require={
+        # Faster decoding of ApolloServer responses
+        'fast': [
+            'msgspec',
+            'orjson'
+        ],
         'dev': [
             'pytest',
             'pytest-cov',
@@ -33,7 +39,9 @@ setup(
             'check_apollo_availability = \
                 acquisition_nagios.bin.check_apollo_availability:main',
             'check_guralp_availability = \
-                acquisition_nagios.bin.check_guralp_availability:main'
+                acquisition_nagios.bin.check_guralp_availability:main',
+            'guralp_latency_watcher = \
+                acquisition_nagios.bin.guralp_latency_watcher:main'
         ]
     }
 )
@@ -0,0 +1,251 @@
+'''
+Local stand-in for the ApolloServer Availability API, used by the tests and
+the benchmarks
+
+Serves the availability.json and availability/summary/intervals endpoints
+for a configurable number of generated channels.
+'''
+from datetime import datetime, timedelta
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import multiprocessing
+import threading
+import time
+from typing import Dict, Iterator, List
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlsplit
+
+
+AVAILABILITY_PATH = '/api/v1/channels/availability.json'
+INTERVALS_PATH = '/api/v1/channels/availability/summary/intervals'
+# Not part of the ApolloServer API, returns the request count per path
+REQUESTS_PATH = '/mock/requests'
+
+_QUERY_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def channel_name(
+    index: int
+) -> str:
+    return f"QW.S{index:05d}.00.HN{'ZNE'[index % 3]}"
+
+
+def format_time(
+    time: datetime
+) -> str:
+    '''
+    Format a time the way the ApolloServer does, with nanoseconds
+    '''
+    return time.strftime('%Y-%m-%dT%H:%M:%S.%f') + '000Z'
+
+
+class MockApolloServer(object):
+    '''
+    ApolloServer stand-in running in a background thread
+
+    Use as a context manager, the API is available on 127.0.0.1 at the port
+    given by the port attribute.
+    '''
+    def __init__(
+        self,
+        channel_count: int = 100,
+        gaps: int = 0,
+        unavailable_every: int = 0,
+        response_delay: float = 0.0,
+        compress: bool = False
+    ):
+        '''
+        Parameters
+        ----------
+        channel_count: int
+            The number of channels reported by the server
+
+        gaps: int
+            The number of gaps in the data of each channel, each gap adds a
+            range to the availability response
+
+        unavailable_every: int
+            Make every nth channel unavailable, never if 0
+
+        response_delay: float
+            Seconds to wait before answering each request
+
+        compress: bool
+            Gzip the responses to clients that accept it
+        '''
+        self.channel_count = channel_count
+        self.gaps = gaps
+        self.unavailable_every = unavailable_every
+        self.response_delay = response_delay
+        self.compress = compress
+        self.request_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> str:
+        return str(self._server.server_address[1])
+
+    @property
+    def request_count(self) -> int:
+        return sum(self.request_counts.values())
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.request_counts = {}
+
+    def __enter__(self) -> 'MockApolloServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def is_available(
+        self,
+        index: int
+    ) -> bool:
+        return self.unavailable_every == 0 or \
+            index % self.unavailable_every != 0
+
+    def availability(
+        self,
+        start_time: datetime,
+        end_time: datetime
+    ) -> Dict:
+        '''
+        Generate the timeseries availability of every channel
+        '''
+        channels: List[Dict] = []
+        span = (end_time - start_time) / (2 * self.gaps + 1)
+
+        for index in range(self.channel_count):
+            ranges: List[Dict] = []
+            if self.is_available(index):
+                # The last data of each channel is between 0 and 5s old
+                last_end = end_time - timedelta(
+                    seconds=index % 5, milliseconds=(index * 10) % 1000)
+                for gap in range(self.gaps + 1):
+                    range_start = start_time + span * 2 * gap
+                    range_end = last_end if gap == self.gaps \
+                        else range_start + span
+                    ranges.append({
+                        'startTime': format_time(range_start),
+                        'endTime': format_time(range_end),
+                        'firstSequence': gap * 1000,
+                        'lastSequence': gap * 1000 + 999
+                    })
+            channels.append({'id': channel_name(index), 'ranges': ranges})
+
+        return {'availability': channels}
+
+    def intervals(
+        self,
+        sncls: List[str]
+    ) -> Dict:
+        '''
+        Generate the arrival metrics of the requested channels
+        '''
+        return {'availability': [{
+            'id': sncl,
+            'intervals': [{
+                'latency': {'average': (int(sncl[4:9]) % 20) / 2}
+            }]
+        } for sncl in sncls]}
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                query = parse_qs(url.query)
+
+                with mock._lock:
+                    if url.path != REQUESTS_PATH:
+                        mock.request_counts[url.path] = \
+                            mock.request_counts.get(url.path, 0) + 1
+
+                if url.path == REQUESTS_PATH:
+                    self.send_json(mock.request_counts)
+                    return
+
+                if mock.response_delay > 0:
+                    time.sleep(mock.response_delay)
+
+                if url.path == AVAILABILITY_PATH:
+                    payload = mock.availability(
+                        datetime.strptime(
+                            query['startTime'][0], _QUERY_TIME_FORMAT),
+                        datetime.strptime(
+                            query['endTime'][0], _QUERY_TIME_FORMAT))
+                elif url.path == INTERVALS_PATH:
+                    payload = mock.intervals(query['channels'][0].split(','))
+                else:
+                    self.send_error(404)
+                    return
+
+                self.send_json(payload)
+
+            def send_json(self, payload: Dict):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(200)
+                if mock.compress and 'gzip' in \
+                        self.headers.get('Accept-Encoding', ''):
+                    body = gzip.compress(body, compresslevel=6)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _serve(
+    connection,
+    **kwargs
+) -> None:
+    with MockApolloServer(**kwargs) as mock:
+        connection.send(mock.port)
+        # Serve until the parent asks to stop
+        try:
+            connection.recv()
+        except EOFError:
+            pass
+
+
+@contextmanager
+def mock_apolloserver_process(
+    **kwargs
+) -> Iterator[str]:
+    '''
+    Run a MockApolloServer in a separate process, so that it does not share
+    CPU time and memory with the code being measured
+
+    Accepts the arguments of MockApolloServer and yields the port it listens
+    on. The request counts are available from the REQUESTS_PATH endpoint.
+    '''
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=_serve, args=(child,), kwargs=kwargs, daemon=True)
+    process.start()
+    try:
+        yield parent.recv()
+    finally:
+        parent.send(None)
+        parent.close()
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
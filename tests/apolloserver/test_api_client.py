@@ -0,0 +1,194 @@
+from acquisition_nagios.apolloserver.api_client import ApolloSession
+from acquisition_nagios.apolloserver.availability_health import \
+    assemble_availability_url, get_api_json
+from acquisition_nagios.apolloserver.availability_stream import \
+    parse_availability_stream
+from acquisition_nagios.apolloserver.resilience import CircuitBreaker, \
+    CircuitOpenError, RetryPolicy
+from tests.apolloserver.mock_apolloserver import AVAILABILITY_PATH, \
+    MockApolloServer
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import pytest
+import requests
+
+
+class JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'{"availability": []}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FlakyHandler(JsonHandler):
+    # Number of requests answered with a 503 before answering normally
+    failures = 0
+    requests = 0
+
+    def do_GET(self):
+        FlakyHandler.requests += 1
+        if FlakyHandler.requests <= FlakyHandler.failures:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        super().do_GET()
+
+
+class TruncatedHandler(JsonHandler):
+    # Number of requests whose body is cut short before answering normally
+    failures = 0
+    requests = 0
+
+    def do_GET(self):
+        TruncatedHandler.requests += 1
+        if TruncatedHandler.requests <= TruncatedHandler.failures:
+            body = b'{"availability": []}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body[:5])
+            self.close_connection = True
+            return
+        super().do_GET()
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def server_url():
+    yield from serve(JsonHandler)
+
+
+@pytest.fixture
+def flaky_server_url():
+    FlakyHandler.requests = 0
+    yield from serve(FlakyHandler)
+
+
+@pytest.fixture
+def truncated_server_url():
+    TruncatedHandler.requests = 0
+    yield from serve(TruncatedHandler)
+
+
+def test_apollo_session_reuses_connections(server_url):
+    session = ApolloSession(pool_size=1)
+
+    for _ in range(3):
+        assert session.get(server_url).json() == {"availability": []}
+
+    statistics = list(session.statistics().values())
+
+    assert len(statistics) == 1
+    assert statistics[0].requests == 3
+    assert statistics[0].connections == 1
+    assert statistics[0].reused == 2
+
+    session.close()
+
+
+def test_apollo_session_retries(flaky_server_url):
+    FlakyHandler.failures = 2
+    session = ApolloSession(retry=RetryPolicy(retries=2, backoff=0.01))
+
+    assert session.get(flaky_server_url).json() == {"availability": []}
+    assert FlakyHandler.requests == 3
+
+    session.close()
+
+
+def test_apollo_session_circuit_breaker(flaky_server_url):
+    FlakyHandler.failures = 100
+    session = ApolloSession(
+        retry=RetryPolicy(retries=1, backoff=0.01),
+        breaker=CircuitBreaker(failure_threshold=2))
+
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            session.get(flaky_server_url)
+    assert FlakyHandler.requests == 4
+
+    # The server is no longer queried
+    with pytest.raises(CircuitOpenError):
+        session.get(flaky_server_url)
+    assert FlakyHandler.requests == 4
+
+    session.close()
+
+
+def test_apollo_session_stream_retries(truncated_server_url):
+    TruncatedHandler.failures = 1
+    session = ApolloSession(retry=RetryPolicy(retries=1, backoff=0.01))
+
+    availability = session.stream(
+        truncated_server_url, parse_availability_stream, 2)
+    assert availability == {"availability": []}
+    assert TruncatedHandler.requests == 2
+
+    session.close()
+
+
+def test_apollo_session_stream_circuit_breaker(truncated_server_url):
+    TruncatedHandler.failures = 100
+    session = ApolloSession(breaker=CircuitBreaker(failure_threshold=2))
+
+    # The body fails while it is read, after the response was received
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            session.stream(truncated_server_url, parse_availability_stream, 2)
+    assert TruncatedHandler.requests == 2
+
+    with pytest.raises(CircuitOpenError):
+        session.stream(truncated_server_url, parse_availability_stream, 2)
+    assert TruncatedHandler.requests == 2
+
+    session.close()
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_apollo_session_transfer_statistics(stream):
+    with MockApolloServer(channel_count=200, gaps=5, compress=True) as mock:
+        url = assemble_availability_url(
+            '127.0.0.1', datetime(2022, 6, 20, 0, 0, 0),
+            datetime(2022, 6, 20, 1, 0, 0), port=mock.port)
+        endpoint = f"127.0.0.1:{mock.port}{AVAILABILITY_PATH}"
+
+        session = ApolloSession()
+        availability = get_api_json(url, session=session, stream=stream)
+        assert len(availability['availability']) == 200
+
+        transfers = session.transfer_statistics()
+        assert list(transfers) == [endpoint]
+        assert transfers[endpoint].responses == 1
+        assert transfers[endpoint].wire_bytes < \
+            transfers[endpoint].decoded_bytes
+        assert session.transfer_total(f"127.0.0.1:{mock.port}") == \
+            transfers[endpoint]
+        assert session.transfer_total("127.0.0.1:1").responses == 0
+        session.close()
+
+        # Without compression the whole payload is transferred
+        session = ApolloSession(compression=False)
+        get_api_json(url, session=session, stream=stream)
+        transfer = session.transfer_total()
+        assert transfer.wire_bytes == transfer.decoded_bytes
+        assert transfer.decoded_bytes == transfers[endpoint].decoded_bytes
+        session.close()
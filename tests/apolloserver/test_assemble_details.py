@@ -0,0 +1,23 @@
+from acquisition_nagios.apolloserver.availability_health import \
+    AcquisionStatistics, ChannelLatency, assemble_details
+from datetime import datetime
+
+
+def test_assemble_details():
+    time = datetime(2022, 6, 20, 1, 0, 0)
+    statistics = AcquisionStatistics(
+        channel_latency=[
+            ChannelLatency('QW.OK.00.HNZ', time, 1.0),
+            ChannelLatency('QW.CRIT.00.HNZ', time, 40.0),
+            ChannelLatency('QW.WARN.00.HNZ', time, 25.0)],
+        unavailable_channels=['QW.MISSING.00.HNZ'])
+
+    details = assemble_details(statistics, '20', '30')
+
+    sections = details.split('\nChannels ')
+    assert sections[0].startswith('Stale channels:\nQW.MISSING.00.HNZ')
+    assert sections[1].startswith('above with latency above 30s:\n')
+    assert sections[1].count('\n') == 2 and 'QW.CRIT.00.HNZ' in sections[1]
+    assert sections[2].startswith('above with latency above 20s:\n')
+    assert sections[2].count('\n') == 2 and 'QW.WARN.00.HNZ' in sections[2]
+    assert sections[3].startswith('with good latency:\nQW.OK.00.HNZ')
@@ -0,0 +1,135 @@
+from acquisition_nagios.apolloserver.apollo_check import ApolloServer, \
+    ApolloCheckOptions, check_apollo_server
+from acquisition_nagios.apolloserver.api_client import ApolloSession
+from acquisition_nagios.nagios.models import NagiosOutputCode
+from tests.apolloserver.mock_apolloserver import INTERVALS_PATH, \
+    MockApolloServer
+import pytest
+
+
+OPTIONS = ApolloCheckOptions(
+    expected_channels=20,
+    warning='90:',
+    critical='80:',
+    warning_time='20',
+    critical_time='30',
+    warning_count='1',
+    critical_count='2',
+    batch_size=50
+)
+
+
+@pytest.mark.parametrize('concurrency, typed', [
+    (1, False), (4, False), (1, True), (4, True)])
+def test_check_apollo_server(concurrency, typed):
+    with MockApolloServer(channel_count=20, gaps=3) as mock:
+        options = ApolloCheckOptions(**{
+            **OPTIONS.__dict__, 'concurrency': concurrency, 'typed': typed})
+
+        result = check_apollo_server(
+            server=ApolloServer('127.0.0.1', mock.port),
+            options=options,
+            session=ApolloSession()
+        )
+
+        assert result.status == NagiosOutputCode.ok
+        assert result.summary.startswith(
+            'OK: 100.00% of expected channels available')
+        # Channels are grouped by the second of their last timestamp
+        assert mock.request_counts[INTERVALS_PATH] == 6
+
+
+def test_check_apollo_server_unavailable_channels():
+    with MockApolloServer(channel_count=20, unavailable_every=4) as mock:
+        result = check_apollo_server(
+            server=ApolloServer('127.0.0.1', mock.port),
+            options=OPTIONS,
+            session=ApolloSession()
+        )
+
+        assert result.status == NagiosOutputCode.critical
+        assert result.summary.startswith(
+            'CRITICAL: 75.00% of expected channels available')
+
+
+def test_check_apollo_server_mask(tmp_path):
+    # Mask the unavailable channels, S00000 to S00016 every 4 channels
+    mask_file = tmp_path.joinpath('mask.txt')
+    mask_file.write_text('QW.S0000[048].00.*\nQW.S00012.00.HNZ\nQW.S00016.*\n')
+
+    with MockApolloServer(channel_count=20, unavailable_every=4) as mock:
+        options = ApolloCheckOptions(**{
+            **OPTIONS.__dict__, 'expected_channels': 15,
+            'mask_file': str(mask_file)})
+
+        result = check_apollo_server(
+            server=ApolloServer('127.0.0.1', mock.port),
+            options=options,
+            session=ApolloSession()
+        )
+
+        assert result.status == NagiosOutputCode.ok
+        assert result.summary.startswith(
+            'OK: 100.00% of expected channels available')
+
+
+def test_check_apollo_server_channels():
+    with MockApolloServer(channel_count=20) as mock:
+        options = ApolloCheckOptions(**{
+            **OPTIONS.__dict__, 'expected_channels': 7, 'channels': 'HNZ',
+            'batch_size': 1})
+
+        result = check_apollo_server(
+            server=ApolloServer('127.0.0.1', mock.port),
+            options=options,
+            session=ApolloSession()
+        )
+
+        assert result.summary.startswith(
+            'OK: 100.00% of expected channels available')
+        # Only the latency of the selected channels is queried
+        assert mock.request_counts[INTERVALS_PATH] == 7
+
+
+@pytest.mark.parametrize('concurrency', [1, 4])
+def test_check_apollo_server_stale(tmp_path, concurrency):
+    options = ApolloCheckOptions(**{
+        **OPTIONS.__dict__, 'concurrency': concurrency,
+        'cache_dir': str(tmp_path), 'cache_ttl': -1,
+        'stale_while_revalidate': True})
+
+    with MockApolloServer(channel_count=20) as mock:
+        server = ApolloServer('127.0.0.1', mock.port)
+        result = check_apollo_server(server, options, ApolloSession())
+        assert result.status == NagiosOutputCode.ok
+
+    # The server is stopped, its last response and latencies are reported
+    # without querying it again
+    result = check_apollo_server(server, options, ApolloSession())
+
+    assert result.status == NagiosOutputCode.ok
+    assert result.summary.startswith(
+        'OK: 100.00% of expected channels available. STALE: using data ' +
+        'retrieved at ')
+    assert 's ago.' in result.summary
+    assert 'DEADLINE' not in result.summary
+    assert 'stale_age' in [
+        performance.label for performance in result.performances]
+    # The latency of every channel, measured by the previous check
+    assert result.details.count('s latency\n') == 20
+
+
+def test_check_apollo_server_expected_channels_missing():
+    options = ApolloCheckOptions(**{
+        **OPTIONS.__dict__, 'expected_channels': None})
+
+    with MockApolloServer(channel_count=20) as mock:
+        with pytest.raises(ValueError, match='No expected channel count'):
+            check_apollo_server(
+                server=ApolloServer('127.0.0.1', mock.port),
+                options=options,
+                session=ApolloSession()
+            )
+
+        # Reported before querying the server
+        assert sum(mock.request_counts.values()) == 0
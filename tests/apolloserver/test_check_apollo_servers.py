@@ -0,0 +1,61 @@
+from acquisition_nagios.apolloserver import apollo_check
+from acquisition_nagios.apolloserver.apollo_check import ApolloServer, \
+    ApolloCheckOptions, check_apollo_servers, parse_server
+from acquisition_nagios.apolloserver.api_client import ApolloSession
+from acquisition_nagios.nagios.models import NagiosOutputCode, NagiosResult
+import pytest
+
+
+def test_parse_server():
+    assert parse_server('localhost') == ApolloServer('localhost', '8787')
+    assert parse_server('apollo1:8788') == ApolloServer('apollo1', '8788')
+    assert parse_server('apollo2:8787=120') == \
+        ApolloServer('apollo2', '8787', 120)
+    with pytest.raises(ValueError):
+        parse_server('apollo1:http')
+    with pytest.raises(ValueError, match='expected channel count'):
+        parse_server('apollo1:8787=all')
+
+
+def test_check_apollo_servers(monkeypatch, caplog):
+    def fake_check_apollo_server(server, options, session, deadline=None):
+        if server.server_url == 'down':
+            raise ConnectionError("Connection refused")
+        if server.server_url == 'broken':
+            raise RuntimeError("Unexpected")
+        return NagiosResult(
+            summary=f'OK: {server.server_url}',
+            status=NagiosOutputCode.ok)
+
+    monkeypatch.setattr(
+        apollo_check, 'check_apollo_server', fake_check_apollo_server)
+
+    options = ApolloCheckOptions(
+        expected_channels=10,
+        warning='90:',
+        critical='80:',
+        warning_time='5',
+        critical_time='10',
+        warning_count='1',
+        critical_count='2'
+    )
+
+    results = check_apollo_servers(
+        servers=[parse_server('up'), parse_server('down'),
+                 parse_server('broken')],
+        options=options,
+        session=ApolloSession()
+    )
+
+    assert [server.server_url for server, _ in results] == \
+        ['up', 'down', 'broken']
+    assert results[0][1].status == NagiosOutputCode.ok
+    assert results[1][1].status == NagiosOutputCode.unknown
+    assert 'Connection refused' in results[1][1].summary
+    assert results[2][1].status == NagiosOutputCode.unknown
+
+    # Only unexpected errors are logged with their traceback
+    records = {record.message: record for record in caplog.records}
+    assert records[
+        "Could not check down:8787: Connection refused"].exc_info is None
+    assert records["Could not check broken:8787"].exc_info is not None
@@ -0,0 +1,114 @@
+from acquisition_nagios.apolloserver.resilience import CircuitBreaker, \
+    CircuitOpenError
+import pytest
+import requests
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def fail(breaker, server='apollo:8787'):
+    with pytest.raises(requests.ConnectionError):
+        with breaker.guard(server):
+            raise requests.ConnectionError("Connection refused")
+
+
+def succeed(breaker, server='apollo:8787'):
+    with breaker.guard(server):
+        pass
+
+
+def test_circuit_breaker_opens_after_threshold():
+    clock = FakeClock()
+    breaker = CircuitBreaker(
+        failure_threshold=3, reset_timeout=60, clock=clock)
+
+    fail(breaker)
+    fail(breaker)
+    # A success resets the count of consecutive failures
+    succeed(breaker)
+    fail(breaker)
+    fail(breaker)
+    assert not breaker.is_open('apollo:8787')
+    fail(breaker)
+    assert breaker.is_open('apollo:8787')
+
+    with pytest.raises(CircuitOpenError):
+        succeed(breaker)
+    # Other servers are not affected
+    succeed(breaker, 'other:8787')
+
+
+def test_circuit_breaker_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker(
+        failure_threshold=1, reset_timeout=60, clock=clock)
+
+    fail(breaker)
+    clock.now += 60
+
+    # A failed probe opens the circuit again for a full reset timeout
+    fail(breaker)
+    with pytest.raises(CircuitOpenError):
+        succeed(breaker)
+
+    clock.now += 60
+    with breaker.guard('apollo:8787'):
+        # Only one probe at a time
+        with pytest.raises(CircuitOpenError):
+            succeed(breaker)
+    assert not breaker.is_open('apollo:8787')
+    succeed(breaker)
+
+
+def test_circuit_breaker_ignores_client_errors():
+    breaker = CircuitBreaker(failure_threshold=1)
+    response = requests.Response()
+    response.status_code = 404
+
+    with pytest.raises(requests.HTTPError):
+        with breaker.guard('apollo:8787'):
+            raise requests.HTTPError("404", response=response)
+    with pytest.raises(KeyError):
+        with breaker.guard('apollo:8787'):
+            raise KeyError('availability')
+
+    assert not breaker.is_open('apollo:8787')
+
+
+def test_circuit_breaker_persists(tmp_path):
+    clock = FakeClock()
+    state_file = tmp_path.joinpath('breaker.json')
+
+    breaker = CircuitBreaker(
+        state_file, failure_threshold=2, reset_timeout=60, clock=clock)
+    fail(breaker)
+    fail(breaker)
+    fail(CircuitBreaker(state_file, clock=clock), 'other:8787')
+
+    # The next run fails fast without sending a request
+    breaker = CircuitBreaker(
+        state_file, failure_threshold=2, reset_timeout=60, clock=clock)
+    assert breaker.is_open('apollo:8787')
+    assert breaker.circuits['other:8787'].failures == 1
+    with pytest.raises(CircuitOpenError):
+        succeed(breaker)
+
+    clock.now += 60
+    succeed(breaker)
+
+    breaker = CircuitBreaker(state_file, clock=clock)
+    assert not breaker.is_open('apollo:8787')
+    assert list(breaker.circuits) == ['other:8787']
+
+
+def test_circuit_breaker_unreadable_state(tmp_path):
+    state_file = tmp_path.joinpath('breaker.json')
+    state_file.write_text('{not json')
+
+    assert CircuitBreaker(state_file).circuits == {}
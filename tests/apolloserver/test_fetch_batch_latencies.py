@@ -0,0 +1,64 @@
+from acquisition_nagios.apolloserver import availability_health
+from acquisition_nagios.apolloserver.availability_health import \
+    fetch_batch_latencies
+from acquisition_nagios.deadline import Deadline
+from datetime import datetime
+import asyncio
+
+
+def test_fetch_batch_latencies(monkeypatch):
+    def fake_get_batch_latency(end_time, server_url, sncls, session=None,
+                               port=None, deadline=None, typed=False):
+        if 'QW.BROKEN.00.HNZ' in sncls:
+            raise ConnectionError("Connection reset")
+        return {sncl: float(end_time.second) for sncl in sncls}
+
+    monkeypatch.setattr(
+        availability_health, 'get_batch_latency', fake_get_batch_latency)
+
+    batches = [
+        (datetime(2022, 6, 20, 1, 0, 1),
+         ['QW.BCV13.00.HNZ', 'QW.BROKEN.00.HNZ']),
+        (datetime(2022, 6, 20, 1, 0, 2),
+         ['QW.QCC01.00.HNZ']),
+    ]
+
+    latencies, errors, unevaluated = asyncio.run(fetch_batch_latencies(
+        batches=batches,
+        server_url='localhost',
+        concurrency=4
+    ))
+
+    assert latencies == {'QW.BCV13.00.HNZ': 1, 'QW.QCC01.00.HNZ': 2}
+    assert errors == {'QW.BROKEN.00.HNZ': 'Connection reset'}
+    assert unevaluated == []
+
+
+def test_fetch_batch_latencies_deadline(monkeypatch):
+    clock = [0.0]
+
+    def fake_get_batch_latency(end_time, server_url, sncls, session=None,
+                               port=None, deadline=None, typed=False):
+        deadline.check()
+        # Each query takes 10 seconds
+        clock[0] += 10
+        return {sncl: 1.0 for sncl in sncls}
+
+    monkeypatch.setattr(
+        availability_health, 'get_batch_latency', fake_get_batch_latency)
+
+    batches = [
+        (datetime(2022, 6, 20, 1, 0, second), [f'QW.STA{second:02d}.00.HNZ'])
+        for second in range(5)]
+
+    latencies, errors, unevaluated = asyncio.run(fetch_batch_latencies(
+        batches=batches,
+        server_url='localhost',
+        concurrency=1,
+        deadline=Deadline(25, reserve=0, clock=lambda: clock[0])
+    ))
+
+    assert sorted(latencies) == ['QW.STA00.00.HNZ', 'QW.STA01.00.HNZ',
+                                 'QW.STA02.00.HNZ']
+    assert errors == {}
+    assert sorted(unevaluated) == ['QW.STA03.00.HNZ', 'QW.STA04.00.HNZ']
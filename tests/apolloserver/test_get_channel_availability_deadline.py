@@ -0,0 +1,98 @@
+from acquisition_nagios.apolloserver import availability_health
+from acquisition_nagios.apolloserver.availability_health import \
+    assemble_details, get_channel_availability, get_latency_threshold_state
+from acquisition_nagios.deadline import Deadline
+from acquisition_nagios.nagios.models import NagiosOutputCode
+from datetime import datetime
+import pytest
+
+
+AVAILABILITY = {'availability': [
+    {'id': f'QW.STA{second:02d}.00.HNZ',
+     'ranges': [{'endTime': f'2022-06-20T00:59:{second:02d}.000000000Z'}]}
+    for second in range(4)
+] + [{'id': 'QW.MISSING.00.HNZ', 'ranges': []}]}
+
+
+@pytest.mark.parametrize('concurrency', [1, 2])
+def test_get_channel_availability_deadline(monkeypatch, concurrency):
+    clock = [0.0]
+
+    def fake_get_batch_latency(end_time, server_url, sncls, session=None,
+                               port=None, deadline=None, typed=False):
+        deadline.check()
+        # Each query takes 10 seconds
+        clock[0] += 10
+        return {sncl: 1.0 for sncl in sncls}
+
+    monkeypatch.setattr(
+        availability_health, 'get_batch_latency', fake_get_batch_latency)
+
+    statistics = get_channel_availability(
+        availability=AVAILABILITY,
+        end_time=datetime(2022, 6, 20, 1, 0, 0),
+        server_url='localhost',
+        concurrency=concurrency,
+        deadline=Deadline(15, reserve=0, clock=lambda: clock[0])
+    )
+
+    evaluated = [stats.channel for stats in statistics.channel_latency]
+    assert len(evaluated) + len(statistics.unevaluated_channels) == 4
+    assert len(statistics.unevaluated_channels) >= 2
+    # Channels are reported in the order of the availability response
+    assert evaluated + statistics.unevaluated_channels == [
+        f'QW.STA{second:02d}.00.HNZ' for second in range(4)]
+    assert statistics.unavailable_channels == ['QW.MISSING.00.HNZ']
+    assert statistics.failed_channels == {}
+
+
+@pytest.mark.parametrize('concurrency', [1, 2])
+def test_get_channel_availability_failed_channels(monkeypatch, concurrency):
+    def fake_get_batch_latency(end_time, server_url, sncls, session=None,
+                               port=None, deadline=None, typed=False):
+        if 'QW.STA01.00.HNZ' in sncls:
+            raise ConnectionError("Connection reset")
+        return {sncl: 1.0 for sncl in sncls}
+
+    monkeypatch.setattr(
+        availability_health, 'get_batch_latency', fake_get_batch_latency)
+
+    statistics = get_channel_availability(
+        availability=AVAILABILITY,
+        end_time=datetime(2022, 6, 20, 1, 0, 0),
+        server_url='localhost',
+        concurrency=concurrency,
+        deadline=Deadline(15)
+    )
+
+    # Only the failing channel is left without latency
+    assert [stats.channel for stats in statistics.channel_latency] == [
+        'QW.STA00.00.HNZ', 'QW.STA02.00.HNZ', 'QW.STA03.00.HNZ']
+    assert statistics.failed_channels == {
+        'QW.STA01.00.HNZ': "Connection reset"}
+    assert statistics.unevaluated_channels == []
+
+    # Failed channels count as critical channels by default, whatever the
+    # state of the channels not evaluated
+    results = get_latency_threshold_state(
+        statistics, warn_time='60', crit_time='120', warn_threshold='1',
+        crit_threshold='1')
+    assert results.state == NagiosOutputCode.ok
+    assert results.crit_count == 1
+
+    for failed_state, state, crit_count in [
+            (NagiosOutputCode.unknown, NagiosOutputCode.unknown, 0),
+            (NagiosOutputCode.critical, NagiosOutputCode.critical, 1),
+            (NagiosOutputCode.ok, NagiosOutputCode.ok, 0)]:
+        results = get_latency_threshold_state(
+            statistics, warn_time='60', crit_time='120', warn_threshold='1',
+            crit_threshold='0', unevaluated_state=NagiosOutputCode.unknown,
+            failed_state=failed_state)
+        assert results.state == state
+        assert results.crit_count == crit_count
+
+    details = assemble_details(statistics, '60', '120')
+    assert "Channels with latency errors:\nQW.STA01.00.HNZ: " + \
+        "Connection reset" in details
+    good = details.split("Channels with good latency:\n")[1]
+    assert len(good.splitlines()) == 3
@@ -0,0 +1,27 @@
+from acquisition_nagios.apolloserver.availability_health import \
+    group_latency_queries
+from datetime import datetime
+import pytest
+
+
+def test_group_latency_queries():
+    last_times = [
+        ('QW.BCV13.00.HNZ', datetime(2022, 6, 20, 1, 0, 0, 430000)),
+        ('QW.BCV13.00.HNN', datetime(2022, 6, 20, 1, 0, 0, 300000)),
+        ('QW.BCV13.00.HNE', datetime(2022, 6, 20, 1, 0, 0, 260000)),
+        ('QW.QCC01.00.HNZ', datetime(2022, 6, 20, 1, 0, 1, 400000)),
+    ]
+
+    batches = group_latency_queries(last_times, batch_size=2)
+
+    assert batches == [
+        (datetime(2022, 6, 20, 1, 0, 0),
+         ['QW.BCV13.00.HNZ', 'QW.BCV13.00.HNN']),
+        (datetime(2022, 6, 20, 1, 0, 0),
+         ['QW.BCV13.00.HNE']),
+        (datetime(2022, 6, 20, 1, 0, 1),
+         ['QW.QCC01.00.HNZ']),
+    ]
+
+    with pytest.raises(ValueError):
+        group_latency_queries(last_times, batch_size=0)
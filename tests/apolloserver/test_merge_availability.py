@@ -0,0 +1,69 @@
+from acquisition_nagios.apolloserver.incremental import \
+    AvailabilityCursor, get_query_start, load_cursor, merge_availability, \
+    save_cursor
+from datetime import datetime, timedelta
+
+
+def test_get_query_start():
+    end_time = datetime(2022, 6, 20, 1, 0, 0)
+
+    assert get_query_start(None, end_time) == \
+        (datetime(2022, 6, 20, 0, 0, 0), False)
+
+    cursor = AvailabilityCursor(last_query=datetime(2022, 6, 20, 0, 59, 0))
+    assert get_query_start(cursor, end_time, overlap=timedelta(0)) == \
+        (datetime(2022, 6, 20, 0, 59, 0), True)
+
+    cursor = AvailabilityCursor(last_query=datetime(2022, 6, 19, 23, 0, 0))
+    assert get_query_start(cursor, end_time) == \
+        (datetime(2022, 6, 20, 0, 0, 0), False)
+
+
+def test_merge_availability(tmp_path):
+    cursor = AvailabilityCursor(
+        last_query=datetime(2022, 6, 20, 0, 59, 0),
+        channels={
+            "QW.BCV13.00.HNZ": "2022-06-20T00:58:59.430000000Z",
+            "QW.BCV13.00.HNN": "2022-06-20T00:10:00.000000000Z",
+            "QW.BCV13.00.HNE": "2022-06-19T23:10:00.000000000Z",
+            "QW.REMOVED.00.HNZ": "2022-06-20T00:58:00.000000000Z"
+        })
+
+    # Only the first channel received data since the previous check
+    availability_slice = {
+        "availability": [
+            {
+                "id": "QW.BCV13.00.HNZ",
+                "ranges": [{"endTime": "2022-06-20T00:59:59.430000000Z"}]
+            },
+            {"id": "QW.BCV13.00.HNN", "ranges": []},
+            {"id": "QW.BCV13.00.HNE", "ranges": []},
+            {"id": "QW.NEW.00.HNZ", "ranges": []}
+        ]
+    }
+
+    availability, new_cursor = merge_availability(
+        cursor=cursor,
+        availability=availability_slice,
+        end_time=datetime(2022, 6, 20, 1, 0, 0))
+
+    assert availability == {
+        "availability": [
+            {
+                "id": "QW.BCV13.00.HNZ",
+                "ranges": [{"endTime": "2022-06-20T00:59:59.430000000Z"}]
+            },
+            {
+                "id": "QW.BCV13.00.HNN",
+                "ranges": [{"endTime": "2022-06-20T00:10:00.000000000Z"}]
+            },
+            {"id": "QW.BCV13.00.HNE", "ranges": []},
+            {"id": "QW.NEW.00.HNZ", "ranges": []}
+        ]
+    }
+    assert "QW.REMOVED.00.HNZ" not in new_cursor.channels
+    assert new_cursor.last_query == datetime(2022, 6, 20, 1, 0, 0)
+
+    state_file = tmp_path.joinpath('state.json')
+    save_cursor(state_file, new_cursor)
+    assert load_cursor(state_file) == new_cursor
@@ -0,0 +1,62 @@
+from acquisition_nagios.apolloserver.availability_stream import \
+    parse_availability_stream
+import json
+import pytest
+
+
+AVAILABILITY = {
+    "version": 1,
+    "availability": [
+        {
+            "id": "QW.BCV13.00.HNZ",
+            "ranges": [
+                {
+                    "startTime": "2022-06-19T23:59:59.950000000Z",
+                    "endTime": "2022-06-20T00:30:00.000000000Z",
+                    "firstSequence": 852772,
+                    "lastSequence": 855000
+                },
+                {
+                    "startTime": "2022-06-20T00:31:00.000000000Z",
+                    "endTime": "2022-06-20T01:00:00.430000000Z",
+                    "firstSequence": 855001,
+                    "lastSequence": 859695
+                }
+            ],
+            "extra": {"nested": [1, 2.5, "été"]}
+        },
+        {
+            "id": "QW.QCC07.00.HNZ",
+            "ranges": []
+        }
+    ],
+    "total": 123456
+}
+
+
+def chunked(data: bytes, size: int):
+    for index in range(0, len(data), size):
+        yield data[index:index + size]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 100000])
+def test_parse_availability_stream(size):
+    data = json.dumps(AVAILABILITY, indent=2).encode('utf-8')
+
+    assert parse_availability_stream(chunked(data, size)) == {
+        "availability": [
+            {
+                "id": "QW.BCV13.00.HNZ",
+                "ranges": [AVAILABILITY["availability"][0]["ranges"][1]]
+            },
+            {
+                "id": "QW.QCC07.00.HNZ",
+                "ranges": []
+            }
+        ]
+    }
+
+
+def test_parse_availability_stream_invalid():
+    with pytest.raises(ValueError):
+        parse_availability_stream(chunked(b'{"availability": [{"id": ', 4))
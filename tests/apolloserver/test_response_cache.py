@@ -0,0 +1,67 @@
+from acquisition_nagios.apolloserver.response_cache import ResponseCache, \
+    snap_to_bucket
+from datetime import datetime
+import pytest
+import requests
+
+
+URL = ("http://localhost:8787/api/v1/channels/availability.json" +
+       "?type=timeseries&startTime=2022-06-01T00:00:00.000Z" +
+       "&endTime=2022-06-01T01:00:00.000Z")
+
+NEXT_URL = ("http://localhost:8787/api/v1/channels/availability.json" +
+            "?type=timeseries&startTime=2022-06-01T00:01:00.000Z" +
+            "&endTime=2022-06-01T01:01:00.000Z")
+
+
+def test_snap_to_bucket():
+    assert snap_to_bucket(datetime(2022, 6, 1, 1, 0, 59, 999), 60) == \
+        datetime(2022, 6, 1, 1, 0, 0)
+    assert snap_to_bucket(datetime(2022, 6, 1, 1, 7, 0), 300) == \
+        datetime(2022, 6, 1, 1, 5, 0)
+    with pytest.raises(ValueError):
+        snap_to_bucket(datetime(2022, 6, 1), 0)
+
+
+def test_response_cache_ttl(tmp_path):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return {"availability": [], "call": len(calls)}
+
+    cache = ResponseCache(cache_dir=tmp_path, ttl=60)
+
+    assert cache.get(URL, fetch).payload["call"] == 1
+    assert cache.get(URL, fetch).payload["call"] == 1
+    # A new window is always fetched
+    assert cache.get(NEXT_URL, fetch).payload["call"] == 2
+
+    cache = ResponseCache(cache_dir=tmp_path, ttl=0)
+    assert cache.get(NEXT_URL, fetch).payload["call"] == 3
+
+
+def test_response_cache_stale_while_revalidate(tmp_path):
+    def fail():
+        raise requests.ConnectionError("Connection refused")
+
+    ResponseCache(cache_dir=tmp_path).get(URL, lambda: {"availability": []})
+
+    with pytest.raises(requests.ConnectionError):
+        ResponseCache(cache_dir=tmp_path).get(NEXT_URL, fail)
+
+    cached = ResponseCache(
+        cache_dir=tmp_path,
+        stale_while_revalidate=True
+    ).get(NEXT_URL, fail)
+
+    assert cached.stale
+    assert cached.url == URL
+    assert cached.payload == {"availability": []}
+
+    with pytest.raises(requests.ConnectionError):
+        ResponseCache(
+            cache_dir=tmp_path,
+            stale_while_revalidate=True,
+            max_stale=-1
+        ).get(NEXT_URL, fail)
@@ -0,0 +1,84 @@
+from acquisition_nagios.apolloserver.resilience import RetryPolicy, \
+    is_transient_error
+from acquisition_nagios.deadline import Deadline
+import pytest
+import requests
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(f"{status_code} Error", response=response)
+
+
+def failing(errors, result='ok'):
+    errors = list(errors)
+    calls = []
+
+    def request():
+        calls.append(len(calls))
+        if len(errors) > 0:
+            raise errors.pop(0)
+        return result
+
+    return request, calls
+
+
+def test_is_transient_error():
+    assert is_transient_error(requests.ConnectionError("reset"))
+    assert is_transient_error(requests.ReadTimeout("timeout"))
+    assert is_transient_error(requests.exceptions.ChunkedEncodingError())
+    assert is_transient_error(http_error(503))
+    assert not is_transient_error(http_error(404))
+    assert not is_transient_error(KeyError('availability'))
+
+
+def test_retry_policy_retries_transient_errors():
+    delays = []
+    request, calls = failing([
+        requests.ConnectionError("reset"), http_error(503)])
+
+    policy = RetryPolicy(retries=2, backoff=1, max_backoff=1.5)
+
+    assert policy.call(request, sleep=delays.append) == 'ok'
+    assert len(calls) == 3
+    assert len(delays) == 2
+    assert 0 <= delays[0] <= 1
+    assert 0 <= delays[1] <= 1.5
+
+
+def test_retry_policy_gives_up():
+    request, calls = failing([requests.ConnectionError("reset")] * 3)
+
+    with pytest.raises(requests.ConnectionError):
+        RetryPolicy(retries=2).call(request, sleep=lambda delay: None)
+    assert len(calls) == 3
+
+
+def test_retry_policy_does_not_retry_permanent_errors():
+    request, calls = failing([http_error(404)])
+
+    with pytest.raises(requests.HTTPError):
+        RetryPolicy(retries=2).call(request, sleep=lambda delay: None)
+    assert len(calls) == 1
+
+
+def test_retry_policy_stops_at_deadline():
+    request, calls = failing([requests.ConnectionError("reset")] * 3)
+    deadline = Deadline(1, reserve=0, clock=lambda: 0)
+
+    policy = RetryPolicy(retries=2)
+    policy.delay = lambda retry: 5
+
+    # The backoff would end after the deadline
+    with pytest.raises(requests.ConnectionError):
+        policy.call(request, deadline=deadline, sleep=lambda delay: None)
+    assert len(calls) == 1
+
+
+def test_retry_policy_delay_bounds():
+    policy = RetryPolicy(backoff=0.5, max_backoff=3)
+
+    for retry in range(6):
+        for _ in range(20):
+            assert 0 <= policy.delay(retry) <= min(3, 0.5 * 2 ** retry)
@@ -0,0 +1,127 @@
+from acquisition_nagios.apolloserver import schemas
+from acquisition_nagios.apolloserver.availability_health import \
+    assemble_availability_url, get_api_json, get_availability, \
+    match_latencies
+from acquisition_nagios.apolloserver.schemas import ApolloSchemaError, \
+    ChannelRange, IntervalLatency
+from tests.apolloserver.mock_apolloserver import MockApolloServer
+from datetime import datetime
+import json
+import pytest
+
+
+AVAILABILITY = {
+    'availability': [
+        {
+            'id': 'QW.BCV01.00.HNZ',
+            'sampleRate': 100.0,
+            'ranges': [
+                {'startTime': '2022-06-20T00:00:00.000000Z',
+                 'endTime': '2022-06-20T00:30:00.000000Z'},
+                {'startTime': '2022-06-20T00:35:00.000000Z',
+                 'endTime': '2022-06-20T00:59:59.990000Z'}
+            ]
+        },
+        {
+            'id': 'QW.BCV02.00.HNZ',
+            'ranges': []
+        }
+    ]
+}
+
+INTERVALS = {
+    'availability': [
+        {'id': 'QW.BCV01.00.HNZ',
+         'intervals': [{'latency': {'average': 2.5, 'minimum': 1}}]},
+        {'id': 'QW.BCV02.00.HNZ',
+         'intervals': [{'latency': {'average': 3}}]}
+    ]
+}
+
+
+@pytest.mark.parametrize('library', schemas.LIBRARIES)
+def test_decode_availability(library):
+    body = json.dumps(AVAILABILITY).encode()
+
+    assert schemas.decode_availability(body, library) == [
+        ChannelRange('QW.BCV01.00.HNZ', '2022-06-20T00:59:59.990000Z'),
+        ChannelRange('QW.BCV02.00.HNZ', None)
+    ]
+
+
+@pytest.mark.parametrize('library', schemas.LIBRARIES)
+def test_decode_intervals(library):
+    body = json.dumps(INTERVALS).encode()
+
+    assert schemas.decode_intervals(body, library) == [
+        IntervalLatency('QW.BCV01.00.HNZ', 2.5),
+        IntervalLatency('QW.BCV02.00.HNZ', 3.0)
+    ]
+
+
+@pytest.mark.parametrize('library', schemas.LIBRARIES)
+@pytest.mark.parametrize('document, message', [
+    ({}, "Object missing required field `availability`"),
+    ({'availability': [{'id': 'QW.BCV01.00.HNZ',
+                        'ranges': [{'startTime': '2022'}]}]},
+     "Object missing required field `endTime` - at " +
+     "`$.availability[0].ranges[0]`"),
+    ({'availability': [{'id': 1, 'ranges': []}]},
+     "Expected `str`, got `int` - at `$.availability[0].id`"),
+    ({'availability': {}},
+     "Expected `array`, got `object` - at `$.availability`"),
+])
+def test_decode_availability_invalid(library, document, message):
+    with pytest.raises(ApolloSchemaError) as error:
+        schemas.decode_availability(json.dumps(document).encode(), library)
+
+    assert str(error.value) == message
+    # Raised where indexing the response directly raised a KeyError
+    assert isinstance(error.value, KeyError)
+
+
+@pytest.mark.parametrize('library', schemas.LIBRARIES)
+@pytest.mark.parametrize('document, message', [
+    ({'availability': [{'intervals': []}]},
+     "Expected at least one interval - at `$.availability[0].intervals`"),
+    ({'availability': [{'intervals': [{'latency': {'average': 'slow'}}]}]},
+     "Expected `float`, got `str` - at " +
+     "`$.availability[0].intervals[0].latency.average`"),
+])
+def test_decode_intervals_invalid(library, document, message):
+    with pytest.raises(ApolloSchemaError) as error:
+        schemas.decode_intervals(json.dumps(document).encode(), library)
+
+    assert str(error.value) == message
+
+
+@pytest.mark.parametrize('library', schemas.LIBRARIES)
+def test_decode_invalid_json(library):
+    with pytest.raises(ValueError):
+        schemas.decode_availability(b'{"availability": [', library)
+
+
+def test_match_latencies():
+    latencies = [IntervalLatency(None, 1.0), IntervalLatency(None, 2.0)]
+
+    # Entries without an id are matched by position
+    assert match_latencies(latencies, ['QW.A.00.HNZ', 'QW.B.00.HNZ']) == {
+        'QW.A.00.HNZ': 1.0, 'QW.B.00.HNZ': 2.0}
+
+    with pytest.raises(KeyError):
+        match_latencies(latencies[:1], ['QW.A.00.HNZ', 'QW.B.00.HNZ'])
+
+
+def test_get_availability_typed():
+    with MockApolloServer(channel_count=50, gaps=3) as mock:
+        url = assemble_availability_url(
+            '127.0.0.1', datetime(2022, 6, 20, 0, 0, 0),
+            datetime(2022, 6, 20, 1, 0, 0), port=mock.port)
+
+        full = get_api_json(url)
+        typed = get_availability(url, typed=True)
+
+    assert schemas.availability_from_json(typed) == \
+        schemas.availability_from_json(full)
+    assert all(len(channel['ranges']) <= 1
+               for channel in typed['availability'])
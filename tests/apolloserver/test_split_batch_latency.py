@@ -0,0 +1,42 @@
+from acquisition_nagios.apolloserver.availability_health import \
+    split_batch_latency
+import pytest
+
+
+def test_split_batch_latency():
+    latency_json = {
+        "availability": [
+            {
+                "id": "QW.BCV13.00.HNN",
+                "intervals": [{"latency": {"average": 1.5}}]
+            },
+            {
+                "id": "QW.BCV13.00.HNZ",
+                "intervals": [{"latency": {"average": 0.5}}]
+            }
+        ]
+    }
+
+    assert split_batch_latency(
+        latency_json=latency_json,
+        sncls=['QW.BCV13.00.HNZ', 'QW.BCV13.00.HNN']
+    ) == {'QW.BCV13.00.HNZ': 0.5, 'QW.BCV13.00.HNN': 1.5}
+
+    with pytest.raises(KeyError):
+        split_batch_latency(
+            latency_json=latency_json,
+            sncls=['QW.BCV13.00.HNZ', 'QW.MISSING.00.HNZ']
+        )
+
+
+def test_split_batch_latency_without_id():
+    latency_json = {
+        "availability": [
+            {"intervals": [{"latency": {"average": 2}}]}
+        ]
+    }
+
+    assert split_batch_latency(
+        latency_json=latency_json,
+        sncls=['QW.BCV13.00.HNZ']
+    ) == {'QW.BCV13.00.HNZ': 2}
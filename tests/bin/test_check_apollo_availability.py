@@ -0,0 +1,85 @@
+from acquisition_nagios.apolloserver import availability_health
+from acquisition_nagios.bin import check_apollo_availability
+from acquisition_nagios.bin.check_apollo_availability import main
+from acquisition_nagios.nagios.models import NagiosOutputCode
+from tests.apolloserver.mock_apolloserver import MockApolloServer, \
+    channel_name
+from click.testing import CliRunner
+import pytest
+
+
+THRESHOLDS = [
+    '--warning', '90:', '--critical', '80:',
+    '--warning-time', '20', '--critical-time', '30',
+    '--warning-count', '1', '--critical-count', '2'
+]
+
+
+def test_expected_channels_per_server():
+    with MockApolloServer(channel_count=20) as mock:
+        result = CliRunner().invoke(main, THRESHOLDS + [
+            '--server', f'127.0.0.1:{mock.port}=20'])
+
+    assert result.exit_code == NagiosOutputCode.ok.value, result.output
+    assert result.output.startswith(
+        'OK: 100.00% of expected channels available')
+
+
+def test_expected_channels_missing():
+    result = CliRunner().invoke(main, THRESHOLDS + [
+        '--server', '127.0.0.1:8787=20', '--server', '127.0.0.2:8787'])
+
+    assert result.exit_code == 2
+    assert 'No expected channel count for 127.0.0.2:8787' in result.output
+
+
+def test_invalid_server():
+    result = CliRunner().invoke(main, THRESHOLDS + [
+        '--server', 'host:abc=30'])
+
+    assert result.exit_code == 2
+    assert '--server' in result.output
+    assert "Invalid port 'abc' in host:abc=30" in result.output
+
+
+def test_nrdp_token_missing(monkeypatch):
+    def fail_check_apollo_servers(**kwargs):
+        raise AssertionError("The servers are checked")
+
+    monkeypatch.setattr(
+        check_apollo_availability, 'check_apollo_servers',
+        fail_check_apollo_servers)
+
+    result = CliRunner().invoke(main, THRESHOLDS + [
+        '--server', '127.0.0.1:8787=20',
+        '--nrdp-url', 'http://nagios.example.com/nrdp/'])
+
+    # Reported before querying the servers
+    assert result.exit_code == 2
+    assert '--nrdp-token is required with --nrdp-url' in result.output
+
+
+@pytest.mark.parametrize('failed_state, status, crit_count', [
+    (None, NagiosOutputCode.ok, 1), ('unknown', NagiosOutputCode.unknown, 0)])
+def test_failed_channels(monkeypatch, failed_state, status, crit_count):
+    get_batch_latency = availability_health.get_batch_latency
+
+    def failing_get_batch_latency(sncls, **kwargs):
+        if channel_name(0) in sncls:
+            raise ConnectionError("Connection reset")
+        return get_batch_latency(sncls=sncls, **kwargs)
+
+    monkeypatch.setattr(
+        availability_health, 'get_batch_latency', failing_get_batch_latency)
+
+    args = [] if failed_state is None else ['--failed-state', failed_state]
+    with MockApolloServer(channel_count=20) as mock:
+        result = CliRunner().invoke(main, THRESHOLDS + args + [
+            '--server', f'127.0.0.1:{mock.port}=20'])
+
+    # The channel is available, and counts as a critical channel by default,
+    # as with the Guralp Datacenter check
+    assert result.exit_code == status.value, result.output
+    assert result.output.startswith(
+        f'{status.name.upper()}: 100.00% of expected channels available')
+    assert f"'critical_count'={crit_count};" in result.output
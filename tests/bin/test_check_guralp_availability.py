@@ -0,0 +1,101 @@
+from datetime import datetime
+import os
+from pathlib import Path
+import subprocess
+import sys
+import time
+import pytest
+
+
+REPOSITORY = Path(__file__).resolve().parents[2]
+
+THRESHOLDS = [
+    '--warning', '90:', '--critical', '40:',
+    '--warning-time', '20', '--critical-time', '30',
+    '--warning-count', '1', '--critical-count', '2'
+]
+
+
+def latency_record(channel, time):
+    return f"{time.strftime('%Y/%m/%d %H:%M:%S')}.0,{channel},,=100/100+0.3\n"
+
+
+def write_cache(tmp_path, now):
+    '''
+    List two channels with slinktool, and create the latency folder of the
+    cache of today
+
+    Returns the environment to run the check with, and the latency file name
+    of each channel
+    '''
+    bin_folder = tmp_path.joinpath('bin')
+    bin_folder.mkdir()
+    slinktool = bin_folder.joinpath('slinktool')
+    slinktool.write_text(
+        "#!/bin/sh\n" +
+        "echo 'QW STA00 00 HNZ D 2022/06/20 00:00:00.0000'\n" +
+        "echo 'QW STA01 00 HNZ D 2022/06/20 00:00:00.0000'\n")
+    slinktool.chmod(0o755)
+
+    latency_folder = tmp_path.joinpath('cache', 'latency')
+    latency_folder.mkdir(parents=True)
+    suffix = f"{now.year}_{now.strftime('%-j')}.csv"
+
+    env = dict(os.environ)
+    env['PATH'] = f"{bin_folder}{os.pathsep}{env['PATH']}"
+    env['PYTHONPATH'] = str(REPOSITORY)
+    return env, [latency_folder.joinpath(f"QW_STA{index:02d}_00_HNZ_{suffix}")
+                 for index in range(2)]
+
+
+def run_check(tmp_path, env, *args):
+    return subprocess.run(
+        [sys.executable, '-m',
+         'acquisition_nagios.bin.check_guralp_availability'] + THRESHOLDS +
+        ['--cache-folder', str(tmp_path.joinpath('cache')),
+         '--archive-folder', str(tmp_path.joinpath('archive'))] + list(args),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+        timeout=30)
+
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason="Requires FIFOs")
+def test_exit_at_deadline_with_stuck_read(tmp_path):
+    now = datetime.now()
+    env, latency_files = write_cache(tmp_path, now)
+    # Reading the latency file of the first channel never returns, as on an
+    # unresponsive file system
+    os.mkfifo(latency_files[0])
+    latency_files[1].write_text(latency_record('QW.STA01.00.HNZ', now))
+
+    start = time.monotonic()
+    process = run_check(
+        tmp_path, env,
+        '--workers', '2', '--deadline', '2', '--deadline-state', 'ok')
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 10, process.stderr
+    assert process.stdout.decode().startswith('OK'), process.stdout
+    assert process.returncode == 0
+    assert "not evaluated before the deadline:\nQW.STA00.00.HNZ" in \
+        process.stdout.decode()
+
+
+@pytest.mark.parametrize('failed_state, status, output, crit_count', [
+    (None, 0, 'OK', 1), ('unknown', 3, 'UNKNOWN', 0)])
+def test_failed_channels(tmp_path, failed_state, status, output, crit_count):
+    now = datetime.now()
+    env, latency_files = write_cache(tmp_path, now)
+    # The latency file of the first channel can not be parsed
+    latency_files[0].write_text('')
+    latency_files[1].write_text(latency_record('QW.STA01.00.HNZ', now))
+
+    args = [] if failed_state is None else ['--failed-state', failed_state]
+    process = run_check(tmp_path, env, *args)
+
+    # The channel has a latency file, and counts as a critical channel by
+    # default, as with the ApolloServer check
+    stdout = process.stdout.decode()
+    assert stdout.startswith(
+        f'{output}: 100.00% of expected channels available'), stdout
+    assert process.returncode == status
+    assert f"'critical_count'={crit_count};" in stdout
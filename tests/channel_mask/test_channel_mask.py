@@ -0,0 +1,104 @@
+from acquisition_nagios.channel_mask import ChannelMask, ChannelSelection, \
+    compile_channel_selection, load_channel_mask
+import os
+import pytest
+
+
+MASK = '''# Decommissioned station
+QW.BCV01.00.HNZ
+CN.ABC*.*.HN?
+*.XYZ01.10.*
+
+QW.DEF01
+'''
+
+
+def test_channel_mask():
+    mask = ChannelMask(MASK.splitlines())
+
+    assert len(mask) == 4
+    assert mask.pattern_count == 3
+    assert 'QW.BCV01.00.HNZ' in mask
+    assert 'QW.BCV01.00.HNN' not in mask
+    assert 'CN.ABC01.00.HNZ' in mask
+    assert 'CN.ABC.10.HNE' in mask
+    assert 'CN.ABC01.00.HHZ' not in mask
+    assert 'CN.ABC01.00.HNZZ' not in mask
+    assert 'QW.ABC01.00.HNZ' not in mask
+    assert 'QW.XYZ01.10.HHZ' in mask
+    assert 'QW.XYZ01.00.HHZ' not in mask
+    # Partial channels mask every channel they contain
+    assert 'QW.DEF01.00.HNZ' in mask
+    assert 'QW.DEF02.00.HNZ' not in mask
+
+    channels = ['CN.ABC01.00.HNZ', 'QW.BCV01.00.HNN', 'QW.BCV01.00.HNZ']
+    assert mask.filter(channels) == ['QW.BCV01.00.HNN']
+    assert not mask.allows('CN.ABC01.00.HNZ')
+
+
+def test_channel_mask_missing_components():
+    mask = ChannelMask(['CN.ABC0?', 'QW.*.00.HN?.XX'])
+
+    assert 'CN.ABC01.00.HHZ' in mask
+    assert 'CN.ABC10.00.HHZ' not in mask
+    # Invalid patterns are ignored
+    assert mask.pattern_count == 1
+
+
+def test_channel_mask_as_selection():
+    entries = ['CN.ABC01', 'LOG', 'HH?', 'QW.*.10']
+    mask = ChannelMask(entries)
+    selection = ChannelSelection(','.join(entries))
+
+    # The same entries stand for the same channels in masks and selections
+    for channel in ['CN.ABC01.00.HNZ', 'QW.BCV01.00.LOG', 'QW.BCV01.00.HHE',
+                    'QW.BCV01.10.HNZ', 'CN.ABC02.00.HNZ', 'QW.BCV01.00.HNZ']:
+        assert (channel in mask) == (channel in selection), channel
+    assert mask.filter(['CN.ABC01.00.HNZ', 'CN.ABC02.00.HNZ']) == \
+        ['CN.ABC02.00.HNZ']
+
+
+def test_load_channel_mask(tmp_path):
+    mask_file = tmp_path.joinpath('mask.txt')
+    mask_file.write_text('QW.BCV01.00.HNZ\n')
+
+    mask = load_channel_mask(mask_file)
+    assert 'QW.BCV01.00.HNZ' in mask
+    # Compiled once while the file does not change
+    assert load_channel_mask(str(mask_file)) is mask
+
+    mask_file.write_text('QW.BCV0*\n')
+    stat = mask_file.stat()
+    os.utime(mask_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    reloaded = load_channel_mask(mask_file)
+    assert reloaded is not mask
+    assert 'QW.BCV02.00.HNZ' in reloaded
+
+    assert len(load_channel_mask(tmp_path.joinpath('missing.txt'))) == 0
+
+
+def test_channel_selection():
+    selection = ChannelSelection('HH?, HNZ,EN[ZN],CN.ABC*.*.LOG')
+
+    assert len(selection) == 4
+    assert 'QW.BCV01.00.HHE' in selection
+    assert 'QW.BCV01.00.HNZ' in selection
+    assert 'QW.BCV01.00.HNN' not in selection
+    assert 'QW.BCV01.00.ENN' in selection
+    assert 'QW.BCV01.00.ENE' not in selection
+    assert 'CN.ABC01.00.LOG' in selection
+    assert 'QW.ABC01.00.LOG' not in selection
+    assert selection.select(['QW.A.00.HNN', 'QW.A.00.HHZ']) == ['QW.A.00.HHZ']
+
+    # Partial channels select every channel they contain
+    selection = ChannelSelection('CN.ABC01,QW.DEF01.10')
+    assert 'CN.ABC01.00.HNZ' in selection
+    assert 'CN.ABC02.00.HNZ' not in selection
+    assert 'QW.DEF01.10.LOG' in selection
+    assert 'QW.DEF01.00.LOG' not in selection
+    with pytest.raises(ValueError):
+        ChannelSelection('HH?,CN.ABC01.00.HNZ.X')
+
+    # Every channel is selected with a wildcard
+    assert 'QW.BCV01.00.ACE' in ChannelSelection('*')
+    assert compile_channel_selection('HH?') is compile_channel_selection('HH?')
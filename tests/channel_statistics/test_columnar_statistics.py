@@ -0,0 +1,107 @@
+from acquisition_nagios.apolloserver.availability_health import \
+    AcquisionStatistics, ChannelLatency
+from acquisition_nagios.channel_statistics import ColumnarStatistics
+from acquisition_nagios.nagios.models import NagiosOutputCode
+from datetime import datetime
+import pytest
+
+
+CHANNEL_LATENCY = [
+    ChannelLatency('QW.ZEROLAT.00.HNZ', datetime(2022, 6, 1, 1, 0, 0), 0),
+    ChannelLatency('QW.ONESEC.00.HNZ', datetime(2022, 6, 1, 0, 59, 59), 1),
+    ChannelLatency('QW.FIVESEC.00.HNZ', datetime(2022, 6, 1, 0, 59, 55), 5),
+    ChannelLatency('QW.TENSEC.00.HNZ', datetime(2022, 6, 1, 0, 0, 0), 10),
+]
+
+
+def test_columnar_statistics_thresholds():
+    statistics = AcquisionStatistics(
+        channel_latency=CHANNEL_LATENCY,
+        unavailable_channels=['QW.MISSING.00.HNZ']
+    ).to_columnar()
+
+    assert len(statistics) == 4
+    assert statistics.unavailable_channels == ['QW.MISSING.00.HNZ']
+    assert statistics.count_thresholds(warn_time='3', crit_time='6') == (1, 1)
+    assert statistics.count_thresholds(warn_time='0', crit_time='1') == (2, 1)
+
+    results = statistics.latency_threshold_state(
+        warn_time='3',
+        crit_time='6',
+        warn_threshold='1',
+        crit_threshold='2'
+    )
+    assert results.crit_count == 1
+    assert results.warn_count == 1
+    assert results.state == NagiosOutputCode.warning
+
+
+def test_columnar_statistics_availability_and_stale():
+    statistics = ColumnarStatistics.from_channel_latency(CHANNEL_LATENCY)
+
+    assert statistics.availability_percentage(8) == 50
+    # Failed and unevaluated channels have data
+    assert statistics.availability_percentage(8, failed=1, unevaluated=3) \
+        == 100
+    with pytest.raises(ZeroDivisionError):
+        statistics.availability_percentage(0)
+
+    assert statistics.stale_mask(
+        now=datetime(2022, 6, 1, 1, 0, 0),
+        max_age=60
+    ).tolist() == [False, False, False, True]
+
+
+def test_columnar_statistics_empty():
+    statistics = ColumnarStatistics.from_channel_latency([])
+
+    assert statistics.count_thresholds(warn_time='3', crit_time='6') == (0, 0)
+    assert len(statistics.stale_mask(datetime(2022, 6, 1), 60)) == 0
+
+
+@pytest.mark.parametrize('unevaluated_state,crit_count,warn_count,state', [
+    (NagiosOutputCode.ok, 1, 1, NagiosOutputCode.warning),
+    (NagiosOutputCode.warning, 1, 4, NagiosOutputCode.warning),
+    (NagiosOutputCode.critical, 4, 1, NagiosOutputCode.critical),
+    (NagiosOutputCode.unknown, 1, 1, NagiosOutputCode.unknown),
+])
+def test_columnar_statistics_unevaluated(
+        unevaluated_state, crit_count, warn_count, state):
+    statistics = ColumnarStatistics.from_channel_latency(CHANNEL_LATENCY)
+
+    results = statistics.latency_threshold_state(
+        warn_time='3',
+        crit_time='6',
+        warn_threshold='1',
+        crit_threshold='2',
+        unevaluated=3,
+        unevaluated_state=unevaluated_state
+    )
+    assert results.crit_count == crit_count
+    assert results.warn_count == warn_count
+    assert results.state == state
+
+
+@pytest.mark.parametrize('failed_state,crit_count,warn_count,state', [
+    (NagiosOutputCode.critical, 3, 1, NagiosOutputCode.critical),
+    (NagiosOutputCode.warning, 1, 3, NagiosOutputCode.warning),
+    (NagiosOutputCode.unknown, 1, 1, NagiosOutputCode.unknown),
+])
+def test_columnar_statistics_failed(failed_state, crit_count, warn_count,
+                                    state):
+    statistics = ColumnarStatistics.from_channel_latency(CHANNEL_LATENCY)
+
+    # Failed channels count apart from the unevaluated ones
+    results = statistics.latency_threshold_state(
+        warn_time='3',
+        crit_time='6',
+        warn_threshold='1',
+        crit_threshold='2',
+        unevaluated=3,
+        unevaluated_state=NagiosOutputCode.ok,
+        failed=2,
+        failed_state=failed_state
+    )
+    assert results.crit_count == crit_count
+    assert results.warn_count == warn_count
+    assert results.state == state
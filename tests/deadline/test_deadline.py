@@ -0,0 +1,58 @@
+from acquisition_nagios.deadline import Deadline, DeadlineExceeded
+import pytest
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_deadline():
+    clock = FakeClock()
+    deadline = Deadline(10, reserve=1, clock=clock)
+
+    assert deadline.is_set
+    assert deadline.remaining() == 9
+    assert not deadline.expired()
+    assert deadline.timeout(30) == 9
+    assert deadline.timeout(None) == 9
+    assert deadline.request_timeout((5, 30)) == (5, 9)
+    deadline.check()
+
+    clock.now += 8.5
+    assert deadline.remaining() == 0.5
+    assert deadline.request_timeout((5, 30)) == (0.5, 0.5)
+
+    clock.now += 1
+    assert deadline.remaining() == 0
+    assert deadline.expired()
+    with pytest.raises(DeadlineExceeded):
+        deadline.check('querying')
+
+
+def test_no_deadline():
+    deadline = Deadline()
+
+    assert not deadline.is_set
+    assert deadline.remaining() is None
+    assert not deadline.expired()
+    assert deadline.timeout(30) == 30
+    assert deadline.timeout(None) is None
+    assert deadline.request_timeout((5, 30)) == (5, 30)
+    deadline.check()
+
+
+def test_deadline_iterate():
+    clock = FakeClock()
+    deadline = Deadline(3, reserve=0, clock=clock)
+    consumed = []
+
+    with pytest.raises(DeadlineExceeded):
+        for item in deadline.iterate(range(10)):
+            consumed.append(item)
+            clock.now += 1
+
+    assert consumed == [0, 1, 2]
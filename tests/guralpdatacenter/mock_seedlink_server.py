@@ -0,0 +1,232 @@
+'''
+Local stand-in for a SeedLink server, used by the tests and the benchmarks
+
+Answers HELLO, INFO STREAMS and BYE for a configurable number of generated
+stations, with the INFO response split into 512 byte miniSEED records the
+way SeedLink servers send it.
+'''
+from contextlib import contextmanager
+import multiprocessing
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+import struct
+import threading
+import time
+from typing import Iterator, List, Sequence, Tuple
+from xml.sax.saxutils import quoteattr
+
+
+DEFAULT_CHANNELS = ('HNZ', 'HNN', 'HNE', 'HHZ', 'HHN', 'HHE', 'LOG')
+
+RECORD_SIZE = 512
+# Fixed header followed by blockette 1000
+DATA_OFFSET = 64
+
+_FIXED_HEADER = '6scc5s2s3s2sHHBBBBHHhhBBBBiHH'
+_BLOCKETTE_1000 = 'HHBBBB'
+
+
+def station_name(
+    index: int
+) -> str:
+    return f"S{index:04d}"
+
+
+def info_records(
+    text: bytes,
+    byteorder: str = '>'
+) -> List[bytes]:
+    '''
+    Split the text of an INFO response into ASCII miniSEED records
+    '''
+    chunk_size = RECORD_SIZE - DATA_OFFSET
+    word_order = 1 if byteorder == '>' else 0
+    records: List[bytes] = []
+
+    for sequence, start in enumerate(range(0, len(text), chunk_size)):
+        chunk = text[start:start + chunk_size]
+        header = struct.pack(
+            byteorder + _FIXED_HEADER,
+            f"{sequence + 1:06d}".encode(), b'D', b' ',
+            b'INFO ', b'  ', b'INF', b'XX',
+            2022, 152, 0, 0, 0, 0, 0,
+            len(chunk), 0, 0,
+            0, 0, 0, 1,
+            0, DATA_OFFSET, 48)
+        blockette = struct.pack(
+            byteorder + _BLOCKETTE_1000, 1000, 0, 0, word_order, 9, 0)
+        padding = b'\0' * (DATA_OFFSET - len(header) - len(blockette))
+        record = header + blockette + padding + chunk
+        records.append(record + b'\0' * (RECORD_SIZE - len(record)))
+
+    return records
+
+
+class MockSeedLinkServer(object):
+    '''
+    SeedLink server stand-in running in a background thread
+
+    Use as a context manager, the server is available on 127.0.0.1 at the
+    port given by the port attribute.
+    '''
+    def __init__(
+        self,
+        station_count: int = 10,
+        channels: Sequence[str] = DEFAULT_CHANNELS,
+        byteorder: str = '>',
+        response_delay: float = 0.0,
+        refuse_info: bool = False
+    ):
+        '''
+        Parameters
+        ----------
+        station_count: int
+            The number of stations reported by the server
+
+        channels: Sequence[str]
+            The channel codes of every station
+
+        byteorder: str
+            The byte order of the miniSEED records, > or <
+
+        response_delay: float
+            Seconds to wait before answering INFO STREAMS
+
+        refuse_info: bool
+            Answer INFO STREAMS with ERROR, as servers restricting INFO do
+        '''
+        self.station_count = station_count
+        self.channels = channels
+        self.byteorder = byteorder
+        self.response_delay = response_delay
+        self.refuse_info = refuse_info
+        self._server = ThreadingTCPServer(
+            ('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> str:
+        return str(self._server.server_address[1])
+
+    def __enter__(self) -> 'MockSeedLinkServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def streams(self) -> Iterator[Tuple[str, str, str, str]]:
+        '''
+        The network, station, location and channel of every stream
+        '''
+        for index in range(self.station_count):
+            for channel in self.channels:
+                yield 'QW', station_name(index), '00', channel
+
+    def streams_xml(self) -> bytes:
+        '''
+        The INFO STREAMS document of the server
+        '''
+        lines = [
+            '<?xml version="1.0"?>',
+            '<seedlink software="MockSeedLink v1.0" ' +
+            'organization="Test" started="2022/06/01 00:00:00.0000">']
+        station = None
+        for net, sta, loc, cha in self.streams():
+            if sta != station:
+                if station is not None:
+                    lines.append('</station>')
+                lines.append(
+                    f'<station name={quoteattr(sta)} ' +
+                    f'network={quoteattr(net)} ' +
+                    'description="Mock station" begin_seq="000000" ' +
+                    'end_seq="000010" stream_check="enabled">')
+                station = sta
+            lines.append(
+                f'<stream location={quoteattr(loc)} ' +
+                f'seedname={quoteattr(cha)} type="D" ' +
+                'begin_time="2022/06/01 00:00:00.0000" ' +
+                'end_time="2022/06/01 01:00:00.0000"/>')
+        if station is not None:
+            lines.append('</station>')
+        lines.append('</seedlink>')
+        return '\n'.join(lines).encode('utf-8')
+
+    def slinktool_output(self) -> str:
+        '''
+        The output of slinktool -Q for the same streams
+        '''
+        return ''.join(
+            f"{net} {sta} {loc} {cha} D 2022/06/01 00:00:00.0000  -  " +
+            "2022/06/01 01:00:00.0000\n"
+            for net, sta, loc, cha in self.streams())
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    command = line.strip().upper()
+                    if command == b'HELLO':
+                        self.wfile.write(
+                            b'SeedLink v3.1 (MockSeedLink)\r\nTest\r\n')
+                    elif command == b'INFO STREAMS' and not mock.refuse_info:
+                        if mock.response_delay > 0:
+                            time.sleep(mock.response_delay)
+                        self.send_info(mock.streams_xml())
+                    elif command == b'BYE':
+                        return
+                    else:
+                        self.wfile.write(b'ERROR\r\n')
+
+            def send_info(self, text: bytes):
+                records = info_records(text, mock.byteorder)
+                # Sent at once, so that delayed acknowledgements do not slow
+                # down the packets that follow the first one
+                self.wfile.write(b''.join(
+                    b'SLINFO ' + (b'*' if index < len(records) - 1 else b' ') +
+                    record
+                    for index, record in enumerate(records)))
+
+        return Handler
+
+
+def _serve(
+    connection,
+    **kwargs
+) -> None:
+    with MockSeedLinkServer(**kwargs) as mock:
+        connection.send(mock.port)
+        # Serve until the parent asks to stop
+        try:
+            connection.recv()
+        except EOFError:
+            pass
+
+
+@contextmanager
+def mock_seedlink_process(
+    **kwargs
+) -> Iterator[str]:
+    '''
+    Run a MockSeedLinkServer in a separate process, so that it does not share
+    CPU time with the code being measured
+
+    Accepts the arguments of MockSeedLinkServer and yields the port it listens
+    on.
+    '''
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=_serve, args=(child,), kwargs=kwargs, daemon=True)
+    process.start()
+    try:
+        yield parent.recv()
+    finally:
+        parent.send(None)
+        parent.close()
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
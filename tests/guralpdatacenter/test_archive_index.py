@@ -0,0 +1,92 @@
+from acquisition_nagios.guralpdatacenter import latency_index
+from acquisition_nagios.guralpdatacenter.guralp_availability import \
+    get_channel_latency
+from acquisition_nagios.guralpdatacenter.latency_index import ArchiveIndex
+from datetime import date, datetime
+import logging
+
+
+def write_archive_file(archive_folder, day, name, line):
+    folder = archive_folder.joinpath('latency', day.strftime('%Y/%m/%d'))
+    folder.mkdir(parents=True, exist_ok=True)
+    folder.joinpath(name).write_text(line)
+
+
+def test_archive_index_find(tmp_path, monkeypatch):
+    day = date(2022, 5, 31)
+    write_archive_file(tmp_path, day, 'QW_STA00_00_HNZ_2022_150.csv', '')
+    write_archive_file(tmp_path, day, 'QW_STA00_00_HNZ_2022_151.csv', '')
+    write_archive_file(tmp_path, date(2022, 5, 30),
+                       'QW_STA01_00_HNZ_2022_150.csv', '')
+
+    listed = []
+    index_latency_directory = latency_index.index_latency_directory
+
+    def counting_index(directory):
+        listed.append(directory)
+        return index_latency_directory(directory)
+
+    monkeypatch.setattr(
+        latency_index, 'index_latency_directory', counting_index)
+
+    index = ArchiveIndex(tmp_path.joinpath('latency'))
+    days = [date(2022, 5, 31), date(2022, 5, 30), date(2022, 5, 29)]
+
+    # The most recent file of the channel
+    assert index.find('QW.STA00.00.HNZ', days) == tmp_path.joinpath(
+        'latency/2022/05/31/QW_STA00_00_HNZ_2022_151.csv')
+    assert index.find('QW.STA01.00.HNZ', days) == tmp_path.joinpath(
+        'latency/2022/05/30/QW_STA01_00_HNZ_2022_150.csv')
+    assert index.find('QW.STA02.00.HNZ', days) is None
+
+    # Each day is listed once for all the channels
+    assert sorted(listed) == sorted(index.day_path(day) for day in days)
+
+
+def test_archive_index_listing_error(tmp_path, monkeypatch, caplog):
+    listed = []
+
+    def failing_index(directory):
+        listed.append(directory)
+        raise PermissionError(f"Permission denied: '{directory}'")
+
+    monkeypatch.setattr(
+        latency_index, 'index_latency_directory', failing_index)
+
+    index = ArchiveIndex(tmp_path.joinpath('latency'))
+    days = [date(2022, 5, 31), date(2022, 5, 30)]
+
+    with caplog.at_level(logging.WARNING):
+        for channel in ['QW.STA00.00.HNZ', 'QW.STA01.00.HNZ']:
+            assert index.find(channel, days) is None
+
+    # A day that can not be listed is listed and reported once
+    assert sorted(listed) == sorted(index.day_path(day) for day in days)
+    assert all(index.is_scanned(day) for day in days)
+    assert len([record for record in caplog.records
+                if 'Could not list archive directory' in record.message]) == 2
+
+
+def test_get_channel_latency_archive(tmp_path):
+    channels = ['QW.STA00.00.HNZ', 'QW.STA01.00.HNZ', 'QW.STA02.00.HNZ']
+    write_archive_file(
+        tmp_path, date(2022, 5, 31), 'QW_STA00_00_HNZ_2022_151.csv',
+        "2022/05/31 23:59:57.4,QW.STA00.00.HNZ,,=100/100+0.3\n")
+    write_archive_file(
+        tmp_path, date(2022, 5, 27), 'QW_STA01_00_HNZ_2022_147.csv',
+        "2022/05/27 23:59:57.4,QW.STA01.00.HNZ,,=100/100+0.3\n")
+    # Older than the 6 days searched
+    write_archive_file(
+        tmp_path, date(2022, 5, 25), 'QW_STA02_00_HNZ_2022_145.csv',
+        "2022/05/25 23:59:57.4,QW.STA02.00.HNZ,,=100/100+0.3\n")
+
+    statistics = get_channel_latency(
+        cache_folder=str(tmp_path.joinpath('cache')),
+        archive_folder=str(tmp_path),
+        time=datetime(2022, 6, 1, 23, 59, 59),
+        expected_channels=channels
+    )
+
+    assert [stats.channel for stats in statistics.channel_latency] == \
+        channels[:2]
+    assert statistics.unavailable_channels == channels[2:]
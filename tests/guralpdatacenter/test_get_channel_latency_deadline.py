@@ -0,0 +1,55 @@
+from acquisition_nagios.guralpdatacenter.guralp_availability import \
+    get_channel_latency
+from acquisition_nagios.deadline import Deadline
+from datetime import datetime
+
+
+def write_latency_file(cache_folder, channel):
+    net, sta, loc, cha = channel.split('.')
+    latency_folder = cache_folder.joinpath('latency')
+    latency_folder.mkdir(exist_ok=True)
+    latency_folder.joinpath(f"{net}_{sta}_{loc}_{cha}_2022_152.csv") \
+        .write_text(f"2022/06/01 23:59:57.4,{channel},,=100/100+0.3\n")
+
+
+def test_get_channel_latency_deadline(tmp_path):
+    channels = [f'QW.STA{index:02d}.00.HNZ' for index in range(5)]
+    for channel in channels:
+        write_latency_file(tmp_path, channel)
+
+    clock = [0.0]
+
+    def tick():
+        # Every deadline check takes a second
+        clock[0] += 1
+        return clock[0]
+
+    statistics = get_channel_latency(
+        cache_folder=str(tmp_path),
+        archive_folder=str(tmp_path.joinpath('archive')),
+        time=datetime(2022, 6, 1, 23, 59, 59),
+        expected_channels=channels,
+        deadline=Deadline(3.5, reserve=0, clock=tick)
+    )
+
+    evaluated = [stats.channel for stats in statistics.channel_latency]
+    assert evaluated == channels[:3]
+    assert statistics.unevaluated_channels == channels[3:]
+    assert statistics.unavailable_channels == []
+
+
+def test_get_channel_latency_no_deadline(tmp_path):
+    channels = ['QW.STA00.00.HNZ', 'QW.STA01.00.HNZ']
+    write_latency_file(tmp_path, channels[0])
+
+    statistics = get_channel_latency(
+        cache_folder=str(tmp_path),
+        archive_folder=str(tmp_path.joinpath('archive')),
+        time=datetime(2022, 6, 1, 23, 59, 59),
+        expected_channels=channels
+    )
+
+    assert [stats.channel for stats in statistics.channel_latency] == \
+        channels[:1]
+    assert statistics.unavailable_channels == channels[1:]
+    assert statistics.unevaluated_channels == []
@@ -0,0 +1,33 @@
+from acquisition_nagios.guralpdatacenter.latency_index import \
+    LatencyFileKey, channel_key, index_latency_directory, \
+    parse_latency_filename
+
+
+def test_parse_latency_filename():
+    assert parse_latency_filename('QW_BCH09_00_HNE_2022_152.csv') == \
+        LatencyFileKey('QW', 'BCH09', '00', 'HNE', '2022', '152')
+    # Channels without a location code
+    assert parse_latency_filename('QW_BCH09__HNE_2022_152.csv') == \
+        LatencyFileKey('QW', 'BCH09', '', 'HNE', '2022', '152')
+    assert parse_latency_filename('QW_BCH09_00_HNE_2022_152.csv.tmp') is None
+    assert parse_latency_filename('QW_BCH09_00_HNE.csv') is None
+
+
+def test_index_latency_directory(tmp_path):
+    names = ['QW_BCH09_00_HNE_2022_152.csv', 'QW_BCH09_00_HNE_2022_151.csv',
+             'QW_BCV01__HHZ_2022_152.csv', 'README.txt']
+    for name in names:
+        tmp_path.joinpath(name).touch()
+
+    index = index_latency_directory(tmp_path)
+
+    assert len(index) == 3
+    assert index[channel_key('QW.BCH09.00.HNE', '2022', '152')] == \
+        tmp_path.joinpath(names[0])
+    assert index[channel_key('QW.BCV01..HHZ', '2022', '152')] == \
+        tmp_path.joinpath(names[2])
+    assert channel_key('QW.BCV01..HHZ', '2022', '151') not in index
+
+
+def test_index_latency_directory_missing(tmp_path):
+    assert index_latency_directory(tmp_path.joinpath('latency')) == {}
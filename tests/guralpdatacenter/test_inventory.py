@@ -0,0 +1,119 @@
+from acquisition_nagios.channel_mask import ChannelSelection
+from acquisition_nagios.guralpdatacenter.guralp_availability import \
+    get_expected_channels
+from acquisition_nagios.guralpdatacenter.inventory import InventoryCache, \
+    InventoryError, parse_slinktool_line, query_slinktool
+import os
+import pytest
+
+
+SLINKTOOL_OUTPUT = '''QW BCV01 00 HNZ D 2022/06/20 00:00:00.0000  -  2022/06/20 01:00:00.0000
+QW BCV01 00 HNN D 2022/06/20 00:00:00.0000  -  2022/06/20 01:00:00.0000
+QW BCV01 00 LOG L 2022/06/20 00:00:00.0000  -  2022/06/20 01:00:00.0000
+QW BCV02 00 HHZ D 2022/06/20 00:00:00.0000  -  2022/06/20 01:00:00.0000
+'''
+
+
+@pytest.fixture
+def slinktool(tmp_path, monkeypatch):
+    '''
+    Install a fake slinktool running the provided shell commands
+    '''
+    def install(commands):
+        script = tmp_path.joinpath('slinktool')
+        script.write_text(f"#!/bin/sh\n{commands}\n")
+        script.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    return install
+
+
+def test_parse_slinktool_line():
+    lines = SLINKTOOL_OUTPUT.splitlines()
+    assert parse_slinktool_line(lines[0]) == 'QW.BCV01.00.HNZ'
+    assert parse_slinktool_line(lines[2]) is None
+    assert parse_slinktool_line('') is None
+
+
+def test_query_slinktool(tmp_path, slinktool):
+    tmp_path.joinpath('output.txt').write_text(SLINKTOOL_OUTPUT)
+    slinktool(f"cat {tmp_path.joinpath('output.txt')}")
+
+    assert query_slinktool() == [
+        'QW.BCV01.00.HNZ', 'QW.BCV01.00.HNN', 'QW.BCV02.00.HHZ']
+
+
+def test_query_slinktool_selection(tmp_path, slinktool):
+    tmp_path.joinpath('output.txt').write_text(SLINKTOOL_OUTPUT)
+    slinktool(f"cat {tmp_path.joinpath('output.txt')}")
+
+    assert query_slinktool(selection=ChannelSelection('HH?,LOG')) == [
+        'QW.BCV01.00.LOG', 'QW.BCV02.00.HHZ']
+
+
+def test_query_slinktool_timeout(slinktool):
+    slinktool("echo 'QW BCV01 00 HNZ D'\nsleep 10")
+
+    with pytest.raises(InventoryError):
+        query_slinktool(timeout=0.5)
+
+
+def test_query_slinktool_failure(slinktool):
+    slinktool("echo 'Cannot connect' >&2\nexit 1")
+
+    with pytest.raises(InventoryError):
+        query_slinktool()
+
+
+def test_inventory_cache(tmp_path):
+    clock = [1000.0]
+    cache = InventoryCache(
+        tmp_path.joinpath('inventory.json'), ttl=60, clock=lambda: clock[0])
+    fetched = []
+
+    def fetch(channels):
+        def fetch_channels():
+            fetched.append(channels)
+            return channels
+        return fetch_channels
+
+    def fail():
+        raise InventoryError("slinktool exited with status 1")
+
+    # Without a stored inventory, errors are raised
+    with pytest.raises(InventoryError):
+        cache.get('localhost:18000', fail)
+
+    assert cache.get('localhost:18000', fetch(['QW.A.00.HNZ'])) == \
+        ['QW.A.00.HNZ']
+    # Used until it expires
+    assert cache.get('localhost:18000', fetch(['QW.B.00.HNZ'])) == \
+        ['QW.A.00.HNZ']
+    assert len(fetched) == 1
+
+    # The last good inventory is used when listing fails or finds nothing
+    clock[0] += 120
+    assert cache.get('localhost:18000', fail) == ['QW.A.00.HNZ']
+    assert cache.get('localhost:18000', fetch([])) == ['QW.A.00.HNZ']
+
+    assert cache.get('localhost:18000', fetch(['QW.B.00.HNZ'])) == \
+        ['QW.B.00.HNZ']
+    # Inventories of other servers are not used
+    assert cache.load('otherhost:18000') is None
+
+
+def test_get_expected_channels_cached(tmp_path, slinktool):
+    tmp_path.joinpath('output.txt').write_text(SLINKTOOL_OUTPUT)
+    slinktool(f"cat {tmp_path.joinpath('output.txt')}")
+    cache = InventoryCache(tmp_path.joinpath('inventory.json'))
+
+    channels = get_expected_channels(inventory_cache=cache)
+
+    # slinktool fails, the inventory is still fresh
+    slinktool("exit 1")
+    assert get_expected_channels(inventory_cache=cache) == channels
+    assert len(channels) == 3
+
+    # Inventories of another selection of channels are not used
+    slinktool(f"cat {tmp_path.joinpath('output.txt')}")
+    assert get_expected_channels(inventory_cache=cache, channels='HN?') == [
+        'QW.BCV01.00.HNZ', 'QW.BCV01.00.HNN']
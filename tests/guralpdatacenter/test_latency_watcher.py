@@ -0,0 +1,163 @@
+from acquisition_nagios.guralpdatacenter import inotify
+from acquisition_nagios.guralpdatacenter.guralp_availability import \
+    get_channel_latency
+from acquisition_nagios.guralpdatacenter.latency_index import channel_key
+from acquisition_nagios.guralpdatacenter.watcher import LatencyWatcher, \
+    WatcherServer, query_watcher
+from datetime import datetime
+import threading
+import time
+import pytest
+
+
+NAME = 'QW_STA00_00_HNZ_2022_152.csv'
+
+
+def record(second, latency='0.3'):
+    return (f"2022/06/01 23:59:{second:04.1f},QW.STA00.00.HNZ,," +
+            f"=100/100+{latency}\n")
+
+
+def test_latency_watcher_update(tmp_path):
+    path = tmp_path.joinpath(NAME)
+    path.write_text(record(10) + record(11))
+    watcher = LatencyWatcher(tmp_path)
+
+    watcher.scan()
+    assert watcher.snapshot()[NAME].timestamp == \
+        datetime(2022, 6, 1, 23, 59, 12, 300000)
+
+    # A record still being written is not read
+    line = record(12, latency='0.5')
+    with open(path, 'a') as f:
+        f.write(line[:20])
+    watcher.update(NAME)
+    assert watcher.snapshot()[NAME].latency == 1.3
+
+    with open(path, 'a') as f:
+        f.write(line[20:])
+    watcher.update(NAME)
+    assert watcher.snapshot()[NAME].latency == 1.5
+
+    # Replaced files are read again
+    path.unlink()
+    path.write_text(record(5, latency='0.1'))
+    watcher.update(NAME)
+    assert watcher.snapshot()[NAME].latency == 1.1
+
+    path.unlink()
+    watcher.update(NAME)
+    assert watcher.snapshot() == {}
+
+
+def test_latency_watcher_events(tmp_path):
+    try:
+        inotify.Inotify().close()
+    except OSError:
+        pytest.skip("inotify is not available")
+
+    tmp_path.joinpath(NAME).write_text(record(10))
+    watcher = LatencyWatcher(tmp_path)
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=watcher.watch, args=(stop, 0.05), daemon=True)
+    thread.start()
+
+    try:
+        with open(tmp_path.joinpath(NAME), 'a') as f:
+            f.write(record(20, latency='0.7'))
+        name = 'QW_STA01_00_HNZ_2022_152.csv'
+        tmp_path.joinpath(name).write_text(
+            record(30).replace('STA00', 'STA01'))
+
+        for _ in range(100):
+            snapshot = watcher.snapshot()
+            if name in snapshot and snapshot[NAME].latency == 1.7:
+                break
+            time.sleep(0.05)
+        assert snapshot[NAME].latency == 1.7
+        assert snapshot[name].channel == 'QW.STA01.00.HNZ'
+    finally:
+        stop.set()
+        thread.join(5)
+
+
+def test_query_watcher(tmp_path):
+    latency_dir = tmp_path.joinpath('latency')
+    latency_dir.mkdir()
+    latency_dir.joinpath(NAME).write_text(record(10))
+    watcher = LatencyWatcher(latency_dir)
+    watcher.scan()
+
+    socket_path = tmp_path.joinpath('watcher.sock')
+    server = WatcherServer(socket_path, watcher)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        table = query_watcher(socket_path, latency_dir=latency_dir)
+        key = channel_key('QW.STA00.00.HNZ', '2022', '152')
+        assert table == {key: watcher.snapshot()[NAME]}
+
+        with pytest.raises(ValueError):
+            query_watcher(socket_path, latency_dir=tmp_path)
+
+        statistics = get_channel_latency(
+            cache_folder=str(tmp_path.joinpath('unused')),
+            archive_folder=str(tmp_path.joinpath('archive')),
+            time=datetime(2022, 6, 1, 23, 59, 59),
+            expected_channels=['QW.STA00.00.HNZ', 'QW.STA01.00.HNZ'],
+            watcher_table=table)
+        assert statistics.channel_latency == [table[key]]
+        assert statistics.unavailable_channels == ['QW.STA01.00.HNZ']
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # Not running any more
+    with pytest.raises(OSError):
+        query_watcher(socket_path)
+
+
+def test_query_watcher_during_scan(tmp_path):
+    latency_dir = tmp_path.joinpath('latency')
+    latency_dir.mkdir()
+    names = [f'QW_STA{index:02d}_00_HNZ_2022_152.csv' for index in range(3)]
+    for index, name in enumerate(names):
+        latency_dir.joinpath(name).write_text(
+            record(10).replace('STA00', f'STA{index:02d}'))
+    watcher = LatencyWatcher(latency_dir)
+
+    # Hold the initial scan after the first file
+    scanning = threading.Event()
+    resume = threading.Event()
+    update = watcher.update
+
+    def slow_update(name):
+        update(name)
+        scanning.set()
+        resume.wait(5)
+
+    watcher.update = slow_update
+    scan = threading.Thread(target=watcher.scan, daemon=True)
+
+    socket_path = tmp_path.joinpath('watcher.sock')
+    server = WatcherServer(socket_path, watcher)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        scan.start()
+        assert scanning.wait(5)
+        assert len(watcher.snapshot()) == 1
+
+        # A partial table is not served, the check reads the files instead
+        with pytest.raises(ValueError, match='not scanned'):
+            query_watcher(socket_path, latency_dir=latency_dir)
+
+        resume.set()
+        scan.join(5)
+        table = query_watcher(socket_path, latency_dir=latency_dir)
+        assert len(table) == 3
+    finally:
+        resume.set()
+        server.shutdown()
+        server.server_close()
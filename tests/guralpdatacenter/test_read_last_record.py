@@ -0,0 +1,56 @@
+from acquisition_nagios.guralpdatacenter.guralp_availability import \
+    get_latencystatistics_of_last_row
+from acquisition_nagios.guralpdatacenter.tail import last_record, \
+    read_last_record
+from datetime import datetime
+import io
+import pytest
+
+
+@pytest.mark.parametrize('block_size', [1, 7, 4096])
+@pytest.mark.parametrize('content, record', [
+    (b'first\nsecond\nlast\n', b'last'),
+    # The last line is still being written
+    (b'first\nsecond\nlas', b'second'),
+    (b'first\r\nlast\r\n', b'last'),
+    (b'first\nlast\n\n \n', b'last'),
+    (b'only\n', b'only'),
+    (b'partial', None),
+    (b'', None),
+])
+def test_read_last_record(tmp_path, block_size, content, record):
+    path = tmp_path.joinpath('latency.csv')
+    path.write_bytes(content)
+
+    assert read_last_record(path, block_size=block_size) == record
+
+
+class CountingBytesIO(io.BytesIO):
+    def __init__(self, content):
+        super().__init__(content)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def test_last_record_reads_tail():
+    f = CountingBytesIO(b'x' * 99 + b'\n' + b'y' * 99 + b'\n' + b'last\n')
+
+    assert last_record(f, block_size=16) == b'last'
+    assert f.bytes_read == 16
+
+
+def test_get_latencystatistics_of_empty_file(tmp_path):
+    path = tmp_path.joinpath('QW_STA00_00_HNZ_2022_152.csv')
+    path.write_text("2022/06/01 23:59:57.4,QW.STA00.00.HNZ,,=100/100+0.3\n" +
+                    "2022/06/01 23:59:58.4,QW.STA00.")
+
+    latency = get_latencystatistics_of_last_row(path)
+    assert latency.timestamp == datetime(2022, 6, 1, 23, 59, 58, 700000)
+
+    path.write_text('')
+    with pytest.raises(ValueError):
+        get_latencystatistics_of_last_row(path)
@@ -0,0 +1,87 @@
+from acquisition_nagios.guralpdatacenter.guralp_availability import \
+    assemble_details, get_channel_latency, get_latency_threshold_state, \
+    read_latency_files
+from acquisition_nagios.deadline import Deadline
+from acquisition_nagios.nagios.models import NagiosOutputCode
+from datetime import datetime
+import pytest
+
+
+def write_latency_files(folder, count):
+    files = []
+    for index in range(count):
+        channel = f'QW.STA{index:02d}.00.HNZ'
+        path = folder.joinpath(f"QW_STA{index:02d}_00_HNZ_2022_152.csv")
+        path.write_text(
+            f"2022/06/01 23:59:57.4,{channel},,=100/100+0.{index % 10}\n")
+        files.append((channel, path))
+    return files
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_read_latency_files(tmp_path, workers):
+    files = write_latency_files(tmp_path, 20)
+    # Empty, truncated and missing files fail their channel only
+    files[3][1].write_text('')
+    files[5][1].write_text("2022/06/01 23:59:57.4,QW.STA05.00.HNZ\n")
+    files[7][1].unlink()
+
+    results = read_latency_files(files, workers=workers)
+
+    failed = [files[index][0] for index in (3, 5, 7)]
+    assert list(results.latencies) == \
+        [channel for channel, _ in files if channel not in failed]
+    assert all(results.latencies[channel].channel == channel
+               for channel in results.latencies)
+    assert list(results.failed_channels) == failed
+    assert results.unevaluated_channels == []
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_read_latency_files_deadline(tmp_path, workers):
+    files = write_latency_files(tmp_path, 5)
+
+    results = read_latency_files(
+        files, workers=workers, deadline=Deadline(0, reserve=0))
+
+    assert results.latencies == {}
+    assert results.unevaluated_channels == [channel for channel, _ in files]
+
+
+def test_get_channel_latency_failed_channels(tmp_path):
+    latency_folder = tmp_path.joinpath('latency')
+    latency_folder.mkdir()
+    files = write_latency_files(latency_folder, 4)
+    files[1][1].write_text('')
+    channels = [channel for channel, _ in files]
+
+    statistics = get_channel_latency(
+        cache_folder=str(tmp_path),
+        archive_folder=str(tmp_path.joinpath('archive')),
+        time=datetime(2022, 6, 1, 23, 59, 59),
+        expected_channels=channels,
+        workers=2
+    )
+
+    assert [stats.channel for stats in statistics.channel_latency] == \
+        [channels[0]] + channels[2:]
+    assert list(statistics.failed_channels) == [channels[1]]
+
+    # Failed channels count as critical channels by default, as with the
+    # ApolloServer check
+    results = get_latency_threshold_state(
+        statistics, warn_time='20', crit_time='30', warn_threshold='1',
+        crit_threshold='0')
+    assert results.state == NagiosOutputCode.critical
+    assert results.crit_count == 1
+    results = get_latency_threshold_state(
+        statistics, warn_time='20', crit_time='30', warn_threshold='1',
+        crit_threshold='0', failed_state=NagiosOutputCode.ok)
+    assert results.state == NagiosOutputCode.ok
+
+    details = assemble_details(statistics, '20', '30')
+    assert f"Channels with unreadable latency files:\n{channels[1]}: " in \
+        details
+    # The records of 2022 are older than an hour
+    stale = details.split("Stale channels:\n")[1].split("\n\n")[0]
+    assert len(stale.splitlines()) == 3
@@ -0,0 +1,89 @@
+from acquisition_nagios.channel_mask import ChannelSelection
+from acquisition_nagios.deadline import Deadline, DeadlineExceeded
+from acquisition_nagios.guralpdatacenter.guralp_availability import \
+    get_expected_channels
+from acquisition_nagios.guralpdatacenter.inventory import \
+    parse_slinktool_line
+from acquisition_nagios.guralpdatacenter.seedlink import SeedLinkError, \
+    info_record_text, parse_streams, query_seedlink
+from tests.guralpdatacenter.mock_seedlink_server import MockSeedLinkServer, \
+    info_records
+import pytest
+
+
+STREAMS_XML = b'''<?xml version="1.0"?>
+<seedlink software="SeedLink v3.1" organization="Test">
+<station name="BCV01" network="QW" description="Test">
+<stream location="00" seedname="HNZ" type="D"/>
+<stream location="00" seedname="HNN" type="D"/>
+<stream location="00" seedname="LOG" type="L"/>
+</station>
+<station name="BCV02" network="QW" description="Test">
+<stream location="" seedname="HHZ" type="D"/>
+</station>
+</seedlink>'''
+
+
+def test_parse_streams():
+    assert parse_streams(STREAMS_XML) == [
+        'QW.BCV01.00.HNZ', 'QW.BCV01.00.HNN', 'QW.BCV02..HHZ']
+
+    assert parse_streams(STREAMS_XML, ChannelSelection('LOG,QW.*..*')) == [
+        'QW.BCV01.00.LOG', 'QW.BCV02..HHZ']
+
+    with pytest.raises(SeedLinkError):
+        parse_streams(b'<seedlink><station')
+    with pytest.raises(SeedLinkError):
+        parse_streams(b'<seedlink><error message="Access denied"/></seedlink>')
+
+
+@pytest.mark.parametrize('byteorder', ['>', '<'])
+def test_info_record_text(byteorder):
+    text = STREAMS_XML * 2
+    records = info_records(text, byteorder)
+
+    assert len(records) == 2
+    assert all(len(record) == 512 for record in records)
+    assert b''.join(info_record_text(record) for record in records) == text
+
+    with pytest.raises(SeedLinkError):
+        info_record_text(b'\xff' * 512)
+
+
+@pytest.mark.parametrize('byteorder', ['>', '<'])
+def test_query_seedlink(byteorder):
+    # Enough stations for the response to span many packets
+    with MockSeedLinkServer(station_count=50, byteorder=byteorder) as mock:
+        channels = query_seedlink('127.0.0.1', mock.port)
+
+        # Same channels as listed by slinktool
+        expected = [parse_slinktool_line(line)
+                    for line in mock.slinktool_output().splitlines()]
+        assert channels == [channel for channel in expected
+                            if channel is not None]
+        assert len(channels) == 50 * 6
+
+
+def test_query_seedlink_refused():
+    with MockSeedLinkServer(refuse_info=True) as mock:
+        with pytest.raises(SeedLinkError):
+            query_seedlink('127.0.0.1', mock.port)
+
+
+def test_query_seedlink_timeout():
+    with MockSeedLinkServer(response_delay=1) as mock:
+        with pytest.raises(SeedLinkError):
+            query_seedlink('127.0.0.1', mock.port, timeout=0.2)
+
+        with pytest.raises(DeadlineExceeded):
+            query_seedlink(
+                '127.0.0.1', mock.port, deadline=Deadline(0.2, reserve=0))
+
+
+def test_get_expected_channels_seedlink():
+    with MockSeedLinkServer(station_count=2) as mock:
+        assert get_expected_channels(
+            '127.0.0.1', mock.port, source='seedlink') == [
+                f'QW.S{index:04d}.00.{channel}'
+                for index in range(2)
+                for channel in ('HNZ', 'HNN', 'HNE', 'HHZ', 'HHN', 'HHE')]
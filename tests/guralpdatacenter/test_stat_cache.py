@@ -0,0 +1,96 @@
+from acquisition_nagios.guralpdatacenter.guralp_availability import \
+    get_channel_latency, get_latencystatistics_of_last_row
+from acquisition_nagios.guralpdatacenter.stat_cache import FORMAT_VERSION, \
+    LatencyStatCache
+from datetime import datetime
+import struct
+
+
+LINE = "2022/06/01 23:59:57.4,QW.STA00.00.HNZ,,=100/100+0.3\n"
+
+
+def counting_reader(reads):
+    def read(path):
+        reads.append(path)
+        return get_latencystatistics_of_last_row(path)
+    return read
+
+
+def test_stat_cache(tmp_path):
+    csv_file = tmp_path.joinpath('QW_STA00_00_HNZ_2022_152.csv')
+    csv_file.write_text(LINE)
+    cache_file = tmp_path.joinpath('latency.cache')
+    reads = []
+
+    cache = LatencyStatCache(cache_file)
+    first = cache.get(csv_file, counting_reader(reads))
+    cache.save()
+
+    # Unchanged files are answered from the saved cache
+    cache = LatencyStatCache(cache_file)
+    assert len(cache) == 1
+    assert cache.get(csv_file, counting_reader(reads)) == first
+    assert len(reads) == 1
+    assert cache.hits == 1
+
+    # Appended files are read again
+    with open(csv_file, 'a') as f:
+        f.write("2022/06/01 23:59:58.4,QW.STA00.00.HNZ,,=100/100+0.5\n")
+    latency = cache.get(csv_file, counting_reader(reads))
+    assert len(reads) == 2
+    assert latency.latency == 1.5
+    assert latency.timestamp == datetime(2022, 6, 1, 23, 59, 59, 900000)
+
+
+def test_stat_cache_collects_stale_entries(tmp_path):
+    paths = [tmp_path.joinpath(f'QW_STA0{index}_00_HNZ_2022_152.csv')
+             for index in range(2)]
+    for path in paths:
+        path.write_text(LINE)
+    cache_file = tmp_path.joinpath('latency.cache')
+    clock = [0.0]
+
+    cache = LatencyStatCache(cache_file, max_age=60, clock=lambda: clock[0])
+    for path in paths:
+        cache.get(path, get_latencystatistics_of_last_row)
+    cache.save()
+
+    # Only the first file is used by the next run
+    clock[0] = 120
+    cache = LatencyStatCache(cache_file, max_age=60, clock=lambda: clock[0])
+    cache.get(paths[0], get_latencystatistics_of_last_row)
+    cache.save()
+
+    assert len(LatencyStatCache(cache_file)) == 1
+
+
+def test_stat_cache_invalid_file(tmp_path):
+    cache_file = tmp_path.joinpath('latency.cache')
+
+    cache_file.write_bytes(b'garbage')
+    assert len(LatencyStatCache(cache_file)) == 0
+
+    # Caches of another format version are discarded
+    cache_file.write_bytes(
+        struct.pack('<4sHI', b'GLSC', FORMAT_VERSION + 1, 0))
+    assert len(LatencyStatCache(cache_file)) == 0
+
+
+def test_get_channel_latency_stat_cache(tmp_path):
+    latency_folder = tmp_path.joinpath('latency')
+    latency_folder.mkdir()
+    latency_folder.joinpath('QW_STA00_00_HNZ_2022_152.csv').write_text(LINE)
+    cache = LatencyStatCache(tmp_path.joinpath('latency.cache'))
+
+    for _ in range(2):
+        statistics = get_channel_latency(
+            cache_folder=str(tmp_path),
+            archive_folder=str(tmp_path.joinpath('archive')),
+            time=datetime(2022, 6, 1, 23, 59, 59),
+            expected_channels=['QW.STA00.00.HNZ'],
+            stat_cache=cache
+        )
+        assert statistics.channel_latency[0].latency == 1.3
+
+    assert cache.misses == 1
+    assert cache.hits == 1
@@ -0,0 +1,128 @@
+from acquisition_nagios.nagios import range_check
+from acquisition_nagios.nagios.models import NagiosRange
+from acquisition_nagios.nagios.threshold import compile_nagios_range, \
+    compile_range_check
+import math
+import numpy as np
+import pytest
+
+
+NAGIOS_RANGES = [
+    '10', '0', '5.5', '10:', '~:10', '10:20', '-5:5', '@10', '@10:20',
+    '@~:10', '@10:', ' 10:20 ', '20:10',
+]
+
+INVALID_NAGIOS_RANGES = ['~', '1:2:3', 'a', '', '@', 'a:5']
+
+RANGE_CHECK_THRESHOLDS = [
+    10.0, '10', '5.5', '10:', ':10', '10:20', '-5:5', '@10', '@10:',
+    '@:10', '@10:20', ' 10:20 ',
+]
+
+INVALID_RANGE_CHECK_THRESHOLDS = ['1:2:3', 'a', '', '@a', ':', 'a:5']
+
+VALUES = [
+    -math.inf, -10.0, -5.0, -0.5, 0.0, 0.5, 5.0, 5.5, 9.999, 10.0, 10.001,
+    15.0, 20.0, 25.0, math.inf, math.nan,
+]
+
+
+def legacy_in_range(range: str, value: float) -> bool:
+    '''
+    NagiosRange.in_range before thresholds were compiled
+    '''
+    parts = range.strip().split(':')
+    if len(parts) > 2:
+        raise ValueError(f'range format invalid: {range}')
+    reverse = False
+    if parts[0].startswith('@'):
+        reverse = True
+        parts[0] = parts[0][1:]
+    if len(parts) == 1:
+        if parts[0] == '~':
+            raise ValueError(f'range format invalid: {range}')
+        low, high = 0, float(parts[0])
+    elif parts[0] == '~':
+        low, high = -math.inf, float(parts[1])
+    elif len(parts[1]) == 0:
+        low, high = float(parts[0]), math.inf
+    else:
+        low, high = float(parts[0]), float(parts[1])
+    cond = value < low or value > high
+    return not cond if reverse else cond
+
+
+def legacy_range_check(dataval, threshold) -> bool:
+    '''
+    range_check before thresholds were compiled
+    '''
+    reverse_logic = False
+    if isinstance(threshold, str) and threshold.startswith('@'):
+        reverse_logic = True
+        threshold = threshold[1:]
+
+    def _range_check(dataval, threshold):
+        if isinstance(threshold, float):
+            return dataval > float(threshold)
+        try:
+            return dataval > float(threshold)
+        except ValueError:
+            values = threshold.strip().split(':')
+            if len(values) != 2:
+                raise ValueError(f'Invalid threshold {threshold}')
+            if len(values[0]) and not len(values[1]):
+                if dataval > float(values[0]):
+                    return True
+            elif len(values[1]) and not len(values[0]):
+                if dataval < float(values[1]):
+                    return True
+            else:
+                if dataval >= float(values[0]) and \
+                        dataval < float(values[1]):
+                    return True
+        return False
+
+    status = _range_check(dataval, threshold)
+    return not status if reverse_logic else status
+
+
+@pytest.mark.parametrize('range', NAGIOS_RANGES)
+def test_compile_nagios_range(range):
+    compiled = compile_nagios_range(range)
+    expected = [legacy_in_range(range, value) for value in VALUES]
+
+    assert [compiled.check(value) for value in VALUES] == expected
+    assert [NagiosRange(range).in_range(value) for value in VALUES] == \
+        expected
+    assert compiled.check_array(np.array(VALUES)).tolist() == expected
+
+
+@pytest.mark.parametrize('range', INVALID_NAGIOS_RANGES)
+def test_compile_nagios_range_invalid(range):
+    with pytest.raises(ValueError):
+        legacy_in_range(range, 0)
+    with pytest.raises(ValueError):
+        compile_nagios_range(range)
+
+
+@pytest.mark.parametrize('threshold', RANGE_CHECK_THRESHOLDS)
+def test_compile_range_check(threshold):
+    compiled = compile_range_check(threshold)
+    expected = [legacy_range_check(value, threshold) for value in VALUES]
+
+    assert [compiled.check(value) for value in VALUES] == expected
+    assert [range_check(value, threshold) for value in VALUES] == expected
+    assert compiled.check_array(np.array(VALUES)).tolist() == expected
+
+
+@pytest.mark.parametrize('threshold', INVALID_RANGE_CHECK_THRESHOLDS)
+def test_compile_range_check_invalid(threshold):
+    with pytest.raises(ValueError):
+        legacy_range_check(0, threshold)
+    with pytest.raises(ValueError):
+        compile_range_check(threshold)
+
+
+def test_compiled_thresholds_are_cached():
+    assert NagiosRange('10:20').compile() is NagiosRange('10:20').compile()
+    assert compile_range_check('@5') is compile_range_check('@5')
@@ -0,0 +1,111 @@
+from acquisition_nagios.timestamps import APOLLO_FORMAT, GURALP_FORMAT, \
+    apollo_timestamps_to_epoch, datetimes_to_epoch, \
+    guralp_timestamps_to_epoch, parse_apollo_timestamp, \
+    parse_apollo_timestamps, parse_guralp_timestamp, parse_guralp_timestamps
+from datetime import datetime
+import pytest
+
+
+APOLLO_TIMESTAMPS = [
+    "2022-06-20T01:00:00.430000000Z",
+    "2022-06-20T00:00:00.000000000Z",
+    "2022-12-31T23:59:59.999999000Z",
+    "2024-02-29T12:30:45.000001000Z",
+    "1970-01-01T00:00:00.000000000Z",
+    # Layouts only strptime accepts
+    "2022-6-20T01:00:00.430000000Z",
+    "2022-06-20T1:00:00.430000000Z",
+    "2022-06-20T00:00:00.43000000Z",
+]
+
+INVALID_APOLLO_TIMESTAMPS = [
+    "2023-02-29T00:00:00.000000000Z",
+    "2022-13-01T00:00:00.000000000Z",
+    "2022-06-20T24:00:00.000000000Z",
+    "2022-06-20T00:60:00.000000000Z",
+    "2022-06-20T00:00:61.000000000Z",
+    "2022-06-20 00:00:00.000000000Z",
+    "2022-06-20T00:00:00.000000000",
+    "2022-06-20T00:00:0a.000000000Z",
+    "",
+]
+
+GURALP_TIMESTAMPS = [
+    "2022/06/01 23:59:57.4",
+    "2022/06/01 23:59:57.40",
+    "2022/06/01 00:00:00.000001",
+    "2022/06/01 00:00:00.123456",
+    "2024/02/29 12:30:45.5",
+    # Layouts only strptime accepts
+    "2022/6/1 23:59:57.4",
+]
+
+INVALID_GURALP_TIMESTAMPS = [
+    "2022/06/01 23:59:57",
+    "2022/06/01 23:59:57.",
+    "2022/06/01 23:59:57.1234567",
+    "2022/06/31 23:59:57.4",
+    "2022/06/01 24:00:00.0",
+    "2022-06-01 23:59:57.4",
+    "2022/06/01 23:59:57.4\n",
+]
+
+
+@pytest.mark.parametrize('timestamp', APOLLO_TIMESTAMPS)
+def test_parse_apollo_timestamp(timestamp):
+    expected = datetime.strptime(timestamp, APOLLO_FORMAT)
+    assert parse_apollo_timestamp(timestamp) == expected
+    assert apollo_timestamps_to_epoch([timestamp]).tolist() == \
+        [(expected - datetime(1970, 1, 1)).total_seconds()]
+
+
+def test_parse_apollo_timestamp_nanoseconds():
+    assert parse_apollo_timestamp("2022-06-20T01:00:00.123456789Z") == \
+        datetime(2022, 6, 20, 1, 0, 0, 123456)
+
+
+@pytest.mark.parametrize('timestamp', INVALID_APOLLO_TIMESTAMPS)
+def test_parse_apollo_timestamp_invalid(timestamp):
+    with pytest.raises(ValueError):
+        datetime.strptime(timestamp, APOLLO_FORMAT)
+    with pytest.raises(ValueError):
+        parse_apollo_timestamp(timestamp)
+    with pytest.raises(ValueError):
+        apollo_timestamps_to_epoch([APOLLO_TIMESTAMPS[0], timestamp])
+
+
+@pytest.mark.parametrize('timestamp', GURALP_TIMESTAMPS)
+def test_parse_guralp_timestamp(timestamp):
+    expected = datetime.strptime(timestamp, GURALP_FORMAT)
+    assert parse_guralp_timestamp(timestamp) == expected
+    assert guralp_timestamps_to_epoch([timestamp]).tolist() == \
+        [(expected - datetime(1970, 1, 1)).total_seconds()]
+
+
+@pytest.mark.parametrize('timestamp', INVALID_GURALP_TIMESTAMPS)
+def test_parse_guralp_timestamp_invalid(timestamp):
+    with pytest.raises(ValueError):
+        datetime.strptime(timestamp, GURALP_FORMAT)
+    with pytest.raises(ValueError):
+        parse_guralp_timestamp(timestamp)
+    with pytest.raises(ValueError):
+        guralp_timestamps_to_epoch([GURALP_TIMESTAMPS[0], timestamp])
+
+
+def test_timestamps_to_epoch_batch():
+    assert apollo_timestamps_to_epoch(APOLLO_TIMESTAMPS[:3]).tolist() == [
+        1655686800.43, 1655683200.0, 1672531199.999999]
+    assert guralp_timestamps_to_epoch(GURALP_TIMESTAMPS[:2]).tolist() == [
+        1654127997.4, 1654127997.4]
+    assert len(apollo_timestamps_to_epoch([])) == 0
+
+    # Timestamps of every layout are parsed together
+    assert parse_apollo_timestamps(APOLLO_TIMESTAMPS).tolist() == [
+        datetime.strptime(timestamp, APOLLO_FORMAT)
+        for timestamp in APOLLO_TIMESTAMPS]
+    assert parse_guralp_timestamps(GURALP_TIMESTAMPS).tolist() == [
+        datetime.strptime(timestamp, GURALP_FORMAT)
+        for timestamp in GURALP_TIMESTAMPS]
+
+    assert datetimes_to_epoch([datetime(2022, 6, 1, 0, 0, 0, 5)]).tolist() \
+        == [1654041600.000005]